@@ -0,0 +1,42 @@
+"""
+Compares the legacy per-file splitter with token-budget packing on a synthetic PR.
+
+Usage: python benchmarks/bench_chunk_packing.py [--budget TOKENS] [--files N]
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, ROOT)
+
+from diff_extractor import pack_diff_chunks, split_diff_intelligent
+from diff_index import DiffIndex
+from llm_client import build_llm_prompt
+from utils import estimate_tokens
+from benchmarks.synthetic import generate_diff
+
+def summarize(name, chunks, budget):
+    prompts = [estimate_tokens(build_llm_prompt(chunk)) for chunk in chunks]
+    over = sum(1 for tokens in prompts if tokens > budget)
+    fill = sum(prompts) / (len(prompts) * budget) if prompts else 0
+    print(f"{name:<22} {len(chunks):>9} {sum(prompts):>13} {max(prompts or [0]):>11} {over:>12} {fill:>9.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget", type=int, default=2500, help="tokens per LLM request")
+    parser.add_argument("--files", type=int, default=40, help="number of small files")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    index = DiffIndex.parse(generate_diff(files=args.files, seed=args.seed))
+    overhead = estimate_tokens(build_llm_prompt(""))
+
+    print(f"{len(index)} files, budget {args.budget} tokens, prompt overhead {overhead} tokens\n")
+    print(f"{'splitter':<22} {'requests':>9} {'total tokens':>13} {'max tokens':>11} {'over budget':>12} {'fill':>9}")
+    summarize("split_diff_intelligent", split_diff_intelligent(index, max_lines=1000, annotate=True), args.budget)
+    summarize("pack_diff_chunks", pack_diff_chunks(index, args.budget, overhead), args.budget)
+
+if __name__ == "__main__":
+    main()
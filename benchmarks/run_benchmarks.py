@@ -0,0 +1,187 @@
+"""
+Benchmarks the diff pipeline functions on synthetic and recorded large PRs.
+
+Reports time, throughput and peak memory per function and scenario, and can save
+the results as a baseline or compare against one to catch regressions. Timings
+are compared relative to a calibration loop run on each machine, so a baseline
+recorded elsewhere does not report a slower machine as a regression.
+
+Usage:
+  python benchmarks/run_benchmarks.py                      # run and print
+  python benchmarks/run_benchmarks.py --write-baseline     # refresh benchmarks/baseline.json
+  python benchmarks/run_benchmarks.py --compare            # fail on regressions vs the baseline
+  python benchmarks/run_benchmarks.py --recorded DIR       # also run on DIR/*.diff, DIR/*.patch
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, ROOT)
+
+from diff_extractor import filter_diff, preprocess_diff_with_line_numbers, split_diff_intelligent, pack_diff_chunks, iter_packed_chunks
+from diff_index import DiffIndex, iter_file_diffs, iter_indexed
+from comment_publisher_github import compute_diff_position
+from llm_client import extract_json_from_text
+from benchmarks.synthetic import generate_diff, generate_lockfile_diff, generate_llm_outputs
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def measure(func, repeat):
+    """
+    Returns (best seconds per run, peak traced bytes) of func() over `repeat` runs.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+def calibrate(repeat):
+    """
+    Returns the best time of a fixed workload that does not depend on the code under
+    test (splitting, slicing and counting lines), used as this machine's time unit.
+    """
+    text = "".join(f"+    value_{i} = compute(item_{i % 97}, {i})\n" for i in range(20000))
+
+    def workload():
+        counts = {}
+        for line in text.split("\n"):
+            key = line[1:12].strip()
+            counts[key] = counts.get(key, 0) + len(line)
+        return counts
+
+    seconds, _ = measure(workload, max(repeat, 5))
+    return seconds
+
+def comment_targets(index, count):
+    targets = []
+    for file_diff in index:
+        for line in file_diff.new_lines[:3]:
+            targets.append((file_diff.path, line))
+    return (targets * (count // max(len(targets), 1) + 1))[:count]
+
+def diff_cases(name, diff, comments=200, text_comments=10):
+    index = DiffIndex.parse(diff)
+    targets = comment_targets(index, comments)
+    # Resolving from raw text rescans the whole diff per comment; keep that case small
+    text_targets = targets[:text_comments]
+
+    def positions_from_text():
+        for path, line in text_targets:
+            compute_diff_position(diff, path, line)
+
+    def positions_from_index():
+        shared = DiffIndex.parse(diff)
+        for path, line in targets:
+            compute_diff_position(shared, path, line)
+
+    def stream_pipeline():
+        # What run_review does: parse, index and pack file by file, releasing lines
+        streamed = DiffIndex()
+        file_diffs = iter_indexed(iter_file_diffs(line.rstrip("\n") for line in io.StringIO(diff)), streamed, release=True)
+        for _ in iter_packed_chunks(file_diffs, 2500, 150):
+            pass
+
+    return [
+        (f"{name}/DiffIndex.parse", len(diff), lambda: DiffIndex.parse(diff)),
+        (f"{name}/preprocess_diff_with_line_numbers", len(diff), lambda: preprocess_diff_with_line_numbers(diff)),
+        (f"{name}/filter_diff", len(diff), lambda: filter_diff(diff, ["test", "spec"])),
+        (f"{name}/split_diff_intelligent", len(diff), lambda: split_diff_intelligent(diff)),
+        (f"{name}/pack_diff_chunks", len(diff), lambda: pack_diff_chunks(index, 2500, 150)),
+        (f"{name}/stream_pipeline", len(diff), stream_pipeline),
+        (f"{name}/compute_diff_position[{len(text_targets)} text]", len(diff) * len(text_targets), positions_from_text),
+        (f"{name}/compute_diff_position[{len(targets)} index]", len(diff), positions_from_index),
+    ]
+
+def build_cases(recorded_dir=None):
+    cases = []
+    cases += diff_cases("synthetic_200_files", generate_diff(files=200, hunks=4, lines_per_hunk=30, large_files=5))
+    cases += diff_cases("lockfile_50k", generate_lockfile_diff(50000), comments=20, text_comments=3)
+    for name, text in generate_llm_outputs().items():
+        cases.append((f"llm_output_{name}/extract_json_from_text", len(text),
+                      lambda text=text: extract_json_from_text(text)))
+    if recorded_dir:
+        paths = sorted(glob.glob(os.path.join(recorded_dir, "*.diff")) + glob.glob(os.path.join(recorded_dir, "*.patch")))
+        for path in paths:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                cases += diff_cases("recorded_" + os.path.splitext(os.path.basename(path))[0], f.read())
+    return cases
+
+def run(cases, repeat):
+    results = {}
+    print(f"{'benchmark':<70} {'ms':>10} {'MB/s':>10} {'peak KiB':>10}")
+    for name, size, func in cases:
+        seconds, peak = measure(func, repeat)
+        throughput = size / seconds / 1e6 if seconds > 0 else float("inf")
+        results[name] = {"seconds": round(seconds, 6), "mb_per_s": round(throughput, 2), "peak_bytes": peak}
+        print(f"{name:<70} {seconds * 1000:>10.2f} {throughput:>10.1f} {peak / 1024:>10.0f}")
+    return results
+
+def compare(results, baseline, tolerance, scale=1.0):
+    """
+    Returns the list of regressions: slower or bigger than baseline by more than `tolerance`.
+
+    Baseline timings are multiplied by `scale`, the ratio of this machine's calibration
+    time to the baseline's, before comparing; memory peaks are compared as they are.
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        expected = reference["seconds"] * scale
+        if current["seconds"] > expected * (1 + tolerance):
+            regressions.append(f"{name}: {expected*1000:.2f}ms (scaled) -> {current['seconds']*1000:.2f}ms")
+        if current["peak_bytes"] > reference["peak_bytes"] * (1 + tolerance):
+            regressions.append(f"{name}: peak {reference['peak_bytes']} -> {current['peak_bytes']} bytes")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark (best time is kept)")
+    parser.add_argument("--recorded", help="directory of recorded PR diffs (*.diff, *.patch)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--write-baseline", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="exit 1 if a benchmark regressed vs the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown (0.5 = +50%%)")
+    args = parser.parse_args()
+
+    calibration = calibrate(args.repeat)
+    print(f"calibration: {calibration * 1000:.2f} ms\n")
+    results = run(build_cases(args.recorded), args.repeat)
+
+    if args.write_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            baseline = {"python": sys.version.split()[0], "calibration_seconds": round(calibration, 6), "results": results}
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        # A baseline written before calibration existed is compared as recorded
+        scale = calibration / baseline.get("calibration_seconds", calibration)
+        print(f"\nBaseline timings scaled by {scale:.2f} for this machine.")
+        regressions = compare(results, baseline["results"], args.tolerance, scale)
+        if regressions:
+            print("\nRegressions:")
+            print("\n".join("  " + r for r in regressions))
+            sys.exit(1)
+        print("\nNo regression against the baseline.")
+
+if __name__ == "__main__":
+    main()
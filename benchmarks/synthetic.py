@@ -0,0 +1,87 @@
+"""
+Synthetic unified diffs for benchmarks.
+"""
+import random
+
+def generate_file_diff(path, hunks=3, lines_per_hunk=20, rng=None, line_width=60):
+    """
+    Returns the diff block of one file with `hunks` hunks of roughly `lines_per_hunk`
+    lines each (a mix of context, added and removed lines).
+    """
+    rng = rng or random.Random(0)
+    lines = [
+        f"diff --git a/{path} b/{path}",
+        "index 1234567..89abcde 100644",
+        f"--- a/{path}",
+        f"+++ b/{path}",
+    ]
+    old_line = new_line = 1
+    for _ in range(hunks):
+        gap = rng.randint(5, 40)
+        old_line += gap
+        new_line += gap
+        body = []
+        old_count = new_count = 0
+        for _ in range(lines_per_hunk):
+            kind = rng.choice("  +-+")
+            text = "".join(rng.choice("abcdefghij (),.=_") for _ in range(rng.randint(0, line_width)))
+            body.append(kind + text)
+            if kind in " -":
+                old_count += 1
+            if kind in " +":
+                new_count += 1
+        lines.append(f"@@ -{old_line},{old_count} +{new_line},{new_count} @@")
+        lines.extend(body)
+        old_line += old_count
+        new_line += new_count
+    return "\n".join(lines)
+
+def generate_diff(files=40, hunks=3, lines_per_hunk=20, large_files=2, large_hunks=60, seed=0):
+    """
+    Returns a synthetic PR diff: `files` small files plus `large_files` files with
+    `large_hunks` hunks each, deterministic for a given seed.
+    """
+    rng = random.Random(seed)
+    blocks = []
+    for i in range(files):
+        blocks.append(generate_file_diff(f"src/module_{i}.py", rng.randint(1, hunks),
+                                         rng.randint(3, lines_per_hunk), rng))
+    for i in range(large_files):
+        blocks.append(generate_file_diff(f"src/large_{i}.py", large_hunks, lines_per_hunk, rng))
+    return "\n".join(blocks) + "\n"
+
+def generate_lockfile_diff(lines=50000, path="package-lock.json"):
+    """
+    Returns the diff of a generated lockfile rewritten in one huge hunk, the
+    typical worst case of dependency bumps.
+    """
+    body = []
+    for i in range(lines // 2):
+        body.append(f'-    "node_modules/pkg-{i}": {{"version": "1.0.{i}", "integrity": "sha512-{i:064d}"}},')
+        body.append(f'+    "node_modules/pkg-{i}": {{"version": "1.1.{i}", "integrity": "sha512-{i + 1:064d}"}},')
+    header = [
+        f"diff --git a/{path} b/{path}",
+        "index 1234567..89abcde 100644",
+        f"--- a/{path}",
+        f"+++ b/{path}",
+        f"@@ -1,{lines // 2} +1,{lines // 2} @@",
+    ]
+    return "\n".join(header + body) + "\n"
+
+def generate_llm_outputs(comments=50, noise=20000):
+    """
+    Returns named LLM outputs that stress JSON extraction: clean JSON, JSON buried in
+    prose full of braces, truncated output, and brace soup without any valid JSON.
+    """
+    items = ",\n".join(
+        '    {"file": "src/module_%d.py", "line": "%d", "comment": "Avoid {braces} and \\"quotes\\" here."}' % (i, i)
+        for i in range(comments)
+    )
+    clean = '{\n  "comments": [\n' + items + '\n  ]\n}'
+    prose = "Some {notes} about {the} code. " * (noise // 30)
+    return {
+        "clean": clean,
+        "prose_wrapped": prose + clean + " Also {see} this } and that {.",
+        "truncated": clean[: len(clean) * 2 // 3],
+        "brace_soup": "{ " * (noise // 2),
+    }
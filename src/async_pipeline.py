@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import pr_context
+
+# End-of-stream marker passed through the queues
+_DONE = object()
+
+def run_pipeline(chunks, review, workers, queue_size=0, on_comments=None, prefetch=None):
+    """
+    Reviews `chunks` on an asyncio event loop, as three overlapping stages joined by
+    bounded queues:
+
+      - a producer thread pulls chunks from `chunks` (any iterable, typically the
+        generator still streaming the diff) into a queue of `queue_size` chunks;
+      - `workers` LLM workers call `review(chunk, index)` and queue the comments;
+      - a consumer hands every non-empty list of comments to `on_comments(comments)`
+        (e.g. to resolve them and load the code quoted around them) as they arrive.
+
+    A full queue blocks the stage feeding it, so the diff is read no faster than the
+    LLM answers and at most about `queue_size + workers` chunks are held at once
+    (`queue_size` defaults to `workers`). Blocking calls run in a thread pool and see
+    the pull request of the calling thread (see pr_context).
+
+    `prefetch`, if given, is a blocking call run alongside the whole pipeline (e.g.
+    fetching the comments already posted); its result, or None if it fails, is returned.
+
+    Returns (one list of comments per chunk in the order of `chunks`, prefetch result).
+    A chunk whose review fails yields an empty list; an error raised by `chunks` is
+    re-raised once the chunks already queued are reviewed.
+    """
+    workers = max(1, int(workers))
+    if not queue_size or queue_size <= 0:
+        queue_size = workers
+    # The LLM workers, plus the producer, the consumer and the prefetch
+    executor = ThreadPoolExecutor(max_workers=workers + 3)
+    try:
+        return asyncio.run(_run(chunks, review, workers, queue_size, on_comments, prefetch, executor))
+    finally:
+        executor.shutdown(wait=True)
+
+async def _run(chunks, review, workers, queue_size, on_comments, prefetch, executor):
+    loop = asyncio.get_event_loop()
+    chunk_queue = asyncio.Queue(maxsize=queue_size)
+    comment_queue = asyncio.Queue(maxsize=queue_size)
+    results = {}
+
+    def call(fn, *args):
+        return loop.run_in_executor(executor, pr_context.bind(fn), *args)
+
+    def put(item):
+        # From the producer thread: wait until the queue has room
+        asyncio.run_coroutine_threadsafe(chunk_queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for item in enumerate(chunks):
+                put(item)
+        finally:
+            for _ in range(workers):
+                put(_DONE)
+
+    async def review_worker():
+        while True:
+            item = await chunk_queue.get()
+            if item is _DONE:
+                return
+            i, chunk = item
+            try:
+                comments = await call(review, chunk, i)
+            except Exception as e:
+                logging.error("Unexpected error while reviewing chunk %d: %s", i+1, e)
+                comments = []
+            await comment_queue.put((i, comments))
+
+    async def consume():
+        while True:
+            item = await comment_queue.get()
+            if item is _DONE:
+                return
+            i, comments = item
+            results[i] = comments
+            if on_comments is not None and comments:
+                try:
+                    await call(on_comments, comments)
+                except Exception as e:
+                    logging.warning("Could not prepare the comments of chunk %d: %s", i+1, e)
+
+    background = call(prefetch) if prefetch is not None else None
+    consumer = asyncio.ensure_future(consume())
+    producer = call(produce)
+    await asyncio.gather(*(review_worker() for _ in range(workers)))
+    await comment_queue.put(_DONE)
+    await consumer
+
+    prefetched = None
+    if background is not None:
+        try:
+            prefetched = await background
+        except Exception as e:
+            logging.warning("Background request failed: %s", e)
+    # Raises the error that stopped the chunk stream, if any
+    await producer
+    return [results[i] for i in sorted(results)], prefetched
@@ -0,0 +1,322 @@
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+import requests
+from config import load_config
+from daemon import ReviewDaemon, ReviewJob, review_pull_request
+from http_client import get_http_client
+from llm_pool import get_endpoint_pool, llm_concurrency
+
+# owner/repo#12, owner/repo/pull/12 or a pull request URL
+PR_SPEC_PATTERN = re.compile(r"^(?:https?://[^/]+/)?(?:repos/)?([\w.-]+/[\w.-]+?)(?:#|/pulls?/)(\d+)/?$")
+# GitHub search returns at most 1000 results per query
+MAX_SEARCH_RESULTS = 1000
+
+def parse_pr_spec(spec):
+    """
+    Returns the (repo, number) of a pull request given as "owner/repo#12",
+    "owner/repo/pull/12" or its URL. Raises ValueError otherwise.
+    """
+    match = PR_SPEC_PATTERN.match(spec.strip())
+    if not match:
+        raise ValueError(f"Not a pull request: {spec!r} (expected owner/repo#number or a pull request URL)")
+    return match.group(1), int(match.group(2))
+
+def read_pr_list(path):
+    """
+    Reads one pull request spec per line (see parse_pr_spec); blank lines and
+    lines starting with "#" are ignored.
+    """
+    specs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                specs.append(parse_pr_spec(line))
+    return specs
+
+def _github_headers(config):
+    return {
+        "Authorization": f"Bearer {config.GITHUB_TOKEN}",
+        "Accept":        "application/vnd.github.v3+json"
+    }
+
+def _paginate(url, headers, params, limit):
+    items = []
+    while url and len(items) < limit:
+        resp = get_http_client().get(url, headers=headers, params=params)
+        resp.raise_for_status()
+        data = resp.json()
+        items.extend(data.get("items", []) if isinstance(data, dict) else data)
+        url = resp.links.get("next", {}).get("url")
+        params = None
+    return items[:limit]
+
+def job_from_pull(pr, repo=None):
+    """
+    Returns the ReviewJob of a pull request as listed by the GitHub API, or None
+    when it does not call for a review (closed or draft).
+    """
+    if pr.get("draft") or pr.get("state", "open") != "open":
+        return None
+    return ReviewJob(
+        repo or pr["base"]["repo"]["full_name"], pr["number"],
+        head_sha=pr["head"]["sha"], base_sha=pr["base"]["sha"], head_ref=pr["head"].get("ref"),
+    )
+
+def search_pull_requests(config, query, limit=MAX_SEARCH_RESULTS):
+    """
+    Returns the (repo, number) of the open pull requests matching a GitHub search
+    `query` (e.g. "org:acme label:backend"), drafts excluded.
+    """
+    terms = query.split()
+    terms += [term for term in ("is:pr", "is:open", "draft:false") if term not in terms]
+    items = _paginate(f"{config.GITHUB_API_URL}/search/issues", _github_headers(config),
+                      {"q": " ".join(terms), "per_page": 100}, min(limit, MAX_SEARCH_RESULTS))
+    return [(item["repository_url"].split("/repos/", 1)[1], item["number"]) for item in items]
+
+def list_pull_requests(config, repo, limit=MAX_SEARCH_RESULTS):
+    """
+    Returns a ReviewJob for every open, non-draft pull request of `repo`.
+    """
+    pulls = _paginate(f"{config.GITHUB_API_URL}/repos/{repo}/pulls", _github_headers(config),
+                      {"state": "open", "per_page": 100}, limit)
+    return [job for job in (job_from_pull(pr, repo) for pr in pulls) if job is not None]
+
+def fetch_job(config, repo, number):
+    """
+    Looks up the head and base commits of a pull request. Returns (job, None), or
+    (None, reason) when it is closed, a draft or cannot be read.
+    """
+    url = f"{config.GITHUB_API_URL}/repos/{repo}/pulls/{number}"
+    try:
+        resp = get_http_client().get(url, headers=_github_headers(config))
+        resp.raise_for_status()
+        pr = resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return None, f"cannot read the pull request: {e}"
+    job = job_from_pull(pr, repo)
+    if job is None:
+        return None, "draft" if pr.get("draft") else pr.get("state", "closed")
+    return job, None
+
+class GitHubRateBudget:
+    """
+    Holds back new reviews while fewer than `reserve` GitHub API requests are left
+    in the current rate-limit window, until the window resets. Checking costs no
+    request (GET /rate_limit is not counted).
+    """
+
+    def __init__(self, config, reserve=500, clock=time.time, sleep=time.sleep):
+        self.config = config
+        self.reserve = reserve
+        self.clock = clock
+        self.sleep = sleep
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _core(self):
+        try:
+            resp = get_http_client().get(f"{self.config.GITHUB_API_URL}/rate_limit",
+                                         headers=_github_headers(self.config))
+            resp.raise_for_status()
+            core = resp.json()["resources"]["core"]
+            return int(core["remaining"]), float(core["reset"])
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            logging.debug("GitHub rate limit unavailable: %s", e)
+            return None, None
+
+    def wait(self):
+        if self.reserve <= 0:
+            return
+        # One check at a time: the other workers wait for the window too
+        with self._lock:
+            remaining, reset = self._core()
+            if remaining is None or remaining >= self.reserve:
+                return
+            delay = max(0.0, reset - self.clock()) + 1
+            logging.warning("%d GitHub API request(s) left; waiting %.0fs for the rate limit to reset.",
+                            remaining, delay)
+            self.sleep(delay)
+            self.waited += delay
+
+class BatchReview:
+    """
+    Reviews many pull requests with one process: `concurrency` of them at once
+    (at most `max_per_repo` per repository, repositories served round-robin, see
+    daemon.FairQueue), sharing the HTTP connection pools, LLM endpoint pool and
+    review cache of the process.
+
+    New reviews stop once `token_budget` estimated LLM tokens are spent (0: no
+    limit) and wait for the GitHub rate limit when `rate_budget` (GitHubRateBudget)
+    says so. Every pull request gets a record in the report, reviewed or not.
+    """
+
+    def __init__(self, config, concurrency=4, max_per_repo=2, token_budget=0, rate_budget=None,
+                 review=review_pull_request):
+        self.config = config
+        self.concurrency = max(1, concurrency)
+        self.max_per_repo = max_per_repo
+        self.token_budget = token_budget
+        self.rate_budget = rate_budget
+        self.review = review
+        self.tokens = 0
+        self._records = {}
+        self._cond = threading.Condition()
+
+    def run(self, jobs):
+        """
+        Reviews `jobs` (ReviewJob; those without a head SHA are looked up first) and
+        returns the consolidated report (see report()).
+        """
+        jobs = list({job.key: job for job in jobs}.values())
+        start = time.monotonic()
+        daemon = ReviewDaemon(self.config, workers=self.concurrency, max_per_repo=self.max_per_repo,
+                              review=self._review)
+        daemon.start()
+        try:
+            for job in jobs:
+                daemon.submit(job)
+            with self._cond:
+                while len(self._records) < len(jobs):
+                    self._cond.wait()
+        finally:
+            daemon.stop()
+        return self.report([self._records[job.key] for job in jobs], time.monotonic() - start)
+
+    def _budget_left(self):
+        with self._cond:
+            return not self.token_budget or self.tokens < self.token_budget
+
+    def _review(self, job, config):
+        record = {"repo": job.repo, "pr_number": job.pr_number, "head_sha": job.head_sha}
+        start = time.monotonic()
+        try:
+            if job.head_sha is None:
+                job, reason = fetch_job(config, job.repo, job.pr_number)
+                if job is None:
+                    record.update(status="skipped", reason=reason)
+                    return
+                record["head_sha"] = job.head_sha
+            if not self._budget_left():
+                record.update(status="skipped", reason="token budget spent")
+                return
+            if self.rate_budget is not None:
+                self.rate_budget.wait()
+            report = self.review(job, config).report()
+            counters = report["counters"]
+            tokens = counters.get("estimated_tokens", 0)
+            with self._cond:
+                self.tokens += tokens
+            publish = report["stages"].get("publish")
+            record.update(
+                status="reviewed", comments=publish["comments"] if publish else 0,
+                files=counters.get("reviewed_files", 0), llm_calls=report["llm"]["calls"],
+                llm_errors=report["llm"]["errors"], estimated_tokens=tokens,
+            )
+            if not counters.get("diff_bytes"):
+                record.update(status="failed", reason="no diff retrieved")
+            elif publish is not None and not publish.get("ok"):
+                record.update(status="failed", reason="publishing failed")
+        except Exception as e:
+            logging.exception("Review of %s failed.", job)
+            record.update(status="failed", reason=str(e))
+        finally:
+            record["seconds"] = round(time.monotonic() - start, 2)
+            with self._cond:
+                self._records[(record["repo"], record["pr_number"])] = record
+                self._cond.notify_all()
+
+    def report(self, records, wall_seconds):
+        """
+        Returns the consolidated report: totals over the batch and one record per
+        pull request ({"repo", "pr_number", "status", "reason", "comments", ...}).
+        """
+        def total(key):
+            return sum(r.get(key, 0) for r in records)
+
+        statuses = [r["status"] for r in records]
+        return {
+            "pull_requests": len(records),
+            "reviewed": statuses.count("reviewed"),
+            "failed": statuses.count("failed"),
+            "skipped": statuses.count("skipped"),
+            "comments": total("comments"),
+            "llm_calls": total("llm_calls"),
+            "llm_errors": total("llm_errors"),
+            "estimated_tokens": total("estimated_tokens"),
+            "rate_limit_wait_seconds": round(self.rate_budget.waited, 1) if self.rate_budget else 0,
+            "wall_seconds": round(wall_seconds, 2),
+            "results": records,
+        }
+
+def collect_jobs(config, specs=(), list_file=None, query=None, repos=(), limit=None):
+    """
+    Gathers the pull requests to review from explicit specs, a list file, a GitHub
+    search query and the open pull requests of whole repositories.
+    """
+    jobs = [ReviewJob(repo, number) for repo, number in (parse_pr_spec(spec) for spec in specs)]
+    if list_file:
+        jobs += [ReviewJob(repo, number) for repo, number in read_pr_list(list_file)]
+    if query:
+        jobs += [ReviewJob(repo, number) for repo, number in search_pull_requests(config, query)]
+    for repo in repos:
+        jobs += list_pull_requests(config, repo)
+    return jobs[:limit] if limit else jobs
+
+def main(argv=None):
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Reviews a batch of pull requests (backfills, org-wide sweeps).")
+    parser.add_argument("prs", nargs="*", help="Pull requests: owner/repo#12 or their URL")
+    parser.add_argument("--file", help="File listing one pull request per line")
+    parser.add_argument("--query", help="GitHub search query, e.g. 'org:acme label:backend'")
+    parser.add_argument("--repo", action="append", default=[], help="Review every open pull request of a repository")
+    parser.add_argument("--limit", type=int, default=0, help="Review at most this many pull requests")
+    parser.add_argument("--concurrency", type=int, default=config.BATCH_CONCURRENCY,
+                        help="Pull requests reviewed at once")
+    parser.add_argument("--max-per-repo", type=int, default=config.BATCH_MAX_PER_REPO)
+    parser.add_argument("--llm-concurrency", type=int, default=config.BATCH_LLM_CONCURRENCY,
+                        help="LLM requests in flight over the whole batch (default: LLM_MAX_CONCURRENCY per endpoint)")
+    parser.add_argument("--token-budget", type=int, default=config.BATCH_TOKEN_BUDGET,
+                        help="Stop starting reviews once this many estimated LLM tokens are spent (0: no limit)")
+    parser.add_argument("--github-reserve", type=int, default=config.BATCH_GITHUB_RESERVE,
+                        help="Wait for the rate limit to reset when fewer GitHub API requests are left")
+    parser.add_argument("--full", action="store_true", help="Review whole pull requests, even if already reviewed")
+    parser.add_argument("--dry-run", metavar="DIR", default=config.REVIEW_OUTPUT_DIR,
+                        help="Write the reviews to DIR instead of posting them")
+    parser.add_argument("--report", default="batch-report.json", help="Consolidated JSON report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+
+    class BatchConfig(config):
+        REVIEW_OUTPUT_DIR = args.dry_run or ""
+        INCREMENTAL_REVIEW = config.INCREMENTAL_REVIEW and not args.full
+
+    try:
+        jobs = collect_jobs(BatchConfig, args.prs, args.file, args.query, args.repo, args.limit)
+    except (OSError, ValueError, requests.exceptions.RequestException) as e:
+        parser.error(str(e))
+    if not jobs:
+        parser.error("No pull request to review.")
+
+    get_endpoint_pool(BatchConfig).limit(args.llm_concurrency or llm_concurrency(BatchConfig))
+    batch = BatchReview(
+        BatchConfig, concurrency=args.concurrency, max_per_repo=args.max_per_repo,
+        token_budget=args.token_budget, rate_budget=GitHubRateBudget(BatchConfig, args.github_reserve),
+    )
+    logging.info("Reviewing %d pull request(s), %d at a time%s.", len(jobs), batch.concurrency,
+                 f" (dry run into {args.dry_run})" if args.dry_run else "")
+    report = batch.run(jobs)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logging.info("%d reviewed, %d failed, %d skipped; %d comment(s), ~%d token(s) in %.0fs. Report: %s",
+                 report["reviewed"], report["failed"], report["skipped"], report["comments"],
+                 report["estimated_tokens"], report["wall_seconds"], args.report)
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
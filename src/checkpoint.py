@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+class ReviewCheckpoint:
+    """
+    Local record of the chunks already reviewed for one head commit of a pull request,
+    so that a cancelled, timed-out or failed run can be resumed without asking the LLM
+    again.
+
+    The state file is JSON lines: a header naming the head SHA, then one line per
+    completed chunk with its parsed comments, appended and flushed as each chunk
+    finishes. A file written for another head SHA is ignored and replaced; a line cut
+    short by a crash is skipped.
+    """
+
+    def __init__(self, path, head_sha):
+        self.path = path
+        self.head_sha = head_sha
+        self.restored = 0
+        self._done = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._load()
+
+    @classmethod
+    def for_pull_request(cls, directory, repo, pr_number, head_sha):
+        """
+        Returns the checkpoint of `repo`#`pr_number` at `head_sha` under `directory`,
+        or None when any of them is missing.
+        """
+        if not directory or not repo or not pr_number or not head_sha:
+            return None
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{repo}-{pr_number}") + ".jsonl"
+        return cls(os.path.join(os.path.expanduser(directory), name), head_sha)
+
+    @staticmethod
+    def key(chunk):
+        return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        try:
+            header = json.loads(lines[0]) if lines else {}
+        except ValueError:
+            header = {}
+        if header.get("head_sha") != self.head_sha:
+            logging.info("Ignoring checkpoint %s written for another commit.", self.path)
+            return
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+                self._done[entry["key"]] = entry["comments"]
+            except (ValueError, KeyError, TypeError):
+                continue
+        if self._done:
+            logging.info("Resuming review of %s: %d chunk(s) already done.", self.head_sha[:12], len(self._done))
+
+    def __len__(self):
+        return len(self._done)
+
+    def __contains__(self, chunk):
+        return self.key(chunk) in self._done
+
+    def get(self, chunk):
+        """
+        Returns the comments recorded for `chunk`, or None if it was not reviewed yet.
+        """
+        comments = self._done.get(self.key(chunk))
+        if comments is not None:
+            with self._lock:
+                self.restored += 1
+        return comments
+
+    def put(self, chunk, comments):
+        """
+        Records the comments of a completed chunk, flushed to disk at once.
+        Failures are logged, never raised.
+        """
+        key = self.key(chunk)
+        line = json.dumps({"key": key, "comments": comments})
+        with self._lock:
+            self._done[key] = comments
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    # Start over: entries of other commits must not be mixed in
+                    self._file = open(self.path, "w", encoding="utf-8")
+                    self._file.write(json.dumps({"head_sha": self.head_sha}) + "\n")
+                    for done_key, done_comments in self._done.items():
+                        if done_key != key:
+                            self._file.write(json.dumps({"key": done_key, "comments": done_comments}) + "\n")
+                self._file.write(line + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except (OSError, TypeError, ValueError) as e:
+                logging.warning("Unable to write checkpoint %s: %s", self.path, e)
+
+    def clear(self):
+        """
+        Deletes the state file, once the review has been published.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._done = {}
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
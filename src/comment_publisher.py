@@ -1,16 +1,42 @@
 import logging
 from config import load_config
-from comment_publisher_github import publish_review_with_suggestions
+from comment_publisher_github import publish_review_with_suggestions, get_last_reviewed_sha, get_existing_review_comments
 
-def post_comments(comments):
+def post_comments(comments, config=None, **kwargs):
     """
     Publish a single GitHub Pull Request Review containing all suggestions as inline comments.
-    Returns True if the API call succeeded.
+    Extra keyword arguments (e.g. diff_index) are forwarded to the platform publisher.
+    `config` defaults to load_config(). Returns True if the API call succeeded.
     """
-    config = load_config()
+    config = config or load_config()
 
     if config.CI_PLATFORM != "github":
         logging.error("CI platform '%s' not supported for comment publishing.", config.CI_PLATFORM)
         return False
 
-    return publish_review_with_suggestions(comments, config)
+    return publish_review_with_suggestions(comments, config, **kwargs)
+
+
+def last_reviewed_sha(config=None):
+    """
+    Returns the head SHA recorded by the previous review of this pull request, or None.
+    """
+    config = config or load_config()
+
+    if config.CI_PLATFORM != "github":
+        return None
+
+    return get_last_reviewed_sha(config)
+
+
+def existing_comments(config=None):
+    """
+    Returns the (path, body) pairs of the inline comments already on this pull request,
+    or None when they are unavailable.
+    """
+    config = config or load_config()
+
+    if config.CI_PLATFORM != "github":
+        return None
+
+    return get_existing_review_comments(config)
@@ -1,9 +1,16 @@
+import json
 import os
 import requests
 import logging
 import re
+import time
+import uuid
+from diff_index import DiffIndex, placement_key
+from http_client import get_http_client
+from file_cache import get_file_cache
+import pr_context
 
-def get_code_context(file_path, line_number, context_lines=3, ref=None):
+def get_code_context(file_path, line_number, context_lines=3, ref=None, cache=None):
     """
     Retrieves a code snippet from a given file around a specific line.
     
@@ -12,165 +19,456 @@ def get_code_context(file_path, line_number, context_lines=3, ref=None):
       line_number (int): Target line number (1-indexed)
       context_lines (int): Number of lines before and after to include
       ref (str, optional): Branch name or commit SHA; defaults to environment variables
+      cache (FileContentCache, optional): Cache to read the file from; defaults to the
+        run-wide cache, so each file is downloaded or read only once
     Returns:
       str: Code snippet including the target line and context
     Raises:
       Exception: If file retrieval fails
     """
-    repo = os.getenv("REPOSITORY_GITHUB")
-    token = os.getenv("GITHUB_TOKEN")
-    if not repo or not token:
-        raise ValueError("Environment variables REPOSITORY_GITHUB and GITHUB_TOKEN must be set.")
-    
     # Use provided ref or default environment variables
     if not ref:
-        ref = os.getenv("GITHUB_HEAD_REF") or os.getenv("GITHUB_REF")
+        ref = pr_context.getenv("HEAD_SHA") or pr_context.getenv("GITHUB_HEAD_REF") or pr_context.getenv("GITHUB_REF")
     
-    url = f"https://api.github.com/repos/{repo}/contents/{file_path}"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github.v3.raw"
-    }
-    params = {}
-    if ref:
-        params["ref"] = ref
-
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code != 200:
-        raise Exception(f"Error retrieving file {file_path}: {response.status_code} - {response.text}")
-    
-    content = response.text
-    lines = content.splitlines()
+    lines = (cache or get_file_cache()).get_lines(file_path, ref)
     index = line_number - 1  # Convert to 0-indexed
     start = max(0, index - context_lines)
     end = min(len(lines), index + context_lines + 1)
-    snippet = "\n".join(lines[start:end])
+    snippet = "\n".join(lines.slice(start, end))
     return snippet
 
-def publish_review_with_suggestions(comments, config):
+REVIEWED_SHA_MARKER = "<!-- flair:reviewed-sha={sha} -->"
+REVIEWED_SHA_PATTERN = re.compile(r'<!-- flair:reviewed-sha=([0-9a-fA-F]{7,40}) -->')
+# Hidden marker of each part of a review, to tell whether a part whose POST failed was created anyway
+REVIEW_PART_MARKER = "<!-- flair:review-part={run}/{number} -->"
+REVIEW_PART_PATTERN = re.compile(r'<!-- flair:review-part=[0-9a-f]+/\d+ -->')
+
+def get_last_reviewed_sha(config, repo=None, pr_number=None):
     """
-    Crée une seule Pull Request Review avec un résumé en body
-    et des inline comments pour chaque suggestion dont on trouve
-    la position dans le diff.
+    Returns the head SHA recorded in the most recent review posted by this action
+    on the pull request (see REVIEWED_SHA_MARKER), or None if there is none.
     """
-    repo      = os.getenv("REPOSITORY_GITHUB")
-    pr_number = os.getenv("PR_NUMBER_GITHUB")
+    repo      = repo or pr_context.getenv("REPOSITORY_GITHUB")
+    pr_number = pr_number or pr_context.getenv("PR_NUMBER_GITHUB")
     token     = config.GITHUB_TOKEN
+    if not repo or not pr_number or not token:
+        logging.error("REPOSITORY_GITHUB, PR_NUMBER_GITHUB and GITHUB_TOKEN must be set.")
+        return None
 
+    url = f"{config.GITHUB_API_URL}/repos/{repo}/pulls/{pr_number}/reviews"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept":        "application/vnd.github.v3+json"
+    }
+    params = {"per_page": 100}
+    last_sha = None
+    try:
+        # Reviews are listed oldest first; follow the pagination to the end
+        while url:
+            resp = get_http_client().get(url, headers=headers, params=params)
+            resp.raise_for_status()
+            for review in resp.json():
+                match = REVIEWED_SHA_PATTERN.search(review.get("body") or "")
+                if match:
+                    last_sha = match.group(1)
+            url = resp.links.get("next", {}).get("url")
+            params = None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error("Failed to list PR reviews: %s", e)
+        return None
+    return last_sha
+
+def get_existing_review_comments(config, repo=None, pr_number=None):
+    """
+    Returns the (path, body) pairs of every inline comment already on the pull
+    request, fetched in one paginated listing, or None if they cannot be listed.
+    """
+    repo      = repo or pr_context.getenv("REPOSITORY_GITHUB")
+    pr_number = pr_number or pr_context.getenv("PR_NUMBER_GITHUB")
+    token     = config.GITHUB_TOKEN
     if not repo or not pr_number or not token:
+        logging.error("REPOSITORY_GITHUB, PR_NUMBER_GITHUB and GITHUB_TOKEN must be set.")
+        return None
+
+    url = f"{config.GITHUB_API_URL}/repos/{repo}/pulls/{pr_number}/comments"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept":        "application/vnd.github.v3+json"
+    }
+    params = {"per_page": 100}
+    existing = []
+    try:
+        while url:
+            resp = get_http_client().get(url, headers=headers, params=params)
+            resp.raise_for_status()
+            existing.extend((c.get("path"), c.get("body") or "") for c in resp.json())
+            url = resp.links.get("next", {}).get("url")
+            params = None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error("Failed to list PR review comments: %s", e)
+        return None
+    return existing
+
+# Maximum number of skipped files listed in the review summary
+MAX_SKIPPED_FILES_LISTED = 50
+
+def publish_review_with_suggestions(comments, config, diff_index=None, head_sha=None, skipped_files=None,
+                                    diff_incomplete=False, resolved=None):
+    """
+    Crée une Pull Request Review avec un résumé en body et des inline
+    comments pour chaque suggestion dont on trouve la position dans le diff.
+    Au-delà de REVIEW_MAX_COMMENTS commentaires ou REVIEW_MAX_BYTES octets,
+    la revue est découpée en plusieurs parties postées à la suite (voir
+    split_review et ReviewPoster) ; seules les parties en échec sont reprises.
+    `diff_index` est le DiffIndex du diff de la PR ; à défaut il est
+    construit une fois depuis LLM_DIFF_CONTENT.
+    `resolved` associe à placement_key(commentaire) un placement déjà calculé
+    sur ce même diff (voir main.prepare_comments) ; seuls les autres
+    commentaires, par exemple fusionnés par la déduplication, sont placés ici.
+    `head_sha` (par défaut HEAD_SHA) est enregistré dans un marqueur caché
+    du résumé pour la revue incrémentale suivante.
+    `skipped_files` liste les fichiers non revus faute de budget : ils sont
+    signalés dans le résumé, et la revue étant partielle, le marqueur n'est
+    pas écrit afin que la revue suivante les reprenne. De même avec
+    `diff_incomplete`, quand le diff n'a pu être lu qu'en partie.
+    Sans suggestion, une revue est tout de même postée pour enregistrer le
+    marqueur : un court résumé, ou le seul marqueur caché si EMPTY_REVIEW
+    vaut "marker".
+    Avec REVIEW_OUTPUT_DIR, rien n'est posté : les parties de la revue sont
+    écrites dans un fichier JSON (voir write_review_file).
+    """
+    repo       = pr_context.getenv("REPOSITORY_GITHUB")
+    pr_number  = pr_context.getenv("PR_NUMBER_GITHUB")
+    token      = config.GITHUB_TOKEN
+    output_dir = getattr(config, "REVIEW_OUTPUT_DIR", "")
+
+    if not repo or not pr_number or not (token or output_dir):
         logging.error("REPOSITORY_GITHUB, PR_NUMBER_GITHUB and GITHUB_TOKEN must be set.")
         return False
 
-    # Récupère le diff complet stocké plus tôt dans main.py
-    diff = os.getenv("LLM_DIFF_CONTENT", "")
+    # Récupère le diff complet stocké plus tôt dans main.py, indexé une seule fois
+    if diff_index is None:
+        diff_index = DiffIndex.parse(os.getenv("LLM_DIFF_CONTENT", ""))
 
-    # Build summary body
+    # Build summary header; the table rows are spread over the review parts
     total = len(comments)
-    summary = (
+    header = (
         "## Pull Request Review Summary\n\n"
         f"I generated **{total}** suggestion{'s' if total != 1 else ''} in this review.\n\n"
-        "### Suggestions Overview\n"
-        "| # | File | Line | Suggestion |\n"
-        "| - | ---- | ---- | ---------- |\n"
     )
-    for idx, c in enumerate(comments, start=1):
+
+    # Place every comment in one batched pass; lines just outside the diff are
+    # snapped to the nearest commentable line, ranges become multi-line comments
+    resolved = resolved or {}
+    keys = [placement_key(c) for c in comments]
+    missing = [c for c, key in zip(comments, keys) if key not in resolved]
+    if missing:
+        snap = getattr(config, "COMMENT_LINE_SNAP", 10)
+        resolved = dict(resolved)
+        resolved.update(zip(map(placement_key, missing), diff_index.resolve_comments(missing, max_distance=snap)))
+    placements = [resolved[key] for key in keys]
+
+    # One entry per suggestion: its summary table row and its inline comment, if any
+    entries = []
+    inline_comments = []
+    line_numbers = []
+    for idx, (c, placement) in enumerate(zip(comments, placements), start=1):
         file = c.get("file","unknown")
         line = c.get("line","?")
         text = c.get("comment","").replace("\n"," ")
-        summary += f"| {idx} | `{file}` | {line} | {text} |\n"
+        entry = {"row": f"| {idx} | `{file}` | {line} | {text} |\n", "comment": None}
+        entries.append(entry)
 
-    # Build inline comments
-    inline_comments = []
-    for c in comments:
-        path = c.get("file")
-        try:
-            line_number = int(c.get("line"))
-            position = compute_diff_position(diff, path, line_number)
-        except (ValueError, TypeError) as e:
+        if placement is None:
             logging.warning(
-                "Skipping inline comment for %s:%s — %s",
-                path, c.get("line"), e
+                "Skipping inline comment for %s:%s — not found in the diff",
+                c.get("file"), c.get("line")
             )
             continue
 
-        inline_comments.append({
-            "path":     path,
-            "position": position,
-            "body":     c.get("comment","")
+        if "start_line" in placement:
+            entry["comment"] = {
+                "path":       c.get("file"),
+                "start_line": placement["start_line"],
+                "start_side": "RIGHT",
+                "line":       placement["line"],
+                "side":       "RIGHT",
+                "body":       c.get("comment","")
+            }
+        else:
+            entry["comment"] = {
+                "path":     c.get("file"),
+                "position": placement["position"],
+                "body":     c.get("comment","")
+            }
+        inline_comments.append(entry["comment"])
+        line_numbers.append(placement.get("start_line", placement["line"]))
+
+    # Quote the surrounding code if requested, reading every file only once
+    context_lines = getattr(config, "COMMENT_CONTEXT_LINES", 0)
+    if context_lines > 0 and inline_comments:
+        cache = get_file_cache(config)
+        ref = pr_context.getenv("HEAD_SHA") or pr_context.getenv("GITHUB_HEAD_REF") or pr_context.getenv("GITHUB_REF")
+        cache.prefetch([ic["path"] for ic in inline_comments], ref)
+        for ic, line_number in zip(inline_comments, line_numbers):
+            try:
+                snippet = get_code_context(ic["path"], line_number, context_lines, ref=ref, cache=cache)
+            except Exception as e:
+                logging.warning("No code context for %s:%s — %s", ic["path"], line_number, e)
+                continue
+            if snippet:
+                ic["body"] += f"\n\n```\n{snippet}\n```"
+
+    note = ""
+    if skipped_files:
+        listed = skipped_files[:MAX_SKIPPED_FILES_LISTED]
+        note += (
+            f"\n> **Note:** the review budget ran out; {len(skipped_files)} "
+            f"file{'s were' if len(skipped_files) != 1 else ' was'} not reviewed:\n"
+        )
+        note += "".join(f"> - `{path}`\n" for path in listed)
+        if len(skipped_files) > len(listed):
+            note += f"> - ... and {len(skipped_files) - len(listed)} more\n"
+
+    if diff_incomplete:
+        note += "\n> **Note:** the diff could not be read in full; only part of the pull request was reviewed.\n"
+
+    head_sha = head_sha or pr_context.getenv("HEAD_SHA")
+    marker = ""
+    if head_sha and not skipped_files and not diff_incomplete:
+        marker = "\n" + REVIEWED_SHA_MARKER.format(sha=head_sha) + "\n"
+
+    # Split into several reviews so that no POST exceeds GitHub's payload limits
+    parts = split_review(
+        entries,
+        max_comments=getattr(config, "REVIEW_MAX_COMMENTS", 50),
+        max_bytes=getattr(config, "REVIEW_MAX_BYTES", 60000),
+        reserved=len((header + note + marker).encode("utf-8")) + REVIEW_PART_OVERHEAD,
+    )
+    run = uuid.uuid4().hex[:12]
+    markers = []
+    payloads = []
+    # Sans suggestion, la revue enregistre tout de même le commit revu
+    # (marqueur) pour que la revue suivante soit incrémentale
+    quiet = not comments and getattr(config, "EMPTY_REVIEW", "summary") == "marker"
+    if quiet and not (marker or note):
+        logging.info("No suggestions and no head SHA to record on #%s; nothing posted", pr_number)
+        return True
+    for number, part in enumerate(parts, start=1):
+        if not comments:
+            body = note if quiet else "## Pull Request Review Summary\n\nNo suggestions for this change.\n" + note
+        else:
+            if number == 1:
+                body = header
+                if len(parts) > 1:
+                    body += f"Posted in {len(parts)} parts to stay within GitHub limits.\n\n"
+            else:
+                body = f"## Pull Request Review Summary (part {number}/{len(parts)})\n\n"
+            body += SUMMARY_TABLE_HEADER + "".join(e["row"] for e in part)
+            if number == 1:
+                body += note
+        markers.append(REVIEW_PART_MARKER.format(run=run, number=number))
+        body += "\n" + markers[-1] + "\n"
+        payloads.append({
+            "body":     body,
+            "event":    "COMMENT",
+            "comments": [e["comment"] for e in part if e["comment"] is not None]
         })
 
-    payload = {
-        "body":    summary,
-        "event":   "COMMENT",
-        "comments": inline_comments
-    }
+    if output_dir:
+        if marker:
+            payloads[-1]["body"] += marker
+        return write_review_file(output_dir, repo, pr_number, payloads, head_sha)
 
     url = f"{config.GITHUB_API_URL}/repos/{repo}/pulls/{pr_number}/reviews"
     headers = {
         "Authorization": f"Bearer {token}",
         "Accept":        "application/vnd.github.v3+json"
     }
+    poster = ReviewPoster(
+        url, headers,
+        interval=getattr(config, "REVIEW_POST_INTERVAL", 1.0),
+        max_wait=getattr(config, "HTTP_MAX_RETRY_WAIT", 60.0),
+    )
+    retries = getattr(config, "REVIEW_POST_RETRIES", 2)
 
-    try:
-        resp = requests.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
-        logging.info(
-            "Posted PR review with %d inline comment(s) on #%s",
-            len(inline_comments), pr_number
+    # The last part carries the reviewed-SHA marker, and only once every other part is posted
+    failed = poster.post_all(payloads[:-1], retries, markers[:-1])
+    if marker and not failed:
+        payloads[-1]["body"] += marker
+    failed += [len(payloads) - 1 + i for i in poster.post_all(payloads[-1:], retries, markers[-1:])]
+
+    if failed:
+        logging.error(
+            "Failed to post %d of %d review part(s) on #%s",
+            len(failed), len(payloads), pr_number
         )
-        return True
-    except requests.exceptions.RequestException as e:
-        logging.error("Failed to post PR review: %s", e)
         return False
-    
-def compute_diff_position(diff_text: str, file_path: str, target_line: int) -> int:
+    logging.info(
+        "Posted PR review with %d inline comment(s) in %d part(s) on #%s",
+        len(inline_comments), len(payloads), pr_number
+    )
+    return True
+
+def write_review_file(output_dir, repo, pr_number, payloads, head_sha=None):
     """
-    Pour le diff complet `diff_text`, trouve la position dans le hunk
-    correspondant à `target_line` du fichier `file_path`.
+    Écrit la revue qui aurait été postée dans `output_dir`/<owner>__<repo>/<pr>.json :
+    {"repo", "pr_number", "head_sha", "parts"}, `parts` étant les payloads des POST.
+    Renvoie True si le fichier a pu être écrit.
     """
-    in_target_file = False
-    in_hunk = False
-    position = 0
-    current_new = None
+    directory = os.path.join(output_dir, repo.replace("/", "__"))
+    path = os.path.join(directory, f"{pr_number}.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"repo": repo, "pr_number": str(pr_number), "head_sha": head_sha, "parts": payloads}, f, indent=2)
+    except OSError as e:
+        logging.error("Unable to write the review of #%s to %s: %s", pr_number, path, e)
+        return False
+    logging.info("Review of %s#%s written to %s (dry run)", repo, pr_number, path)
+    return True
 
-    for line in diff_text.splitlines():
-        # Début d'un nouveau fichier
-        if line.startswith("diff --git"):
-            in_target_file = (file_path in line)
-            in_hunk = False
-            continue
+SUMMARY_TABLE_HEADER = (
+    "### Suggestions Overview\n"
+    "| # | File | Line | Suggestion |\n"
+    "| - | ---- | ---- | ---------- |\n"
+)
+# Bytes kept free in each part for its title, the table header and the JSON framing
+REVIEW_PART_OVERHEAD = 512
 
-        if not in_target_file:
-            continue
+def split_review(entries, max_comments=50, max_bytes=60000, reserved=0):
+    """
+    Répartit les suggestions (ligne du tableau + inline comment éventuel) en
+    parties successives d'au plus `max_comments` inline comments et d'environ
+    `max_bytes` octets de JSON, `reserved` octets étant gardés pour le reste
+    du corps. Une suggestion trop grosse à elle seule forme sa propre partie.
+    Renvoie toujours au moins une partie.
+    """
+    parts = [[]]
+    size = count = 0
+    for entry in entries:
+        cost = len(entry["row"].encode("utf-8"))
+        if entry["comment"] is not None:
+            cost += len(json.dumps(entry["comment"]).encode("utf-8"))
+        added = 1 if entry["comment"] is not None else 0
+        if parts[-1] and (size + cost + reserved > max_bytes or count + added > max_comments):
+            parts.append([])
+            size = count = 0
+        parts[-1].append(entry)
+        size += cost
+        count += added
+    return parts
 
-        # On ignore les headers de fichier
-        if line.startswith("--- ") or line.startswith("+++ "):
-            continue
+class ReviewPoster:
+    """
+    Poste les parties d'une revue en espaçant les requêtes d'au moins
+    `interval` secondes (limites secondaires de GitHub sur les créations de
+    contenu) et en attendant la réinitialisation du quota lorsqu'il est épuisé.
+    """
 
-        # Début d'un hunk : on extrait le numéro de départ
-        if line.startswith("@@"):
-            in_hunk = True
-            position = 0
-            m = re.search(r'\+(\d+)(?:,(\d+))?', line)
-            if not m:
-                raise ValueError(f"Hunk header mal formé : {line}")
-            current_new = int(m.group(1))
-            continue
+    def __init__(self, url, headers, interval=1.0, max_wait=60.0, clock=time.monotonic, sleep=time.sleep):
+        self.url = url
+        self.headers = headers
+        self.interval = interval
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self._next_post = None
 
-        if in_hunk:
-            # Fin du bloc si on voit un nouveau diff
-            if line.startswith("diff --git"):
-                break
+    def post(self, payload):
+        """
+        Poste une partie ; renvoie (succès, nouvel essai utile).
+        """
+        if self._next_post is not None:
+            delay = self._next_post - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+        try:
+            # Only failures where nothing was sent, and rate limits, are retried by the
+            # client: post_all owns the other retries, after checking what was created
+            resp = get_http_client().post(self.url, json=payload, headers=self.headers, idempotent=False)
+            self._pace(resp)
+            resp.raise_for_status()
+            return True, False
+        except requests.exceptions.RequestException as e:
+            logging.error("Failed to post PR review: %s", e)
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            # A rejected payload (422...) would be rejected again
+            return False, not (isinstance(status, int) and 400 <= status < 500 and status != 429)
 
-            # Chaque ligne de hunk (contexte, ajouté, supprimé) incrémente la position
-            if line.startswith(" ") or line.startswith("+") or line.startswith("-"):
-                position += 1
+    def _pace(self, resp):
+        wait = self.interval
+        remaining = resp.headers.get("X-RateLimit-Remaining")
+        reset = resp.headers.get("X-RateLimit-Reset")
+        if isinstance(remaining, str) and remaining.isdigit() and int(remaining) == 0:
+            try:
+                wait = max(wait, min(self.max_wait, float(reset) - time.time() + 1))
+            except (TypeError, ValueError):
+                pass
+        self._next_post = self.clock() + wait
 
-                # Pour les lignes nouvelles ou de contexte, on compare
-                if line.startswith(" ") or line.startswith("+"):
-                    # est-ce la ligne cible ?
-                    if current_new == target_line:
-                        return position
-                    current_new += 1
+    def posted_markers(self):
+        """
+        Renvoie les marqueurs de partie (REVIEW_PART_MARKER) des revues déjà
+        présentes sur la PR, ou None si elles ne peuvent pas être listées.
+        """
+        url, params = self.url, {"per_page": 100}
+        found = set()
+        try:
+            while url:
+                resp = get_http_client().get(url, headers=self.headers, params=params)
+                resp.raise_for_status()
+                for review in resp.json():
+                    found.update(REVIEW_PART_PATTERN.findall(review.get("body") or ""))
+                url = resp.links.get("next", {}).get("url")
+                params = None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error("Failed to list PR reviews: %s", e)
+            return None
+        return found
 
-    raise ValueError(f"Ligne {target_line} non trouvée dans le diff de {file_path}")
\ No newline at end of file
+    def post_all(self, payloads, retries=2, markers=None):
+        """
+        Poste chaque partie puis, jusqu'à `retries` fois, seulement celles qui
+        ont échoué pour une raison passagère. Renvoie les indices des échecs.
+        Avec `markers` (le marqueur de chaque partie), une partie en échec que
+        GitHub a pourtant créée n'est pas postée une seconde fois ; si les
+        revues ne peuvent pas être listées, rien n'est reposté.
+        """
+        pending = list(range(len(payloads)))
+        given_up = []
+        for attempt in range(retries + 1):
+            if attempt and markers is not None:
+                posted = self.posted_markers()
+                if posted is None:
+                    given_up += pending
+                    pending = []
+                    break
+                pending = [i for i in pending if markers[i] not in posted]
+                if not pending:
+                    break
+            failed = []
+            for i in pending:
+                ok, retry = self.post(payloads[i])
+                if not ok:
+                    (failed if retry else given_up).append(i)
+            if not failed:
+                break
+            if attempt < retries:
+                logging.warning("Retrying %d failed review part(s).", len(failed))
+            pending = failed
+        else:
+            given_up += pending
+        return sorted(given_up)
+    
+def compute_diff_position(diff_text, file_path: str, target_line: int) -> int:
+    """
+    Pour le diff complet `diff_text` (texte ou DiffIndex), trouve la position
+    GitHub correspondant à `target_line` du fichier `file_path`.
+    Passer un DiffIndex évite de re-parcourir le diff à chaque commentaire.
+    """
+    index = diff_text if isinstance(diff_text, DiffIndex) else DiffIndex.parse(diff_text)
+    position = index.position(file_path, target_line)
+    if position is None:
+        raise ValueError(f"Ligne {target_line} non trouvée dans le diff de {file_path}")
+    return position
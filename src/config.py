@@ -3,6 +3,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Prompt format used when LLM_PROMPT_FORMAT is unset, also by configs that lack it
+DEFAULT_PROMPT_FORMAT = "batched"
+
 class Config:
     # Current CI/CD platform: 'github' or 'gitlab'
     CI_PLATFORM = os.getenv("CI_PLATFORM", "github")
@@ -10,17 +13,128 @@ class Config:
     # LLM configuration
     LLM_ENDPOINT = os.getenv("LLM_ENDPOINT", "http://localhost:8080/predict")
     DIFF_CHUNK_SIZE = int(os.getenv("DIFF_CHUNK_SIZE", "10000"))
+    # Token budget of a single LLM request (prompt instructions + diff chunk);
+    # defaults to DIFF_CHUNK_SIZE characters worth of tokens
+    LLM_TOKEN_BUDGET = int(os.getenv("LLM_TOKEN_BUDGET") or DIFF_CHUNK_SIZE // 4)
+    # "batched": shared instructions, comments answered per file and validated against
+    # the diff; "single": one comment list per request
+    LLM_PROMPT_FORMAT = os.getenv("LLM_PROMPT_FORMAT") or DEFAULT_PROMPT_FORMAT
+    # Stream completions (server-sent events) and stop as soon as the comments are complete
+    LLM_STREAM = os.getenv("LLM_STREAM", "false").lower() in ("1", "true", "yes")
+    # Several inference servers: comma-separated "url" or "url|weight" entries
+    # (overrides LLM_ENDPOINT). Requests go to the least loaded healthy server.
+    LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+    # Maximum number of chunks sent to each LLM endpoint at the same time
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    # "threads" (LLM calls on a thread pool, comments handled once all are back) or
+    # "async" (asyncio pipeline: diff streaming, LLM calls and comment preparation
+    # overlap, joined by queues of PIPELINE_QUEUE_SIZE chunks, 0 = one per LLM slot)
+    PIPELINE_MODE = (os.getenv("PIPELINE_MODE") or "threads").lower()
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE") or 0)
+    # An endpoint failing this many times in a row is paused for LLM_COOLDOWN seconds
+    LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD") or 3)
+    LLM_COOLDOWN = float(os.getenv("LLM_COOLDOWN") or 30)
+
+    # On-disk cache of LLM responses (disabled when the directory is empty)
+    REVIEW_CACHE_DIR = os.getenv("REVIEW_CACHE_DIR", "")
+    REVIEW_CACHE_MAX_MB = int(os.getenv("REVIEW_CACHE_MAX_MB", "100"))
+    REVIEW_CACHE_MAX_AGE_DAYS = int(os.getenv("REVIEW_CACHE_MAX_AGE_DAYS", "7"))
+    # Per pull request record of the chunks reviewed for the current head commit, so a
+    # failed or cancelled run resumes without LLM calls (disabled when empty)
+    CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "")
+    
+    # Outbound HTTP: timeouts (seconds) and retries with exponential backoff
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
+    HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+    HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1.0"))
+    HTTP_MAX_RETRY_WAIT = float(os.getenv("HTTP_MAX_RETRY_WAIT", "60"))
     
     # GitHub-specific configuration
     GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
     GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
     
+    # Lines of surrounding code quoted in each inline comment (0 disables)
+    COMMENT_CONTEXT_LINES = int(os.getenv("COMMENT_CONTEXT_LINES", "0"))
+    # Comments on lines outside the diff move to the nearest commentable line at most
+    # this many lines away (0 keeps only exact lines)
+    COMMENT_LINE_SNAP = int(os.getenv("COMMENT_LINE_SNAP") or 10)
+    
+    # Reviews above these limits are posted in several parts, REVIEW_POST_INTERVAL
+    # seconds apart; a failed part is retried up to REVIEW_POST_RETRIES times
+    REVIEW_MAX_COMMENTS = int(os.getenv("REVIEW_MAX_COMMENTS") or 50)
+    REVIEW_MAX_BYTES = int(os.getenv("REVIEW_MAX_BYTES") or 60000)
+    REVIEW_POST_INTERVAL = float(os.getenv("REVIEW_POST_INTERVAL") or 1.0)
+    REVIEW_POST_RETRIES = int(os.getenv("REVIEW_POST_RETRIES") or 2)
+    
+    # JSON report of stage timings and LLM call metrics (empty disables)
+    METRICS_REPORT_PATH = os.getenv("METRICS_REPORT_PATH", "")
+    
+    # Review service (src/daemon.py): webhook listener, review threads, running reviews
+    # per repository, optional directory of queued reviews and webhook signing secret
+    DAEMON_HOST = os.getenv("DAEMON_HOST") or "127.0.0.1"
+    DAEMON_PORT = int(os.getenv("DAEMON_PORT") or 8080)
+    DAEMON_WORKERS = int(os.getenv("DAEMON_WORKERS") or 2)
+    DAEMON_MAX_PER_REPO = int(os.getenv("DAEMON_MAX_PER_REPO") or 1)
+    DAEMON_QUEUE_DIR = os.getenv("DAEMON_QUEUE_DIR", "")
+    # Batch reviews (src/batch_review.py): pull requests at once, LLM requests in flight
+    # over the whole batch (0: LLM_MAX_CONCURRENCY per endpoint), estimated LLM tokens
+    # after which no review starts (0: no limit), GitHub API requests kept in reserve
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY") or 4)
+    BATCH_MAX_PER_REPO = int(os.getenv("BATCH_MAX_PER_REPO") or 2)
+    BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY") or 0)
+    BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET") or 0)
+    BATCH_GITHUB_RESERVE = int(os.getenv("BATCH_GITHUB_RESERVE") or 500)
+    # Write reviews as JSON files under this directory instead of posting them (dry run)
+    REVIEW_OUTPUT_DIR = os.getenv("REVIEW_OUTPUT_DIR", "")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    
     # GitLab-specific configuration (for future extension)
     GITLAB_API_URL = os.getenv("GITLAB_API_URL", "https://gitlab.example.com/api/v4")
     GITLAB_PRIVATE_TOKEN = os.getenv("GITLAB_PRIVATE_TOKEN", "")
     
-    # Patterns to exclude from diff (converted to a list)
+    # Where the diff comes from: "api" (GitHub pull request diff) or "git" (local checkout)
+    DIFF_SOURCE = os.getenv("DIFF_SOURCE", "api").lower()
+    # Context lines around each change when the diff is computed with git
+    DIFF_CONTEXT_LINES = int(os.getenv("DIFF_CONTEXT_LINES", "3"))
+    # How hunks are rendered for the LLM: "annotated" ("Line N: " prefixes) or "compact"
+    # (short prefixes, context trimmed to DIFF_COMPACT_CONTEXT lines, removed blocks cut
+    # after DIFF_COMPACT_REMOVED_LINES lines, whitespace-only changes collapsed)
+    DIFF_ENCODING = (os.getenv("DIFF_ENCODING") or "annotated").lower()
+    DIFF_COMPACT_CONTEXT = int(os.getenv("DIFF_COMPACT_CONTEXT") or 1)
+    DIFF_COMPACT_REMOVED_LINES = int(os.getenv("DIFF_COMPACT_REMOVED_LINES") or 3)
+    DIFF_COMPACT_WHITESPACE = os.getenv("DIFF_COMPACT_WHITESPACE", "true").lower() in ("1", "true", "yes")
+    # Widen hunks to the functions and classes around them (at most SEMANTIC_MAX_LINES
+    # lines each, read from the local checkout) and merge hunks of the same definition
+    SEMANTIC_CHUNKING = os.getenv("SEMANTIC_CHUNKING", "true").lower() in ("1", "true", "yes")
+    SEMANTIC_MAX_LINES = int(os.getenv("SEMANTIC_MAX_LINES") or 200)
+    
+    # Review only the commits pushed since the previous review (recorded in its body)
+    INCREMENTAL_REVIEW = os.getenv("INCREMENTAL_REVIEW", "true").lower() in ("1", "true", "yes")
+    # Review posted when there is no suggestion, to record the reviewed head commit:
+    # "summary" (a short "no suggestions" summary) or "marker" (the hidden marker only)
+    EMPTY_REVIEW = (os.getenv("EMPTY_REVIEW") or "summary").lower()
+    
+    # Merge near-duplicate comments (same file, lines at most DEDUP_LINE_WINDOW apart,
+    # text similarity of at least DEDUP_SIMILARITY) and skip those already on the PR
+    DEDUP_COMMENTS = os.getenv("DEDUP_COMMENTS", "true").lower() in ("1", "true", "yes")
+    DEDUP_LINE_WINDOW = int(os.getenv("DEDUP_LINE_WINDOW") or 3)
+    DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY") or 0.6)
+    
+    # Global limits of a review run (0 = unlimited): wall-clock seconds and estimated
+    # tokens sent to the LLM. When set, the most valuable files are reviewed first.
+    REVIEW_TIME_BUDGET = int(os.getenv("REVIEW_TIME_BUDGET") or 0)
+    REVIEW_TOKEN_BUDGET = int(os.getenv("REVIEW_TOKEN_BUDGET") or 0)
+    # "pattern=weight" rules scaling the priority of matching files (e.g. "src/core/**=2,docs/=0.2")
+    REVIEW_PRIORITY_RULES = [r for r in os.getenv("REVIEW_PRIORITY_RULES", "").split(',') if r.strip()]
+    
+    # Patterns to exclude from diff (converted to a list); gitignore-style globs,
+    # bare words match whole words of the path, "re:" prefixes a regex
     EXCLUDE_PATTERNS = os.getenv("EXCLUDE_PATTERNS", "test,tests,spec").split(',')
+    # Patterns always reviewed, even when excluded or detected as generated
+    INCLUDE_PATTERNS = [p for p in os.getenv("INCLUDE_PATTERNS", "").split(',') if p.strip()]
+    # Skip lockfiles, vendored, minified and generated files
+    SKIP_GENERATED_FILES = os.getenv("SKIP_GENERATED_FILES", "true").lower() in ("1", "true", "yes")
 
 def load_config():
     return Config
@@ -30,9 +144,52 @@ if __name__ == "__main__":
     config = load_config()
     print("LLM_ENDPOINT:", config.LLM_ENDPOINT)
     print("DIFF_CHUNK_SIZE:", config.DIFF_CHUNK_SIZE)
+    print("LLM_TOKEN_BUDGET:", config.LLM_TOKEN_BUDGET)
+    print("LLM_PROMPT_FORMAT:", config.LLM_PROMPT_FORMAT)
+    print("LLM_STREAM:", config.LLM_STREAM)
+    print("LLM_ENDPOINTS:", config.LLM_ENDPOINTS)
+    print("LLM_MAX_CONCURRENCY:", config.LLM_MAX_CONCURRENCY)
+    print("PIPELINE_MODE:", config.PIPELINE_MODE)
+    print("PIPELINE_QUEUE_SIZE:", config.PIPELINE_QUEUE_SIZE)
+    print("LLM_FAILURE_THRESHOLD:", config.LLM_FAILURE_THRESHOLD)
+    print("LLM_COOLDOWN:", config.LLM_COOLDOWN)
+    print("REVIEW_CACHE_DIR:", config.REVIEW_CACHE_DIR)
+    print("CHECKPOINT_DIR:", config.CHECKPOINT_DIR)
     print("CI_PLATFORM:", config.CI_PLATFORM)
     print("GITHUB_TOKEN:", config.GITHUB_TOKEN)
     print("GITHUB_API_URL:", config.GITHUB_API_URL)
     print("GITLAB_API_URL:", config.GITLAB_API_URL)
     print("GITLAB_PRIVATE_TOKEN:", config.GITLAB_PRIVATE_TOKEN)
-    print("EXCLUDE_PATTERNS:", config.EXCLUDE_PATTERNS)
\ No newline at end of file
+    print("DIFF_SOURCE:", config.DIFF_SOURCE)
+    print("COMMENT_LINE_SNAP:", config.COMMENT_LINE_SNAP)
+    print("DAEMON_HOST:", config.DAEMON_HOST)
+    print("DAEMON_PORT:", config.DAEMON_PORT)
+    print("DAEMON_WORKERS:", config.DAEMON_WORKERS)
+    print("DAEMON_MAX_PER_REPO:", config.DAEMON_MAX_PER_REPO)
+    print("DAEMON_QUEUE_DIR:", config.DAEMON_QUEUE_DIR)
+    print("BATCH_CONCURRENCY:", config.BATCH_CONCURRENCY)
+    print("BATCH_MAX_PER_REPO:", config.BATCH_MAX_PER_REPO)
+    print("BATCH_LLM_CONCURRENCY:", config.BATCH_LLM_CONCURRENCY)
+    print("BATCH_TOKEN_BUDGET:", config.BATCH_TOKEN_BUDGET)
+    print("BATCH_GITHUB_RESERVE:", config.BATCH_GITHUB_RESERVE)
+    print("REVIEW_OUTPUT_DIR:", config.REVIEW_OUTPUT_DIR)
+    print("REVIEW_MAX_COMMENTS:", config.REVIEW_MAX_COMMENTS)
+    print("REVIEW_MAX_BYTES:", config.REVIEW_MAX_BYTES)
+    print("REVIEW_POST_INTERVAL:", config.REVIEW_POST_INTERVAL)
+    print("REVIEW_POST_RETRIES:", config.REVIEW_POST_RETRIES)
+    print("DIFF_ENCODING:", config.DIFF_ENCODING)
+    print("DIFF_COMPACT_CONTEXT:", config.DIFF_COMPACT_CONTEXT)
+    print("DIFF_COMPACT_REMOVED_LINES:", config.DIFF_COMPACT_REMOVED_LINES)
+    print("DIFF_COMPACT_WHITESPACE:", config.DIFF_COMPACT_WHITESPACE)
+    print("SEMANTIC_CHUNKING:", config.SEMANTIC_CHUNKING)
+    print("SEMANTIC_MAX_LINES:", config.SEMANTIC_MAX_LINES)
+    print("EMPTY_REVIEW:", config.EMPTY_REVIEW)
+    print("DEDUP_COMMENTS:", config.DEDUP_COMMENTS)
+    print("DEDUP_LINE_WINDOW:", config.DEDUP_LINE_WINDOW)
+    print("DEDUP_SIMILARITY:", config.DEDUP_SIMILARITY)
+    print("REVIEW_TIME_BUDGET:", config.REVIEW_TIME_BUDGET)
+    print("REVIEW_TOKEN_BUDGET:", config.REVIEW_TOKEN_BUDGET)
+    print("REVIEW_PRIORITY_RULES:", config.REVIEW_PRIORITY_RULES)
+    print("EXCLUDE_PATTERNS:", config.EXCLUDE_PATTERNS)
+    print("INCLUDE_PATTERNS:", config.INCLUDE_PATTERNS)
+    print("SKIP_GENERATED_FILES:", config.SKIP_GENERATED_FILES)
\ No newline at end of file
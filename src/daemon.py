@@ -0,0 +1,395 @@
+import argparse
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import load_config
+from file_cache import close_file_cache
+from main import run_review
+from metrics import RunMetrics
+import pr_context
+
+# Pull request webhook actions that call for a review
+REVIEW_ACTIONS = {"opened", "reopened", "synchronize", "ready_for_review"}
+# GitHub caps webhook payloads at 25 MB
+MAX_PAYLOAD_BYTES = 25 * 1024 * 1024
+
+class ReviewJob:
+    """
+    One pull request to review, at a given head commit.
+    """
+    __slots__ = ("repo", "pr_number", "head_sha", "base_sha", "head_ref", "received")
+
+    def __init__(self, repo, pr_number, head_sha=None, base_sha=None, head_ref=None):
+        self.repo = repo
+        self.pr_number = str(pr_number)
+        self.head_sha = head_sha
+        self.base_sha = base_sha
+        self.head_ref = head_ref
+        self.received = time.monotonic()
+
+    def __repr__(self):
+        return f"ReviewJob({self.repo}#{self.pr_number} @ {(self.head_sha or '?')[:12]})"
+
+    @property
+    def key(self):
+        return (self.repo, self.pr_number)
+
+    def env(self):
+        """
+        Pull request variables of this job (see pr_context.pull_request_env). The
+        daemon has no checkout of the repository, so GITHUB_WORKSPACE is unset and
+        the diff comes from the API whatever DIFF_SOURCE says (see diff_source).
+        """
+        return {
+            "REPOSITORY_GITHUB": self.repo,
+            "PR_NUMBER_GITHUB": self.pr_number,
+            "HEAD_SHA": self.head_sha,
+            "BASE_SHA": self.base_sha,
+            "GITHUB_HEAD_REF": self.head_ref,
+            "GITHUB_REF": None,
+            "GITHUB_WORKSPACE": None,
+        }
+
+def job_from_event(event, payload):
+    """
+    Returns the ReviewJob requested by a GitHub webhook delivery, or None when the
+    event does not call for a review (other events and actions, draft pull requests).
+    """
+    if event != "pull_request" or payload.get("action") not in REVIEW_ACTIONS:
+        return None
+    pr = payload.get("pull_request") or {}
+    if pr.get("draft") or pr.get("state", "open") != "open":
+        return None
+    try:
+        return ReviewJob(
+            payload["repository"]["full_name"], pr["number"],
+            head_sha=pr["head"]["sha"], base_sha=pr["base"]["sha"], head_ref=pr["head"].get("ref"),
+        )
+    except (KeyError, TypeError):
+        return None
+
+def job_from_dict(data):
+    """
+    Builds a ReviewJob from a local queue entry:
+    {"repo", "pr_number", "head_sha", "base_sha"} (the SHAs are optional).
+    """
+    if not data.get("repo") or not data.get("pr_number"):
+        raise ValueError("A queued review needs 'repo' and 'pr_number'.")
+    return ReviewJob(data["repo"], data["pr_number"], head_sha=data.get("head_sha"),
+                     base_sha=data.get("base_sha"), head_ref=data.get("head_ref"))
+
+def verify_signature(secret, body, signature):
+    """
+    Checks the X-Hub-Signature-256 header of a webhook delivery against `secret`.
+    """
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+class FairQueue:
+    """
+    Review jobs waiting for a worker, with one FIFO per repository served round-robin,
+    so a busy repository cannot starve the others.
+
+    At most `max_per_repo` jobs of a repository run at once, and never two of the
+    same pull request. A job queued for a pull request that already has one waiting
+    replaces it: only the newest head commit is worth reviewing.
+    """
+
+    def __init__(self, max_per_repo=1):
+        self.max_per_repo = max(1, max_per_repo)
+        self._queues = OrderedDict()
+        self._running = {}
+        self._running_prs = set()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, job):
+        """
+        Queues `job`; returns False when it replaced a job already waiting for the same pull request.
+        """
+        with self._cond:
+            queue = self._queues.setdefault(job.repo, deque())
+            for i, waiting in enumerate(queue):
+                if waiting.key == job.key:
+                    queue[i] = job
+                    return False
+            queue.append(job)
+            self._cond.notify()
+            return True
+
+    def _next(self):
+        for repo, queue in self._queues.items():
+            if self._running.get(repo, 0) >= self.max_per_repo:
+                continue
+            for job in queue:
+                if job.key not in self._running_prs:
+                    queue.remove(job)
+                    if queue:
+                        # Served: go to the back of the round
+                        self._queues.move_to_end(repo)
+                    else:
+                        del self._queues[repo]
+                    return job
+        return None
+
+    def get(self, timeout=None):
+        """
+        Waits for the next job that may run and marks it running. Returns None on
+        timeout or once the queue is closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._closed:
+                job = self._next()
+                if job is not None:
+                    self._running[job.repo] = self._running.get(job.repo, 0) + 1
+                    self._running_prs.add(job.key)
+                    return job
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return None
+
+    def done(self, job):
+        """
+        Marks a job returned by get() as finished.
+        """
+        with self._cond:
+            self._running[job.repo] -= 1
+            if not self._running[job.repo]:
+                del self._running[job.repo]
+            self._running_prs.discard(job.key)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": sum(len(q) for q in self._queues.values()),
+                "running": sum(self._running.values()),
+                "repositories": len(set(self._queues) | set(self._running)),
+            }
+
+def review_pull_request(job, config):
+    """
+    Runs the review pipeline of main.py for `job`, with the pull request variables
+    set for the current thread only. Returns the run metrics.
+    """
+    metrics = RunMetrics()
+    with pr_context.pull_request_env(**job.env()):
+        try:
+            run_review(config, metrics)
+        finally:
+            close_file_cache()
+            metrics.finish()
+    return metrics
+
+class ReviewDaemon:
+    """
+    Long-running review service: pull requests come from GitHub webhooks (see
+    make_server) or a local queue directory (see watch_queue_dir), wait in a
+    FairQueue and are reviewed by `workers` threads running the same pipeline as
+    the action.
+
+    The process keeps its HTTP connection pools, LLM endpoint health and caches
+    warm between reviews. Each review still runs its chunks LLM_MAX_CONCURRENCY
+    per endpoint at a time, so up to `workers` times that many LLM requests can
+    be in flight.
+    """
+
+    def __init__(self, config, workers=2, max_per_repo=1, review=review_pull_request):
+        self.config = config
+        self.workers = max(1, workers)
+        self.queue = FairQueue(max_per_repo)
+        self.review = review
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def submit(self, job):
+        queued = self.queue.put(job)
+        logging.info("%s %s.", "Queued" if queued else "Updated queued review", job)
+        return queued
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"review-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+        Stops taking jobs and waits for the running reviews to finish.
+        """
+        self.queue.close()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            waited = time.monotonic() - job.received
+            logging.info("Reviewing %s (queued %.1fs).", job, waited)
+            start = time.monotonic()
+            ok = False
+            try:
+                self.review(job, self.config)
+                ok = True
+            except Exception:
+                logging.exception("Review of %s failed.", job)
+            finally:
+                self.queue.done(job)
+                with self._lock:
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+            logging.info("Review of %s finished in %.1fs.", job, time.monotonic() - start)
+
+    def stats(self):
+        stats = self.queue.stats()
+        with self._lock:
+            stats.update(completed=self.completed, failed=self.failed, workers=self.workers)
+        return stats
+
+def make_server(daemon, host="127.0.0.1", port=8080, secret=""):
+    """
+    Returns a ThreadingHTTPServer feeding `daemon` from GitHub webhooks:
+    POST /webhook (pull_request events, signed with `secret` when set) and
+    GET /health (queue statistics). Call serve_forever() to run it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, data=None):
+            body = json.dumps(data or {}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._reply(404, {"error": "not found"})
+            self._reply(200, daemon.stats())
+
+        def do_POST(self):
+            if self.path != "/webhook":
+                return self._reply(404, {"error": "not found"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0 or length > MAX_PAYLOAD_BYTES:
+                return self._reply(413, {"error": "payload too large"})
+            body = self.rfile.read(length)
+            if secret and not verify_signature(secret, body, self.headers.get("X-Hub-Signature-256")):
+                return self._reply(401, {"error": "invalid signature"})
+            event = self.headers.get("X-GitHub-Event", "")
+            if event == "ping":
+                return self._reply(200, {"ok": True})
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                return self._reply(400, {"error": "invalid JSON"})
+            job = job_from_event(event, payload) if isinstance(payload, dict) else None
+            if job is None:
+                return self._reply(202, {"queued": False})
+            queued = daemon.submit(job)
+            self._reply(202, {"queued": True, "replaced": not queued})
+
+        def log_message(self, format, *args):
+            logging.debug("%s - %s", self.address_string(), format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+def watch_queue_dir(daemon, directory, interval=2.0, stop=None):
+    """
+    Polls `directory` for *.json files (see job_from_dict), submits them to
+    `daemon` oldest first and deletes them. Invalid files are renamed to *.bad.
+    Runs until `stop` (a threading.Event) is set.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        paths = sorted(glob.glob(os.path.join(directory, "*.json")), key=_mtime)
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    job = job_from_dict(json.load(f))
+            except (OSError, ValueError, AttributeError) as e:
+                logging.error("Invalid queued review %s: %s", path, e)
+                try:
+                    os.replace(path, path[:-len(".json")] + ".bad")
+                except OSError:
+                    pass
+                continue
+            daemon.submit(job)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        stop.wait(interval)
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+def main(argv=None):
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Runs FLAIR as a long-running review service.")
+    parser.add_argument("--host", default=config.DAEMON_HOST)
+    parser.add_argument("--port", type=int, default=config.DAEMON_PORT)
+    parser.add_argument("--workers", type=int, default=config.DAEMON_WORKERS)
+    parser.add_argument("--max-per-repo", type=int, default=config.DAEMON_MAX_PER_REPO)
+    parser.add_argument("--queue-dir", default=config.DAEMON_QUEUE_DIR,
+                        help="Directory polled for queued reviews (*.json); disabled when empty")
+    parser.add_argument("--no-server", action="store_true", help="Only serve the queue directory")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s %(message)s")
+
+    daemon = ReviewDaemon(config, workers=args.workers, max_per_repo=args.max_per_repo)
+    daemon.start()
+    stop = threading.Event()
+    if args.queue_dir:
+        os.makedirs(args.queue_dir, exist_ok=True)
+        threading.Thread(target=watch_queue_dir, args=(daemon, args.queue_dir),
+                         kwargs={"stop": stop}, name="queue-dir", daemon=True).start()
+        logging.info("Watching %s for queued reviews.", args.queue_dir)
+    try:
+        if args.no_server:
+            stop.wait()
+        else:
+            if not config.WEBHOOK_SECRET:
+                logging.warning("WEBHOOK_SECRET is not set: webhook deliveries are not authenticated.")
+            server = make_server(daemon, args.host, args.port, config.WEBHOOK_SECRET)
+            logging.info("Listening for webhooks on %s:%d.", args.host, args.port)
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        daemon.stop()
+
+if __name__ == "__main__":
+    main()
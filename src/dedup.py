@@ -0,0 +1,95 @@
+import hashlib
+import re
+
+# Words of fewer characters carry little meaning for similarity ("a", "to", "is"...)
+_WORD_PATTERN = re.compile(r"[a-z0-9_]{2,}")
+_LINE_PATTERN = re.compile(r"^\s*(\d+)")
+# Code context appended to a published comment (see publish_review_with_suggestions)
+_CODE_CONTEXT_PATTERN = re.compile(r"\n\n```.*\Z", re.DOTALL)
+
+def normalize_text(text):
+    """
+    Lowercases a comment and keeps only its words, dropping markdown, punctuation
+    and the quoted code context added when publishing.
+    """
+    text = _CODE_CONTEXT_PATTERN.sub("", text or "")
+    return " ".join(_WORD_PATTERN.findall(text.lower()))
+
+def shingles(text, size=3):
+    """
+    Returns the set of hashed `size`-word shingles of a normalized text (the
+    words themselves for shorter texts).
+    """
+    words = text.split()
+    if len(words) < size:
+        return {hash(w) for w in words}
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+def similarity(a, b):
+    """
+    Jaccard similarity of two shingle sets.
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def fingerprint(path, text):
+    """
+    Identifies a comment by its file and normalized text, independently of its
+    line, which moves as new commits are pushed.
+    """
+    return hashlib.sha1(f"{path}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+def comment_line(comment):
+    """
+    Returns the first line of a comment's "line" (a number or a range such as "40-45"), or None.
+    """
+    match = _LINE_PATTERN.match(str(comment.get("line", "")))
+    return int(match.group(1)) if match else None
+
+def deduplicate_comments(comments, line_window=3, threshold=0.6):
+    """
+    Merges near-duplicate comments: same file, lines at most `line_window` apart,
+    and text shingles at least `threshold` similar (exact duplicates always match).
+    The most detailed (longest) text of a group is kept, on its first line.
+
+    Returns (comments, merged count); the order of the first occurrences is kept.
+    """
+    kept = []
+    by_file = {}
+    merged = 0
+    for comment in comments:
+        path = comment.get("file")
+        line = comment_line(comment)
+        text = normalize_text(comment.get("comment"))
+        grams = shingles(text)
+        duplicate = None
+        for entry in by_file.get(path, ()):
+            close = line is None or entry["line"] is None or abs(entry["line"] - line) <= line_window
+            if close and (entry["text"] == text or similarity(entry["shingles"], grams) >= threshold):
+                duplicate = entry
+                break
+        if duplicate is None:
+            entry = {"comment": dict(comment), "line": line, "text": text, "shingles": grams}
+            by_file.setdefault(path, []).append(entry)
+            kept.append(entry)
+            continue
+
+        merged += 1
+        target = duplicate["comment"]
+        if len(comment.get("comment") or "") > len(target.get("comment") or ""):
+            target["comment"] = comment.get("comment")
+        if line is not None and (duplicate["line"] is None or line < duplicate["line"]):
+            target["line"] = comment.get("line")
+            duplicate["line"] = line
+    return [entry["comment"] for entry in kept], merged
+
+def drop_existing(comments, existing):
+    """
+    Removes the comments whose fingerprint matches one of `existing` (an iterable
+    of (path, body) pairs, e.g. the comments already posted on the pull request).
+    Returns (comments, dropped count).
+    """
+    known = {fingerprint(path, body) for path, body in existing}
+    remaining = [c for c in comments if fingerprint(c.get("file"), c.get("comment")) not in known]
+    return remaining, len(comments) - len(remaining)
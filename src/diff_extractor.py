@@ -1,16 +1,27 @@
 import logging
-import re
 import subprocess
-import requests
 import os
+import tempfile
+import zlib
+from diff_index import DiffIndex, iter_file_diffs, split_lines
+from path_filter import PathFilter
+from http_client import get_http_client
+import pr_context
+from utils import estimate_lines_tokens
+
+# Bytes read at a time from a streamed diff
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# About one file in this many is a chunk anchor (see is_chunk_anchor)
+CHUNK_ANCHOR_EVERY = 8
 
 def get_diff_from_pr():
     """
     Retrieves the diff directly via the GitHub API using the pull request diff URL.
     Requires REPOSITORY_GITHUB, PR_NUMBER_GITHUB, and GITHUB_TOKEN to be set.
     """
-    repo = os.getenv("REPOSITORY_GITHUB")
-    pr_number = os.getenv("PR_NUMBER_GITHUB")
+    repo = pr_context.getenv("REPOSITORY_GITHUB")
+    pr_number = pr_context.getenv("PR_NUMBER_GITHUB")
     token = os.getenv("GITHUB_TOKEN")
     
     if not repo:
@@ -30,13 +41,198 @@ def get_diff_from_pr():
     }
     
     try:
-        response = requests.get(diff_url, headers=headers)
+        response = get_http_client().get(diff_url, headers=headers)
         response.raise_for_status()
         return response.text
     except Exception as e:
         logging.error("Error retrieving diff via GitHub API: %s", e)
         return None
 
+def _decode_line(raw, encoding):
+    # A CRLF line ending leaves its "\r" behind, as str.splitlines would drop it
+    if raw.endswith(b"\r"):
+        raw = raw[:-1]
+    return raw.decode(encoding, errors="replace")
+
+def iter_byte_lines(chunks, encoding="utf-8"):
+    """
+    Splits a stream of byte chunks into decoded lines, on "\n" only, like the line
+    numbering of a diff: a "\r" inside a line, or one ending a chunk, is not a line
+    break (requests' iter_lines breaks on both and yields spurious empty lines).
+    """
+    pending = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for raw in lines:
+            yield _decode_line(raw, encoding)
+    if pending:
+        yield _decode_line(pending, encoding)
+
+def iter_diff_lines_from_pr():
+    """
+    Streaming counterpart of get_diff_from_pr: yields the lines of the pull request
+    diff as they arrive from the GitHub API. Raises on missing settings or HTTP errors.
+    """
+    repo = pr_context.getenv("REPOSITORY_GITHUB")
+    pr_number = pr_context.getenv("PR_NUMBER_GITHUB")
+    token = os.getenv("GITHUB_TOKEN")
+    if not repo or not pr_number or not token:
+        raise ValueError("Environment variables REPOSITORY_GITHUB, PR_NUMBER_GITHUB and GITHUB_TOKEN must be set.")
+
+    diff_url = f"https://api.github.com/repos/{repo}/pulls/{pr_number}"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github.v3.diff"
+    }
+    with get_http_client().get(diff_url, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        yield from iter_byte_lines(response.iter_content(chunk_size=STREAM_CHUNK_BYTES), response.encoding or "utf-8")
+
+def diff_source(config):
+    """
+    Returns the diff source to use: config.DIFF_SOURCE, except that "git" needs a
+    checkout of the pull request. A review with pull request overrides (the review
+    service, batch reviews; see pr_context) and no GITHUB_WORKSPACE uses the API
+    rather than whatever repository the process happens to run in.
+    """
+    source = getattr(config, "DIFF_SOURCE", "api")
+    if source == "git" and pr_context.current() is not None and not pr_context.getenv("GITHUB_WORKSPACE"):
+        return "api"
+    return source
+
+def iter_diff_lines(config):
+    """
+    Yields the pull request diff line by line from the source selected by
+    config.DIFF_SOURCE, like get_diff. Falls back to the API when git fails
+    before producing any line.
+    """
+    if diff_source(config) == "git":
+        started = False
+        try:
+            for line in iter_diff_lines_from_git(
+                pr_context.getenv("BASE_SHA"), pr_context.getenv("HEAD_SHA"),
+                repo_dir=pr_context.getenv("GITHUB_WORKSPACE"),
+                context_lines=getattr(config, "DIFF_CONTEXT_LINES", 3),
+            ):
+                started = True
+                yield line
+            return
+        except (OSError, subprocess.CalledProcessError) as e:
+            if started:
+                raise
+            logging.warning("Error computing diff with git (%s); falling back to the GitHub API.", e)
+    yield from iter_diff_lines_from_pr()
+
+def iter_diff_lines_from_git(base_sha, head_sha, repo_dir=None, context_lines=3, find_renames=True):
+    """
+    Yields the lines of the diff between base_sha and head_sha, computed by the
+    local git checkout and streamed from the subprocess as git produces them.
+
+    Uses the merge base of the two commits ("base...head"), like the pull request
+    diff served by GitHub. Raises subprocess.CalledProcessError if git fails.
+    Lines are split on "\n" only (see iter_byte_lines); git's error output goes
+    to a temporary file, so it can never fill a pipe and block git.
+    """
+    cmd = [
+        "git", "-C", repo_dir or ".", "diff",
+        "--no-color", "--no-ext-diff",
+        f"--unified={context_lines}",
+        "--find-renames" if find_renames else "--no-renames",
+        f"{base_sha}...{head_sha}",
+    ]
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+        completed = False
+        try:
+            for raw in process.stdout:
+                yield _decode_line(raw[:-1] if raw.endswith(b"\n") else raw, "utf-8")
+            completed = True
+        finally:
+            # Stop git if the consumer gave up before the end of the diff
+            if not completed and process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+            errors.seek(0)
+            stderr = errors.read().decode("utf-8", errors="replace")
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+def get_diff_from_git(base_sha=None, head_sha=None, repo_dir=None, context_lines=3, find_renames=True):
+    """
+    Computes the pull request diff locally with git instead of downloading it.
+    Defaults to the BASE_SHA / HEAD_SHA environment variables and the GITHUB_WORKSPACE checkout.
+    Returns the diff text, or None on error.
+    """
+    base_sha = base_sha or pr_context.getenv("BASE_SHA")
+    head_sha = head_sha or pr_context.getenv("HEAD_SHA")
+    if not base_sha or not head_sha:
+        logging.error("BASE_SHA and HEAD_SHA must be set to compute the diff with git.")
+        return None
+
+    try:
+        lines = iter_diff_lines_from_git(
+            base_sha, head_sha,
+            repo_dir=repo_dir or pr_context.getenv("GITHUB_WORKSPACE"),
+            context_lines=context_lines,
+            find_renames=find_renames,
+        )
+        return "\n".join(lines)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.error("Error computing diff with git: %s %s", e, getattr(e, "stderr", "") or "")
+        return None
+
+def get_diff(config):
+    """
+    Retrieves the pull request diff from the source selected by config.DIFF_SOURCE:
+    "git" computes it from the local checkout (falling back to the API on failure),
+    anything else downloads it from the GitHub API.
+    """
+    if diff_source(config) == "git":
+        diff = get_diff_from_git(context_lines=getattr(config, "DIFF_CONTEXT_LINES", 3))
+        if diff is not None:
+            return diff
+        logging.warning("Falling back to the GitHub API for the diff.")
+    return get_diff_from_pr()
+
+def get_compare_diff(base_sha, head_sha):
+    """
+    Retrieves the diff between two commits of REPOSITORY_GITHUB via the GitHub compare API.
+    Returns the diff text, or None on error.
+    """
+    repo = pr_context.getenv("REPOSITORY_GITHUB")
+    token = os.getenv("GITHUB_TOKEN")
+    if not repo or not token:
+        logging.error("Environment variables REPOSITORY_GITHUB and GITHUB_TOKEN must be set.")
+        return None
+
+    url = f"https://api.github.com/repos/{repo}/compare/{base_sha}...{head_sha}"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github.v3.diff"
+    }
+    try:
+        response = get_http_client().get(url, headers=headers)
+        response.raise_for_status()
+        return response.text
+    except Exception as e:
+        logging.error("Error retrieving compare diff via GitHub API: %s", e)
+        return None
+
+def get_diff_between(base_sha, head_sha, config):
+    """
+    Retrieves the diff between two commits (e.g. the last reviewed head and the new
+    head of a pull request) from the source selected by config.DIFF_SOURCE.
+    """
+    if diff_source(config) == "git":
+        diff = get_diff_from_git(base_sha, head_sha, context_lines=0)
+        if diff is not None:
+            return diff
+    return get_compare_diff(base_sha, head_sha)
+
 def split_diff(diff, chunk_size):
     """
     Splits the diff into chunks of 'chunk_size' characters.
@@ -45,54 +241,158 @@ def split_diff(diff, chunk_size):
         return []
     return [diff[i:i+chunk_size] for i in range(0, len(diff), chunk_size)]
 
-def filter_diff(diff, exclude_patterns=None):
+def _path_filter(exclude_patterns=None, path_filter=None):
     """
-    Filters the diff to exclude entire file blocks whose paths contain any undesirable pattern.
-    A file block (including its header) is removed if its file path contains any pattern in exclude_patterns.
+    Returns `path_filter`, or a PathFilter built from the gitignore-style exclude_patterns.
     """
+    if path_filter is not None:
+        return path_filter
     if exclude_patterns is None:
         exclude_patterns = ['test', 'tests', 'spec']
-    
-    filtered_lines = []
-    skip_file = False
-    for line in diff.splitlines():
-        if line.startswith("diff --git"):
-            # Determine file name from header line
-            parts = line.split()
-            if len(parts) >= 3:
-                file_a = parts[2]  # expected format: "a/path/to/file"
-                filename = file_a[2:] if file_a.startswith("a/") else file_a
-                # If any pattern is found in filename, mark to skip this file block
-                skip_file = any(pat.strip().lower() in filename.lower() for pat in exclude_patterns)
-            else:
-                skip_file = False
-            # Only add the header if this block is not to be skipped
-            if not skip_file:
-                filtered_lines.append(line)
-        else:
-            if not skip_file:
-                filtered_lines.append(line)
-    return "\n".join(filtered_lines)
+    return PathFilter(exclude_patterns, skip_generated=False)
 
-def split_diff_intelligent(diff, max_lines=1000):
+def iter_filtered(file_diffs, exclude_patterns=None, path_filter=None):
+    """
+    Streaming counterpart of filter_diff over an iterable of FileDiff objects.
+    """
+    keep = _path_filter(exclude_patterns, path_filter).keep
+    return (file_diff for file_diff in file_diffs if keep(file_diff))
+
+def filter_diff(diff, exclude_patterns=None, path_filter=None):
+    """
+    Filters the diff to exclude entire file blocks matching any exclude pattern
+    (gitignore-style, see path_filter), or rejected by `path_filter` when given.
+    A file block (including its header) is removed when its old or new path matches.
+
+    Accepts diff text or a DiffIndex and returns the same kind. Text is filtered
+    while it is parsed, so excluded files are never tokenized.
+    """
+    path_filter = _path_filter(exclude_patterns, path_filter)
+    if isinstance(diff, DiffIndex):
+        return diff.select(path_filter.keep)
+    file_diffs = iter_file_diffs(split_lines(diff), skip=path_filter.skips_path)
+    return DiffIndex(iter_filtered(file_diffs, path_filter=path_filter)).text()
+
+def split_diff_intelligent(diff, max_lines=1000, annotate=False):
     """
     Splits the diff into file blocks and subdivides blocks that exceed max_lines.
     Assumes each file diff block starts with "diff --git".
+
+    Accepts diff text or a DiffIndex; with `annotate=True` the blocks are annotated
+    with line numbers (see preprocess_diff_with_line_numbers).
     """
-    blocks = re.split(r'(?=^diff --git)', diff, flags=re.MULTILINE)
+    index = diff if isinstance(diff, DiffIndex) else DiffIndex.parse(diff)
     chunks = []
-    for block in blocks:
-        if not block.strip():
+    for file_diff in index:
+        lines = list(file_diff.annotated_lines() if annotate else file_diff.lines())
+        if not any(line.strip() for line in lines):
             continue
-        lines = block.splitlines()
         if len(lines) <= max_lines:
-            chunks.append(block)
+            chunks.append("\n".join(lines))
         else:
             for i in range(0, len(lines), max_lines):
-                sub_block = "\n".join(lines[i:i+max_lines])
-                chunks.append(sub_block)
+                chunks.append("\n".join(lines[i:i+max_lines]))
     return chunks
 
+def _file_pieces(file_diff, available, annotate, encoding=None):
+    """
+    Cuts one file block into pieces of at most `available` tokens, splitting only
+    between hunks. Each piece repeats the file header so the LLM knows which file
+    it is reading. A single hunk larger than the budget is cut between lines as a
+    last resort, repeating its hunk header.
+    Hunks are rendered by `encoding` (a CompactEncoding) when given.
+    Yields (lines, tokens) tuples.
+    """
+    header = list(file_diff.header)
+    header_tokens = estimate_lines_tokens(header)
+    piece, piece_tokens = list(header), header_tokens
+    has_hunk = False
+
+    for hunk in file_diff.hunks:
+        if encoding is not None:
+            hunk_lines = encoding.hunk_lines(hunk)
+        else:
+            hunk_lines = list(hunk.annotated_lines() if annotate else [hunk.header] + hunk.lines)
+        hunk_tokens = estimate_lines_tokens(hunk_lines)
+        if has_hunk and piece_tokens + hunk_tokens > available:
+            yield piece, piece_tokens
+            piece, piece_tokens, has_hunk = list(header), header_tokens, False
+
+        if header_tokens + hunk_tokens <= available:
+            piece.extend(hunk_lines)
+            piece_tokens += hunk_tokens
+            has_hunk = True
+            continue
+
+        # Oversized hunk: fill pieces line by line
+        hunk_header, body = hunk_lines[0], hunk_lines[1:]
+        prefix = header + [hunk_header]
+        piece, piece_tokens = list(prefix), estimate_lines_tokens(prefix)
+        for line in body:
+            line_tokens = estimate_lines_tokens([line]) + 1
+            if len(piece) > len(prefix) and piece_tokens + line_tokens > available:
+                yield piece, piece_tokens
+                piece, piece_tokens = list(prefix), estimate_lines_tokens(prefix)
+            piece.append(line)
+            piece_tokens += line_tokens
+        yield piece, piece_tokens
+        piece, piece_tokens, has_hunk = list(header), header_tokens, False
+
+    if has_hunk or not file_diff.hunks:
+        yield piece, piece_tokens
+
+def is_chunk_anchor(path):
+    """
+    Tells whether a chunk ends after the file at `path`. It depends on the path
+    alone, so chunk boundaries do not move with the size of the other files.
+    """
+    return zlib.crc32(path.encode("utf-8")) % CHUNK_ANCHOR_EVERY == 0
+
+def iter_packed_chunks(file_diffs, token_budget, overhead_tokens=0, annotate=True, encoding=None):
+    """
+    Streaming counterpart of pack_diff_chunks over an iterable of FileDiff objects.
+
+    File pieces are packed in diff order (path order for git) into one chunk at a
+    time, which is yielded as soon as the next piece does not fit, or after an
+    anchor file (see is_chunk_anchor). This keeps memory bounded and lets the first
+    chunks reach the LLM while the rest of the diff is still being read. A change
+    to one file moves chunk boundaries at most up to the next anchor, so the
+    other chunks, and their review cache and checkpoint entries, stay the same.
+    `encoding` (a CompactEncoding) replaces the annotated rendering of the hunks.
+    """
+    available = max(token_budget - overhead_tokens, 1)
+
+    chunk, chunk_tokens = [], 0
+    for file_diff in file_diffs:
+        for lines, tokens in _file_pieces(file_diff, available, annotate, encoding):
+            if not any(line.strip() for line in lines):
+                continue
+            # Joining two blocks costs one extra newline
+            if chunk and chunk_tokens + tokens + 1 > available:
+                yield "\n".join(chunk)
+                chunk, chunk_tokens = [], 0
+            chunk_tokens += tokens + 1 if chunk else tokens
+            chunk.extend(lines)
+        if chunk and file_diff.path and is_chunk_anchor(file_diff.path):
+            yield "\n".join(chunk)
+            chunk, chunk_tokens = [], 0
+
+    if chunk:
+        yield "\n".join(chunk)
+
+def pack_diff_chunks(diff, token_budget, overhead_tokens=0, annotate=True, encoding=None):
+    """
+    Packs file blocks into chunks so that each LLM request (prompt overhead + chunk)
+    stays within `token_budget` tokens.
+
+    Small files are packed together in diff order, with stable boundaries (see
+    iter_packed_chunks); files larger than the budget are split at hunk boundaries
+    (see _file_pieces). Accepts diff text or a DiffIndex and returns the list of
+    chunk strings.
+    """
+    index = diff if isinstance(diff, DiffIndex) else DiffIndex.parse(diff)
+    return list(iter_packed_chunks(index, token_budget, overhead_tokens, annotate, encoding=encoding))
+
 def preprocess_diff_with_line_numbers(diff):
     """
     Processes a unified diff by annotating it with the new file's line numbers.
@@ -100,36 +400,9 @@ def preprocess_diff_with_line_numbers(diff):
     - For context lines (starting with ' ') and added lines (starting with '+'),
       prefixes the line with "Line <number>:" and increments the counter.
     - For removed lines (starting with '-'), annotates with "[REMOVED]" (without incrementing).
-    - Hunk headers are preserved.
+    - Hunk and file headers are preserved.
     
-    Returns the annotated diff as a string.
-    """
-    lines = diff.splitlines()
-    processed_lines = []
-    new_line_number = None
-    hunk_header_pattern = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
-
-    for line in lines:
-        if line.startswith('@@'):
-            match = hunk_header_pattern.match(line)
-            if match:
-                new_line_number = int(match.group(1))
-            processed_lines.append(line)
-        elif new_line_number is not None:
-            if line.startswith(' '):
-                annotated_line = f"Line {new_line_number}: {line[1:]}"
-                processed_lines.append(annotated_line)
-                new_line_number += 1
-            elif line.startswith('+'):
-                annotated_line = f"Line {new_line_number}: {line[1:]}"
-                processed_lines.append(annotated_line)
-                new_line_number += 1
-            elif line.startswith('-'):
-                annotated_line = f"[REMOVED] {line[1:]}"
-                processed_lines.append(annotated_line)
-            else:
-                processed_lines.append(line)
-        else:
-            processed_lines.append(line)
-    
-    return "\n".join(processed_lines)
\ No newline at end of file
+    Accepts diff text or a DiffIndex and returns the annotated diff as a string.
+    """
+    index = diff if isinstance(diff, DiffIndex) else DiffIndex.parse(diff)
+    return index.annotated()
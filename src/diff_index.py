@@ -0,0 +1,597 @@
+import re
+from array import array
+from bisect import bisect_left
+
+HUNK_HEADER_PATTERN = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+DIFF_HEADER_PATTERN = re.compile(r'^diff --git a/(.*) b/(.*)$')
+# A line reference as written by the LLM: "40" or a range "40-45"
+LINE_RANGE_PATTERN = re.compile(r'^\s*(\d+)\s*(?:-\s*(\d+)\s*)?$')
+
+def parse_line_range(value):
+    """
+    Parses a line reference ("40", 40 or "40-45") into (start, end), or None.
+    """
+    match = LINE_RANGE_PATTERN.match(str(value))
+    if not match:
+        return None
+    start = int(match.group(1))
+    end = int(match.group(2) or start)
+    return (start, end) if end >= start else None
+
+def split_lines(text):
+    """
+    Splits diff text into lines on "\n" only, the way diff positions count them
+    (str.splitlines also breaks on "\r" and other separators found inside lines).
+    A CRLF line ending loses its "\r".
+    """
+    lines = text.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+def placement_key(comment):
+    """
+    Identifies a {"file", "line"} comment by what its placement depends on, to
+    reuse placements computed earlier (see DiffIndex.resolve_comments).
+    """
+    return comment.get("file"), str(comment.get("line", "")).strip()
+
+class Hunk:
+    """
+    A single "@@" hunk of a file diff.
+
+    `position` is the GitHub diff position of the hunk header itself: 0 for the first
+    hunk of a file, and the following lines are numbered from there.
+    """
+    __slots__ = ("header", "old_start", "old_count", "new_start", "new_count", "lines", "position")
+
+    def __init__(self, header, old_start, old_count, new_start, new_count, position):
+        self.header = header
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.lines = []
+        self.position = position
+
+    @property
+    def new_end(self):
+        return self.new_start + max(self.new_count, 1) - 1
+
+    def annotated_lines(self):
+        """
+        Yields the hunk lines prefixed with the new file's line numbers (see
+        preprocess_diff_with_line_numbers).
+        """
+        yield self.header
+        new_line = self.new_start
+        for line in self.lines:
+            if line.startswith(' ') or line.startswith('+'):
+                yield f"Line {new_line}: {line[1:]}"
+                new_line += 1
+            elif line.startswith('-'):
+                yield f"[REMOVED] {line[1:]}"
+            else:
+                yield line
+
+class CompactEncoding:
+    """
+    Compact rendering of hunks for the LLM, an alternative to Hunk.annotated_lines
+    that spends fewer tokens on the same changes:
+
+    - "12:+text" / "12: text" instead of "Line 12: text" (the diff marker is kept);
+    - only `context` lines of context around each change ("..." marks a cut; a
+      negative value keeps them all);
+    - at most `removed` lines of each removed block, the rest counted in a
+      "-[N more removed lines]" line (a negative value keeps them all);
+    - with `collapse_whitespace`, a block whose lines only changed whitespace
+      becomes a single "12-14:~[whitespace-only change]" line.
+
+    Hunk headers and line numbers are kept, so comments resolve against the
+    original diff exactly as with the annotated rendering. `saved_chars` adds up
+    the characters saved compared to it.
+    """
+
+    def __init__(self, context=1, removed=3, collapse_whitespace=True):
+        self.context = context
+        self.removed = removed
+        self.collapse_whitespace = collapse_whitespace
+        self.saved_chars = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Returns the encoding configured by DIFF_ENCODING="compact", or None for the
+        default annotated rendering.
+        """
+        if getattr(config, "DIFF_ENCODING", "annotated") != "compact":
+            return None
+        return cls(
+            context=getattr(config, "DIFF_COMPACT_CONTEXT", 1),
+            removed=getattr(config, "DIFF_COMPACT_REMOVED_LINES", 3),
+            collapse_whitespace=getattr(config, "DIFF_COMPACT_WHITESPACE", True),
+        )
+
+    def hunk_lines(self, hunk):
+        """
+        Returns the compact lines of `hunk`, header first.
+        """
+        items = self._items(hunk)
+        keep = self._kept_context(items)
+        out = [hunk.header]
+        cut = False
+        for i, (kind, new_line, value) in enumerate(items):
+            if kind == " " and i not in keep:
+                cut = True
+                continue
+            if cut and len(out) > 1:
+                out.append("...")
+            cut = False
+            if kind in (" ", "+"):
+                out.append(f"{new_line}:{kind}{value}")
+            elif kind == "-":
+                shown = value if self.removed < 0 else value[:self.removed]
+                out.extend(shown)
+                hidden = len(value) - len(shown)
+                if hidden:
+                    more = " more" if shown else ""
+                    out.append(f"-[{hidden}{more} removed line{'s' if hidden != 1 else ''}]")
+            elif kind == "~":
+                span = f"{new_line}-{new_line + value - 1}" if value > 1 else f"{new_line}"
+                out.append(f"{span}:~[whitespace-only change]")
+            else:
+                out.append(value)
+
+        self.saved_chars += _annotated_chars(hunk) - (sum(len(line) for line in out) + len(out) - 1)
+        return out
+
+    def _items(self, hunk):
+        """
+        Splits the hunk lines into (kind, new line, value) items: " " context,
+        "+" added, "-" a block of removed lines, "~" a whitespace-only block
+        (value: its number of lines) and "" anything else.
+        """
+        items = []
+        lines = hunk.lines
+        new_line = hunk.new_start
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            if line.startswith('-'):
+                j = i
+                while j < len(lines) and lines[j].startswith('-'):
+                    j += 1
+                k = j
+                while k < len(lines) and lines[k].startswith('+'):
+                    k += 1
+                removed, added = lines[i:j], lines[j:k]
+                if (self.collapse_whitespace and len(removed) == len(added)
+                        and all(r[1:].split() == a[1:].split() for r, a in zip(removed, added))):
+                    if items and items[-1][0] == "~":
+                        # Extend the block just before (alternating -/+ pairs)
+                        items[-1] = ("~", items[-1][1], items[-1][2] + len(added))
+                    else:
+                        items.append(("~", new_line, len(added)))
+                    new_line += len(added)
+                    i = k
+                else:
+                    items.append(("-", None, removed))
+                    i = j
+                continue
+            if line.startswith('+') or line.startswith(' '):
+                items.append((line[0], new_line, line[1:]))
+                new_line += 1
+            else:
+                items.append(("", None, line))
+            i += 1
+        return items
+
+    def _kept_context(self, items):
+        context = [i for i, item in enumerate(items) if item[0] == " "]
+        changes = [i for i, item in enumerate(items) if item[0] in ("+", "-", "~")]
+        if self.context < 0 or not changes:
+            return set(context)
+        keep = set()
+        for i in changes:
+            # Context lines next to a change, up to `context` on each side
+            for direction in (-1, 1):
+                j, taken = i + direction, 0
+                while 0 <= j < len(items) and taken < self.context and items[j][0] == " ":
+                    keep.add(j)
+                    j += direction
+                    taken += 1
+        return keep
+
+def _annotated_chars(hunk):
+    """
+    Length of the annotated rendering of `hunk` (see Hunk.annotated_lines), computed
+    without building it.
+    """
+    chars = len(hunk.header)
+    new_line = hunk.new_start
+    for line in hunk.lines:
+        if line.startswith(' ') or line.startswith('+'):
+            chars += len(line) + 6 + len(str(new_line))
+            new_line += 1
+        elif line.startswith('-'):
+            chars += len(line) + 9
+        else:
+            chars += len(line)
+    return chars + len(hunk.lines)
+
+class FileDiff:
+    """
+    The diff of one file: its "diff --git" header block and its hunks, plus the
+    commentable lines of the new file.
+
+    Commentable lines are kept in three parallel arrays sorted by line number
+    (`new_lines`, `positions`, `hunk_ids`): the new-file line, its GitHub diff
+    position and the index of its hunk. A lookup is a binary search, and the arrays
+    stay compact even for very large files.
+
+    A block without a "diff --git" header (text preceding the first file) has path None.
+    """
+    __slots__ = ("path", "old_path", "header", "hunks", "new_lines", "positions", "hunk_ids",
+                 "_position", "_new_line")
+
+    def __init__(self, path=None, old_path=None):
+        self.path = path
+        self.old_path = old_path
+        self.header = []
+        self.hunks = []
+        self.new_lines = array("l")
+        self.positions = array("l")
+        self.hunk_ids = array("l")
+        self._position = None
+        self._new_line = None
+
+    def _add_line(self, line):
+        if line.startswith('@@'):
+            match = HUNK_HEADER_PATTERN.match(line)
+            if match:
+                self._position = 0 if self._position is None else self._position + 1
+                self._new_line = int(match.group(3))
+                self.hunks.append(Hunk(
+                    line,
+                    int(match.group(1)),
+                    int(match.group(2)) if match.group(2) is not None else 1,
+                    self._new_line,
+                    int(match.group(4)) if match.group(4) is not None else 1,
+                    self._position,
+                ))
+                return
+
+        if not self.hunks:
+            self.header.append(line)
+            if line.startswith("--- ") and line[4:].strip() != "/dev/null":
+                self.old_path = _strip_prefix(line[4:], "a/")
+            elif line.startswith("+++ ") and line[4:].strip() != "/dev/null":
+                self.path = _strip_prefix(line[4:], "b/")
+            elif line.startswith("rename to "):
+                self.path = line[len("rename to "):]
+            return
+
+        # Every line after the first hunk header advances the diff position
+        self._position += 1
+        self.hunks[-1].lines.append(line)
+        if line.startswith(' ') or line.startswith('+'):
+            self._add_position(self._new_line, self._position, len(self.hunks) - 1)
+            self._new_line += 1
+
+    def _add_position(self, new_line, position, hunk_id):
+        lines = self.new_lines
+        if not lines or new_line > lines[-1]:
+            lines.append(new_line)
+            self.positions.append(position)
+            self.hunk_ids.append(hunk_id)
+            return
+        # Hunks out of order (hand-edited diffs): keep the arrays sorted, last one wins
+        i = bisect_left(lines, new_line)
+        if lines[i] == new_line:
+            self.positions[i] = position
+            self.hunk_ids[i] = hunk_id
+        else:
+            lines.insert(i, new_line)
+            self.positions.insert(i, position)
+            self.hunk_ids.insert(i, hunk_id)
+
+    def with_hunks(self, hunks):
+        """
+        Returns a copy of this file restricted to `hunks`, keeping the diff positions
+        of the full file so comments still resolve against the complete diff.
+        """
+        copy = FileDiff(self.path, self.old_path)
+        copy.header = self.header
+        copy.hunks = list(hunks)
+        copy.new_lines = self.new_lines
+        copy.positions = self.positions
+        copy.hunk_ids = self.hunk_ids
+        return copy
+
+    def restrict_to(self, changes):
+        """
+        Returns a copy holding only the hunks that contain a line changed by
+        `changes` (a FileDiff of the same file), or None if no hunk is touched.
+        """
+        if changes is None:
+            return None
+        changed = changes.changed_lines()
+        hunks = [
+            hunk for hunk in self.hunks
+            if any(hunk.new_start <= line <= hunk.new_end for line in changed)
+        ]
+        return self.with_hunks(hunks) if hunks else None
+
+    def release_lines(self):
+        """
+        Drops the text of the hunks once they have been chunked, keeping hunk
+        ranges and diff positions so comments can still be resolved.
+        """
+        for hunk in self.hunks:
+            hunk.lines = []
+
+    def changed_lines(self):
+        """
+        Returns the new-file line numbers touched by this diff: added lines, and the
+        line following each removal.
+        """
+        changed = set()
+        for hunk in self.hunks:
+            new_line = hunk.new_start
+            for line in hunk.lines:
+                if line.startswith('+'):
+                    changed.add(new_line)
+                    new_line += 1
+                elif line.startswith('-'):
+                    changed.add(new_line)
+                elif line.startswith(' '):
+                    new_line += 1
+        return changed
+
+    def _index(self, line_number):
+        i = bisect_left(self.new_lines, line_number)
+        if i < len(self.new_lines) and self.new_lines[i] == line_number:
+            return i
+        return None
+
+    def position(self, line_number):
+        """
+        Returns the diff position of a new-file line number, or None if the line is not in the diff.
+        """
+        i = self._index(line_number)
+        return None if i is None else self.positions[i]
+
+    def hunk_of(self, line_number):
+        """
+        Returns the index of the hunk holding a new-file line number, or None if
+        the line cannot be commented on.
+        """
+        i = self._index(line_number)
+        return None if i is None else self.hunk_ids[i]
+
+    def nearest_line(self, line_number, max_distance=None):
+        """
+        Returns the commentable line closest to `line_number` (the line itself when
+        it is in the diff; the earlier one on a tie), or None when there is none
+        within `max_distance` lines.
+        """
+        lines = self.new_lines
+        i = bisect_left(lines, line_number)
+        candidates = [lines[j] for j in (i - 1, i) if 0 <= j < len(lines)]
+        if not candidates:
+            return None
+        nearest = min(candidates, key=lambda line: (abs(line - line_number), line))
+        if max_distance is not None and abs(nearest - line_number) > max_distance:
+            return None
+        return nearest
+
+    def resolve(self, start, end=None, max_distance=None):
+        """
+        Places a comment on `start`..`end` (new-file lines), snapping lines outside
+        the diff to the nearest commentable one (see nearest_line). GitHub requires
+        both ends of a multi-line comment in the same hunk, so the range is clipped
+        to the hunk of its last line.
+
+        Returns {"line", "position"} plus "start_line" for a range, or None when no
+        commentable line is close enough.
+        """
+        end = start if end is None else end
+        line = self.nearest_line(end, max_distance)
+        if line is None and end != start:
+            line = self.nearest_line(start, max_distance)
+        if line is None:
+            return None
+        i = self._index(line)
+        placement = {"line": line, "position": self.positions[i]}
+        if end != start:
+            # First commentable line of the same hunk at or after `start`
+            j = bisect_left(self.new_lines, start)
+            while j < i and self.hunk_ids[j] != self.hunk_ids[i]:
+                j += 1
+            if j < i:
+                placement["start_line"] = self.new_lines[j]
+        return placement
+
+    def lines(self):
+        """
+        Yields the raw diff lines of this file.
+        """
+        yield from self.header
+        for hunk in self.hunks:
+            yield hunk.header
+            yield from hunk.lines
+
+    def annotated_lines(self):
+        """
+        Yields the diff lines of this file annotated with new-file line numbers.
+        """
+        yield from self.header
+        for hunk in self.hunks:
+            yield from hunk.annotated_lines()
+
+    def text(self):
+        return "\n".join(self.lines())
+
+    def annotated(self):
+        return "\n".join(self.annotated_lines())
+
+def _strip_prefix(path, prefix):
+    # "+++ b/path\t2024-01-01 ..." style headers may carry a timestamp after a tab
+    path = path.split('\t', 1)[0]
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+def iter_file_diffs(lines, skip=None):
+    """
+    Parses an iterable of unified diff lines and yields one FileDiff per file,
+    each as soon as the next file header (or the end of input) is reached.
+
+    `skip(path, old_path)` is called on each "diff --git" header; the lines of the
+    files it rejects are dropped without being parsed.
+    """
+    current = None
+    skipping = False
+    for line in lines:
+        if line.startswith("diff --git"):
+            if current is not None:
+                yield current
+            current = None
+            match = DIFF_HEADER_PATTERN.match(line)
+            skipping = bool(match and skip is not None and skip(match.group(2), match.group(1)))
+            if skipping:
+                continue
+            if match:
+                current = FileDiff(match.group(2), match.group(1))
+            else:
+                current = FileDiff()
+            current.header.append(line)
+            continue
+        if skipping:
+            continue
+        if current is None:
+            current = FileDiff()
+        current._add_line(line)
+    if current is not None:
+        yield current
+
+def iter_restricted(file_diffs, changes):
+    """
+    Yields the files of `file_diffs` restricted to the hunks touched by `changes`
+    (a DiffIndex), skipping files it does not touch. See FileDiff.restrict_to.
+    """
+    for file_diff in file_diffs:
+        if file_diff.path is None:
+            continue
+        restricted = file_diff.restrict_to(changes.get(file_diff.path))
+        if restricted is not None:
+            yield restricted
+
+def iter_indexed(file_diffs, index, release=False):
+    """
+    Passes `file_diffs` through while adding each of them to `index`.
+
+    With `release=True`, the text of each file is dropped (see FileDiff.release_lines)
+    as soon as the consumer asks for the next one, so a streaming pipeline only holds
+    the positions of past files in memory.
+    """
+    previous = None
+    for file_diff in file_diffs:
+        if previous is not None and release:
+            previous.release_lines()
+        index.add(file_diff)
+        previous = file_diff
+        yield file_diff
+    if previous is not None and release:
+        previous.release_lines()
+
+class DiffIndex:
+    """
+    Structured view of a unified diff, built in a single pass: files -> hunks -> line maps.
+
+    Lets every stage of the pipeline share one tokenization of the diff, and resolves
+    (file, new line) to a GitHub diff position with a dictionary lookup of the file,
+    then a binary search of its sorted line array (see FileDiff.position).
+    """
+
+    def __init__(self, files=None):
+        self.files = []
+        self._by_path = {}
+        for file_diff in files or []:
+            self.add(file_diff)
+
+    @classmethod
+    def parse(cls, diff):
+        """
+        Builds an index from diff text or from an iterable of diff lines.
+        """
+        if diff is None:
+            return cls()
+        lines = split_lines(diff) if isinstance(diff, str) else diff
+        return cls(iter_file_diffs(lines))
+
+    def add(self, file_diff):
+        self.files.append(file_diff)
+        if file_diff.path is not None:
+            self._by_path[file_diff.path] = file_diff
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def paths(self):
+        return [f.path for f in self.files if f.path is not None]
+
+    def get(self, path):
+        return self._by_path.get(path)
+
+    def position(self, path, line_number):
+        """
+        Returns the diff position for `line_number` of `path`, or None if it is not in the diff.
+        """
+        file_diff = self._by_path.get(path)
+        if file_diff is None:
+            return None
+        return file_diff.position(line_number)
+
+    def resolve_comments(self, comments, max_distance=None):
+        """
+        Places a batch of {"file", "line"} comments in one pass, grouped by file so
+        each file is looked up once. "line" may be a number or a range ("40-45").
+        Returns one placement per comment (see FileDiff.resolve), None for those
+        that cannot be placed.
+        """
+        placements = [None] * len(comments)
+        by_file = {}
+        for i, comment in enumerate(comments):
+            by_file.setdefault(comment.get("file"), []).append(i)
+        for path, indices in by_file.items():
+            file_diff = self._by_path.get(path)
+            if file_diff is None:
+                continue
+            for i in indices:
+                line_range = parse_line_range(comments[i].get("line", ""))
+                if line_range is not None:
+                    placements[i] = file_diff.resolve(*line_range, max_distance=max_distance)
+        return placements
+
+    def select(self, predicate):
+        """
+        Returns a new index holding only the files for which `predicate(file_diff)` is true.
+        """
+        return DiffIndex(f for f in self.files if predicate(f))
+
+    def restrict_to(self, changes):
+        """
+        Returns a new index holding only the hunks of this diff that contain a line
+        changed by `changes` (another DiffIndex over the same head, e.g. the diff of
+        the commits pushed since the last review). Files untouched by `changes` are dropped.
+        """
+        return DiffIndex(iter_restricted(self.files, changes))
+
+    def text(self):
+        return "\n".join(f.text() for f in self.files)
+
+    def annotated(self):
+        return "\n".join(f.annotated() for f in self.files)
@@ -0,0 +1,258 @@
+import logging
+import mmap
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import load_config
+from http_client import get_http_client
+import pr_context
+
+class TextLines:
+    """
+    Lines of a file held in memory.
+    """
+
+    def __init__(self, text):
+        self._lines = text.splitlines()
+
+    def __len__(self):
+        return len(self._lines)
+
+    def slice(self, start, end):
+        return self._lines[start:end]
+
+class MappedLines:
+    """
+    Lines of a large local file read through a memory map: only the offsets of the
+    line starts are kept in memory, and a slice decodes just the requested lines.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._starts = [0]
+        find = self._map.find
+        pos = find(b"\n")
+        while pos != -1:
+            self._starts.append(pos + 1)
+            pos = find(b"\n", pos + 1)
+        if self._starts[-1] == len(self._map):
+            self._starts.pop()
+
+    def __len__(self):
+        return len(self._starts)
+
+    def slice(self, start, end):
+        start, end = max(start, 0), min(end, len(self._starts))
+        if start >= end:
+            return []
+        stop = self._starts[end] if end < len(self._starts) else len(self._map)
+        return self._map[self._starts[start]:stop].decode("utf-8", errors="replace").splitlines()
+
+    def close(self):
+        self._map.close()
+
+def fetch_file_from_github(file_path, ref=None, api_url="https://api.github.com"):
+    """
+    Downloads the raw content of a file through the GitHub contents API at
+    `api_url` (config.GITHUB_API_URL, e.g. a GitHub Enterprise Server).
+    Requires REPOSITORY_GITHUB and GITHUB_TOKEN; raises on failure.
+    """
+    repo = pr_context.getenv("REPOSITORY_GITHUB")
+    token = os.getenv("GITHUB_TOKEN")
+    if not repo or not token:
+        raise ValueError("Environment variables REPOSITORY_GITHUB and GITHUB_TOKEN must be set.")
+
+    url = f"{api_url}/repos/{repo}/contents/{file_path}"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github.v3.raw"
+    }
+    params = {}
+    if ref:
+        params["ref"] = ref
+
+    response = get_http_client().get(url, headers=headers, params=params)
+    if response.status_code != 200:
+        raise Exception(f"Error retrieving file {file_path}: {response.status_code} - {response.text}")
+    return response.text
+
+class FileContentCache:
+    """
+    Per-run cache of file contents keyed by (path, ref).
+
+    Files are read from the local checkout when possible: straight from the working
+    tree when `ref` is the checked-out commit (memory-mapped above `mmap_threshold`
+    bytes), with `git show` when the commit exists locally, and from the GitHub
+    contents API at `api_url` otherwise. Each (path, ref) is read at most once.
+    close() releases the memory maps.
+    """
+
+    def __init__(self, local_root=None, mmap_threshold=1024 * 1024, max_workers=8,
+                 api_url="https://api.github.com"):
+        self.local_root = os.path.realpath(local_root) if local_root else None
+        self.api_url = api_url
+        self.mmap_threshold = mmap_threshold
+        self.max_workers = max_workers
+        self.reads = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._commits = {}
+        self._not_local = set()
+
+    def get_lines(self, path, ref=None):
+        """
+        Returns the lines of `path` at `ref` (see TextLines / MappedLines). Raises if the file cannot be read.
+        """
+        return self._get(path, ref, local_only=False)
+
+    def get_local_lines(self, path, ref=None):
+        """
+        Like get_lines, but only reads the local checkout: returns None instead of
+        downloading the file when it is not available locally.
+        """
+        return self._get(path, ref, local_only=True)
+
+    def _get(self, path, ref, local_only):
+        key = (path, ref)
+        entry = self._entries.get(key)
+        if entry is not None or (local_only and key in self._not_local):
+            return entry
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if key not in self._not_local:
+                    entry = self._load_local(path, ref)
+                if entry is None:
+                    if local_only:
+                        self._not_local.add(key)
+                        return None
+                    entry = TextLines(fetch_file_from_github(path, ref, self.api_url))
+                with self._lock:
+                    self._entries[key] = entry
+                    self.reads += 1
+        return entry
+
+    def close(self):
+        """
+        Unmaps the files read through memory maps and empties the cache.
+        """
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        for entry in entries.values():
+            if isinstance(entry, MappedLines):
+                entry.close()
+
+    def prefetch(self, paths, ref=None):
+        """
+        Loads every path concurrently; failures are logged and left to a later get_lines call.
+        """
+        missing = [p for p in dict.fromkeys(paths) if (p, ref) not in self._entries]
+        if not missing:
+            return
+
+        def load(path):
+            try:
+                self.get_lines(path, ref)
+            except Exception as e:
+                logging.warning("Unable to prefetch %s: %s", path, e)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(missing)))) as executor:
+            list(executor.map(pr_context.bind(load), missing))
+
+    def _load_local(self, path, ref):
+        local_path = self._local_path(path)
+        if local_path is not None:
+            commit = self._resolve_commit(ref)
+            if ref is None or (commit is not None and commit == self._resolve_commit("HEAD")):
+                if os.path.isfile(local_path):
+                    if os.path.getsize(local_path) >= self.mmap_threshold:
+                        return MappedLines(local_path)
+                    with open(local_path, "r", encoding="utf-8", errors="replace") as f:
+                        return TextLines(f.read())
+            elif commit is not None:
+                content = self._git_show(commit, path)
+                if content is not None:
+                    return TextLines(content)
+        return None
+
+    def _local_path(self, path):
+        if not self.local_root:
+            return None
+        full_path = os.path.realpath(os.path.join(self.local_root, path))
+        # Never read outside of the checkout (paths come from LLM output)
+        if os.path.commonpath([full_path, self.local_root]) != self.local_root:
+            return None
+        return full_path
+
+    def _resolve_commit(self, ref):
+        if ref is None:
+            return None
+        if ref not in self._commits:
+            try:
+                result = subprocess.run(
+                    ["git", "-C", self.local_root, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                )
+                self._commits[ref] = result.stdout.strip() if result.returncode == 0 else None
+            except OSError:
+                self._commits[ref] = None
+        return self._commits[ref]
+
+    def _git_show(self, commit, path):
+        try:
+            result = subprocess.run(
+                ["git", "-C", self.local_root, "show", f"{commit}:{path}"],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+        except OSError:
+            return None
+        if result.returncode != 0:
+            return None
+        return result.stdout.decode("utf-8", errors="replace")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def _new_cache(config):
+    config = config or load_config()
+    return FileContentCache(local_root=pr_context.getenv("GITHUB_WORKSPACE"),
+                            api_url=getattr(config, "GITHUB_API_URL", "https://api.github.com"))
+
+def get_file_cache(config=None):
+    """
+    Returns the file cache shared by the whole run, rooted at the GITHUB_WORKSPACE checkout if any,
+    downloading other files from config.GITHUB_API_URL (`config` defaults to load_config()).
+    A thread reviewing a pull request of the daemon (see pr_context) gets a cache of its own,
+    closed with the review (see close_file_cache).
+    """
+    global _cache
+    context = pr_context.current()
+    if context is not None:
+        if "_file_cache" not in context:
+            context["_file_cache"] = _new_cache(config)
+        return context["_file_cache"]
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = _new_cache(config)
+    return _cache
+
+def close_file_cache():
+    """
+    Closes and drops the cache returned by get_file_cache: the one of the pull
+    request reviewed by this thread, or the one of the run.
+    """
+    global _cache
+    context = pr_context.current()
+    if context is not None:
+        cache = context.pop("_file_cache", None)
+    else:
+        with _cache_lock:
+            cache, _cache = _cache, None
+    if cache is not None:
+        cache.close()
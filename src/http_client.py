@@ -0,0 +1,162 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from config import load_config
+
+# Status codes worth retrying: rate limiting and transient server errors
+# (llama.cpp answers 503 while all of its slots are busy or the model is loading)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Methods that can be sent twice without side effects; others (POST) are only
+# retried when the request never reached the server or was rate limited
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+class HttpClient:
+    """
+    Shared transport for every outbound call (GitHub API and LLM servers).
+
+    Keeps one pooled keep-alive connection set per host, applies a default timeout,
+    and retries connection errors, timeouts, 429/5xx responses and GitHub rate limits
+    with jittered exponential backoff, honouring Retry-After and X-RateLimit-Reset.
+
+    Non-idempotent requests (POST) may already have taken effect when a read times
+    out or a 5xx comes back, so they are only retried on connection failures and
+    rate limits, unless the caller passes idempotent=True.
+    """
+
+    def __init__(self, timeout=30, max_retries=3, backoff_base=1.0, max_retry_wait=60.0, pool_size=16):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_retry_wait = max_retry_wait
+        self.retries = 0
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, max_retries=None, idempotent=None, **kwargs):
+        """
+        Sends a request, retrying transient failures. Returns the last response
+        (callers still check its status) or raises the last requests exception.
+        `max_retries` overrides the client's setting for this request; `idempotent`
+        (by default, whether `method` is in IDEMPOTENT_METHODS) allows retrying
+        timeouts and 5xx responses.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= max_retries or not (idempotent or _not_sent(e)):
+                    raise
+                delay = self._backoff(attempt)
+                reason = str(e)
+            else:
+                delay = self._retry_delay(response, attempt, max_retries, idempotent)
+                if delay is None:
+                    return response
+                reason = f"HTTP {response.status_code}"
+                response.close()
+
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            logging.warning("%s %s failed (%s), retry %d/%d in %.1fs",
+                            method, url, reason, attempt, max_retries, delay)
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # "Full jitter" exponential backoff
+        return random.uniform(0, min(self.max_retry_wait, self.backoff_base * (2 ** attempt)))
+
+    def _retry_delay(self, response, attempt, max_retries, idempotent=True):
+        """
+        Returns how long to wait before retrying `response`, or None if it should be returned as is.
+        Only rate limits are retried for non-idempotent requests.
+        """
+        status = response.status_code
+        rate_limited = status == 429 or (
+            status == 403 and (
+                response.headers.get("X-RateLimit-Remaining") == "0"
+                or "Retry-After" in response.headers
+            )
+        )
+        if attempt >= max_retries or not (rate_limited or (idempotent and status in RETRY_STATUS_CODES)):
+            return None
+
+        delay = _retry_after_seconds(response.headers.get("Retry-After"))
+        if delay is None and response.headers.get("X-RateLimit-Remaining") == "0":
+            try:
+                delay = max(0.0, float(response.headers["X-RateLimit-Reset"]) - time.time()) + 1
+            except (KeyError, ValueError):
+                delay = None
+        if delay is None:
+            return self._backoff(attempt)
+        if delay > self.max_retry_wait:
+            logging.error("Rate limited for %.0fs, more than the %.0fs allowed; giving up.",
+                          delay, self.max_retry_wait)
+            return None
+        return delay
+
+def _not_sent(error):
+    """
+    True when `error` happened while connecting, i.e. before the request was sent.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # requests wraps urllib3's MaxRetryError, whose reason is the underlying error
+    cause = error.args[0] if error.args else None
+    return isinstance(getattr(cause, "reason", cause), NewConnectionError)
+
+def _retry_after_seconds(value):
+    """
+    Parses a Retry-After header given either in seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_http_client():
+    """
+    Returns the process-wide HttpClient, created on first use from the configuration.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = load_config()
+                _client = HttpClient(
+                    timeout=config.HTTP_TIMEOUT,
+                    max_retries=config.HTTP_MAX_RETRIES,
+                    backoff_base=config.HTTP_BACKOFF_BASE,
+                    max_retry_wait=config.HTTP_MAX_RETRY_WAIT,
+                    pool_size=max(16, config.LLM_MAX_CONCURRENCY),
+                )
+    return _client
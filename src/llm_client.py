@@ -2,36 +2,238 @@ import requests
 import logging
 import json
 import re
+from config import DEFAULT_PROMPT_FORMAT
+from http_client import get_http_client
+from llm_pool import get_endpoint_pool
+from diff_index import DiffIndex, LINE_RANGE_PATTERN
 
-def query_llm(diff_chunk, config, params=None):
+DEFAULT_PARAMS = {
+    "max_tokens": 900,
+    "temperature": 0.7,
+    # llama.cpp: reuse the KV cache of the common prompt prefix (the instructions)
+    "cache_prompt": True,
+}
+
+def query_llm(diff_chunk, config, params=None, cache=None):
     """
     Sends a diff chunk (embedded within a prompt) to the LLM server and returns the JSON response.
+    The prompt format follows config.LLM_PROMPT_FORMAT (see build_prompt).
+    The request is routed over the configured endpoints (see llm_pool.EndpointPool),
+    failing over to another endpoint when one is down or overloaded.
+    When a ReviewCache is given, an identical earlier request is answered from it without
+    calling the server, and successful responses are stored in it.
     """
     if params is None:
-        params = {
-            "max_tokens": 900,
-            "temperature": 0.7
-        }
+        params = dict(DEFAULT_PARAMS)
     
-    prompt = build_llm_prompt(diff_chunk)
+    prompt = build_prompt(diff_chunk, config)
     payload = {"prompt": prompt}
     payload.update(params)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(prompt, params, get_endpoint_pool(config).identity())
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
     
-    try:
-        response = requests.post(config.LLM_ENDPOINT, json=payload)
+    def request(url, last_attempt):
+        # Fail over to the next endpoint at once; retry only on the last one
+        response = get_http_client().post(
+            url, json=payload, timeout=getattr(config, "LLM_TIMEOUT", 300),
+            max_retries=None if last_attempt else 0, idempotent=True,
+        )
         response.raise_for_status()
         return response.json()
+
+    try:
+        result = get_endpoint_pool(config).call(request)
     except requests.exceptions.RequestException as e:
         logging.error("Error calling LLM: %s", e)
         return None
 
-def build_llm_prompt(diff):
+    if cache_key is not None:
+        cache.put(cache_key, result)
+    return result
+
+def query_llm_stream(diff_chunk, config, params=None, cache=None):
+    """
+    Streaming variant of query_llm for llama.cpp-style server-sent events endpoints.
+
+    Yields each review comment as soon as its JSON object is complete in the stream,
+    and closes the connection as soon as the "comments" array is closed, which makes
+    the server stop generating. Raises requests exceptions on transport errors.
+    """
+    if params is None:
+        params = dict(DEFAULT_PARAMS)
+    params = dict(params, stream=True)
+
+    # Comments are parsed as they arrive, which needs the single-list response format
+    prompt = build_llm_prompt(diff_chunk, compact=is_compact(config))
+    payload = {"prompt": prompt}
+    payload.update(params)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(prompt, params, get_endpoint_pool(config).identity())
+        cached = cache.get(cache_key)
+        if cached is not None:
+            parsed = extract_json_from_text(cached.get("content", ""))
+            yield from (parsed or {}).get("comments", [])
+            return
+
+    def request(url, last_attempt):
+        # Failover only happens until the stream starts; see EndpointPool.stream
+        response = get_http_client().post(
+            url, json=payload, stream=True, timeout=getattr(config, "LLM_TIMEOUT", 300),
+            max_retries=None if last_attempt else 0, idempotent=True,
+        )
+        try:
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            response.close()
+            raise
+        return response
+
+    parser = CommentStreamParser()
+    comments = []
+    # The endpoint stays busy until the stream is read or closed
+    with get_endpoint_pool(config).stream(request) as response:
+        for text in iter_sse_content(response):
+            for comment in parser.feed(text):
+                comments.append(comment)
+                yield comment
+            if parser.done:
+                break
+
+    if cache_key is not None and parser.done:
+        cache.put(cache_key, {"content": json.dumps({"comments": comments})})
+
+def iter_sse_content(response):
+    """
+    Yields the generated text pieces of a server-sent events completion stream.
+    Understands llama.cpp ("content"/"stop") and OpenAI-style ("choices") events.
+    """
+    for raw in response.iter_lines(decode_unicode=True):
+        if not raw or not raw.startswith("data:"):
+            continue
+        data = raw[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError:
+            logging.warning("Ignoring malformed stream event: %s", data[:200])
+            continue
+
+        text = event.get("content")
+        if text is None and event.get("choices"):
+            choice = event["choices"][0]
+            text = choice.get("text")
+            if text is None:
+                text = (choice.get("delta") or {}).get("content")
+        if text:
+            yield text
+        if event.get("stop"):
+            return
+
+class CommentStreamParser:
+    """
+    Incrementally extracts the objects of the "comments" array from JSON text
+    arriving in arbitrary pieces. Each character is scanned once, so messy or very
+    long outputs stay linear; `done` becomes True once the array is closed.
+    """
+    COMMENTS_ARRAY = re.compile(r'"comments"\s*:\s*\[')
+
+    def __init__(self):
+        self.done = False
+        self.found = False
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+
+    def feed(self, text):
+        """
+        Adds a piece of text and returns the list of comments completed by it.
+        """
+        if self.done:
+            return []
+        self._buffer += text
+        if not self.found:
+            match = self.COMMENTS_ARRAY.search(self._buffer)
+            if not match:
+                # Keep a tail long enough to match a key split across pieces
+                self._buffer = self._buffer[-64:]
+                return []
+            self.found = True
+            self._buffer = self._buffer[match.end():]
+            self._pos = 0
+
+        completed = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._object_start = pos
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    if char == ']':
+                        self.done = True
+                        break
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._object_start is not None:
+                        try:
+                            comment = json.loads(buffer[self._object_start:pos+1])
+                        except json.JSONDecodeError:
+                            comment = None
+                        if isinstance(comment, dict):
+                            completed.append(comment)
+                        self._object_start = None
+            pos += 1
+
+        # Drop consumed text, keeping an unfinished object
+        keep_from = self._object_start if self._object_start is not None else pos
+        self._buffer = buffer[keep_from:]
+        self._pos = pos - keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        return completed
+
+# How the compact diff encoding (see CompactEncoding) reads, for the prompts
+COMPACT_FORMAT_NOTE = (
+    'Lines read "N:+text" (added), "N: text" (unchanged) or "-text" (removed), N being the line '
+    'number in the new file. "..." marks omitted unchanged lines, "-[N more removed lines]" '
+    'omitted removed lines, and "N-M:~[whitespace-only change]" lines whose indentation or spacing alone changed.'
+)
+
+def is_compact(config):
+    return getattr(config, "DIFF_ENCODING", "annotated") == "compact"
+
+def build_llm_prompt(diff, compact=False):
     """
     Constructs the full prompt to send to the LLM by embedding the diff.
+    With `compact`, the prompt describes the compact diff encoding.
     """
+    format_note = f"\n{COMPACT_FORMAT_NOTE}" if compact else ""
     prompt = f"""
 You are an expert code reviewer specialized in identifying code issues.
-Below is a code diff with explicit line numbers. Please analyze the diff carefully and provide detailed, actionable feedback.
+Below is a code diff with explicit line numbers. Please analyze the diff carefully and provide detailed, actionable feedback.{format_note}
 **Important:** Use the provided line numbers exactly as shown and do not shift them.
 
 Your response should be in JSON format with the following structure:
@@ -52,10 +254,141 @@ Here is the diff:
 """
     return prompt.strip()
 
+# Instructions shared by every batched request. They never vary, and come before
+# anything that does, so servers caching prompt prefixes (llama.cpp "cache_prompt")
+# only evaluate them once.
+BATCHED_PROMPT_PREFIX = """
+You are an expert code reviewer specialized in identifying code issues.
+Below are the diffs of several files, each starting with a "diff --git a/<path> b/<path>" header. Lines are prefixed with their line number in the new file ("Line N:") or marked [REMOVED].
+Review each file carefully and provide detailed, actionable feedback.
+**Important:** Use the provided line numbers exactly as shown and do not shift them. Only comment on lines shown in the diff of the same file.
+
+Your response should be a single JSON object mapping each file path (the <path> of its header) to the list of comments on that file; leave files without remarks out:
+
+{
+  "files": {
+    "path/to/file": [
+      {"line": "exact line number or range (e.g., 42 or 40-45)", "comment": "Your feedback on this section."}
+    ]
+  }
+}
+
+Here are the diffs:
+""".strip()
+
+# Same instructions for the compact diff encoding
+COMPACT_BATCHED_PROMPT_PREFIX = BATCHED_PROMPT_PREFIX.replace(
+    'Lines are prefixed with their line number in the new file ("Line N:") or marked [REMOVED].',
+    COMPACT_FORMAT_NOTE,
+)
+
+def build_batched_prompt(diff, compact=False):
+    """
+    Constructs a prompt reviewing several file blocks at once, answered with
+    comments grouped by file (see parse_batched_response).
+    """
+    prefix = COMPACT_BATCHED_PROMPT_PREFIX if compact else BATCHED_PROMPT_PREFIX
+    return f"{prefix}\n{diff}"
+
+def prompt_format(config):
+    """
+    Returns the prompt format in use: config.LLM_PROMPT_FORMAT, "batched" or
+    "single" (DEFAULT_PROMPT_FORMAT when unset). Streaming always uses "single",
+    whose comments can be parsed as they arrive.
+    """
+    if getattr(config, "LLM_STREAM", False):
+        return "single"
+    return getattr(config, "LLM_PROMPT_FORMAT", DEFAULT_PROMPT_FORMAT)
+
+def build_prompt(diff, config):
+    """
+    Builds the prompt in the format given by prompt_format: build_batched_prompt
+    or build_llm_prompt.
+    """
+    if prompt_format(config) == "batched":
+        return build_batched_prompt(diff, compact=is_compact(config))
+    return build_llm_prompt(diff, compact=is_compact(config))
+
+def _resolve_path(path, paths):
+    """
+    Maps a file path written by the LLM to one of the batch's `paths`, or None.
+    """
+    if not isinstance(path, str):
+        return None
+    path = path.strip().strip("`")
+    if path in paths:
+        return path
+    for prefix in ("a/", "b/", "./"):
+        if path.startswith(prefix) and path[len(prefix):] in paths:
+            return path[len(prefix):]
+    # A bare file name is accepted when it designates a single file of the batch
+    matches = [p for p in paths if p.rsplit("/", 1)[-1] == path]
+    return matches[0] if len(matches) == 1 else None
+
+def _hunk_distance(ranges, line):
+    """
+    Returns how many lines `line` is away from the closest of the (first, last) hunk `ranges`.
+    """
+    return min((max(low - line, line - high, 0) for low, high in ranges), default=None)
+
+def parse_batched_response(text, diff, max_distance=0):
+    """
+    Demultiplexes a batched response into per-file comments and validates them
+    against `diff` (the text sent in the prompt): the file must be part of the
+    batch, the comment must have text, and its line (a number or a range such as
+    "40-45") must start or end within `max_distance` lines of a hunk of that file
+    (None: at any distance), as FileDiff.resolve will snap it there
+    (COMMENT_LINE_SNAP).
+
+    Also accepts the single-list {"comments": [...]} format, in case the model
+    ignores the requested schema. Returns ({path: [comments]}, rejected count),
+    or (None, 0) if no JSON can be extracted. Comments keep the usual
+    {"file", "line", "comment"} shape.
+    """
+    parsed = extract_json_from_text(text)
+    if not isinstance(parsed, dict):
+        return None, 0
+
+    ranges = {}
+    for file_diff in DiffIndex.parse(diff):
+        if file_diff.path is not None:
+            ranges.setdefault(file_diff.path, []).extend((h.new_start, h.new_end) for h in file_diff.hunks)
+
+    entries = []
+    files = parsed.get("files")
+    if isinstance(files, dict):
+        for path, comments in files.items():
+            for comment in comments if isinstance(comments, list) else [comments]:
+                entries.append((path, comment))
+    for comment in parsed.get("comments") or []:
+        entries.append((comment.get("file") if isinstance(comment, dict) else None, comment))
+
+    by_file = {}
+    rejected = 0
+    for path, comment in entries:
+        resolved = _resolve_path(path, ranges)
+        if resolved is None or not isinstance(comment, dict):
+            rejected += 1
+            continue
+        body = comment.get("comment")
+        match = LINE_RANGE_PATTERN.match(str(comment.get("line", "")))
+        if not isinstance(body, str) or not body.strip() or not match:
+            rejected += 1
+            continue
+        start = int(match.group(1))
+        end = int(match.group(2) or start)
+        distances = [d for d in (_hunk_distance(ranges[resolved], n) for n in (start, end)) if d is not None]
+        if end < start or not distances or (max_distance is not None and min(distances) > max_distance):
+            rejected += 1
+            continue
+        by_file.setdefault(resolved, []).append(dict(comment, file=resolved, line=match.group(0).strip()))
+    return by_file, rejected
+
 def extract_json_from_text(text):
     """
     Extracts a JSON object from a text string by locating the first '{' and the last '}'.
-    If that fails, it attempts to use regex to find a JSON block.
+    If that fails, it salvages the complete objects of the "comments" array in a single
+    linear scan (see CommentStreamParser), e.g. when the output was truncated.
     Returns the parsed dictionary if successful, otherwise None.
     """
     start = text.find('{')
@@ -67,17 +400,16 @@ def extract_json_from_text(text):
         except json.JSONDecodeError:
             pass
 
-    matches = re.findall(r'{.*}', text, re.DOTALL)
-    if matches:
-        try:
-            return json.loads(matches[-1])
-        except json.JSONDecodeError:
-            return None
+    parser = CommentStreamParser()
+    comments = parser.feed(text)
+    if parser.found:
+        return {"comments": comments}
     return None
 
 def adjust_line_number_from_diff(diff_chunk, reported_line):
     """
-    Adjusts the reported line number from the LLM based on hunk headers in the diff chunk.
+    Adjusts the reported line number from the LLM to the nearest line of the diff chunk
+    that can be commented on (see FileDiff.nearest_line).
     
     Args:
         diff_chunk (str): A diff segment (possibly containing multiple hunks).
@@ -86,30 +418,13 @@ def adjust_line_number_from_diff(diff_chunk, reported_line):
     Returns:
         int: The adjusted line number based on the diff information.
     """
-    hunk_regex = re.compile(r'@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
-    best_candidate = None
-    smallest_distance = None
-
-    for match in hunk_regex.finditer(diff_chunk):
-        start_new = int(match.group(1))
-        count_new = int(match.group(2)) if match.group(2) is not None else 1
-        end_new = start_new + count_new - 1
-        
-        if start_new <= reported_line <= end_new:
-            return reported_line
-        
-        if reported_line < start_new:
-            distance = start_new - reported_line
-            candidate = start_new
-        else:
-            distance = reported_line - end_new
-            candidate = end_new
-        
-        if smallest_distance is None or distance < smallest_distance:
-            smallest_distance = distance
-            best_candidate = candidate
-
-    return best_candidate if best_candidate is not None else reported_line
+    candidates = [
+        line for line in (f.nearest_line(reported_line) for f in DiffIndex.parse(diff_chunk))
+        if line is not None
+    ]
+    if not candidates:
+        return reported_line
+    return min(candidates, key=lambda line: (abs(line - reported_line), line))
 
 # For testing purposes
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import requests
+
+class Endpoint:
+    """
+    One LLM server of the pool, with its routing weight and health state.
+    """
+
+    def __init__(self, url, weight=1.0):
+        self.url = url
+        self.weight = weight
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.probing = False
+
+    def __repr__(self):
+        return f"Endpoint({self.url!r}, weight={self.weight})"
+
+def parse_endpoints(spec, default=None):
+    """
+    Parses a comma-separated list of "url" or "url|weight" entries into Endpoints.
+    Falls back to `default` (a single URL) when `spec` is empty.
+    """
+    endpoints = []
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, _, weight = entry.partition("|")
+        try:
+            weight = float(weight) if weight.strip() else 1.0
+        except ValueError:
+            logging.warning("Invalid weight in LLM endpoint %r; using 1.", entry)
+            weight = 1.0
+        if weight > 0:
+            endpoints.append(Endpoint(url.strip(), weight))
+    if not endpoints and default:
+        endpoints.append(Endpoint(default))
+    return endpoints
+
+class EndpointPool:
+    """
+    Routes LLM requests over several inference servers.
+
+    Each request goes to the healthy endpoint with the fewest outstanding requests
+    relative to its weight. Failures are tracked passively: after `failure_threshold`
+    consecutive failures an endpoint's circuit opens and it gets no traffic for
+    `cooldown` seconds, then a single probe request decides whether it closes again.
+    call() fails a request over to the other endpoints before giving up.
+    """
+
+    def __init__(self, endpoints, failure_threshold=3, cooldown=30.0, clock=time.monotonic):
+        if not endpoints:
+            raise ValueError("At least one LLM endpoint is required.")
+        self.endpoints = list(endpoints)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._slots = None
+
+    def limit(self, max_in_flight):
+        """
+        Caps the requests in flight over the whole pool, whatever the number of
+        reviews sharing it (e.g. a batch of pull requests); 0 removes the cap.
+        """
+        self._slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight and max_in_flight > 0 else None
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _available(self, endpoint, now):
+        if endpoint.open_until is None:
+            return True
+        # Half-open: once the cooldown is over, let a single probe through
+        return now >= endpoint.open_until and not endpoint.probing
+
+    def acquire(self, exclude=()):
+        """
+        Picks an endpoint not in `exclude` and counts a request on it, or returns
+        None when every endpoint has been excluded. When all remaining circuits are
+        open, the one closest to the end of its cooldown is used anyway, so a
+        fleet-wide blip does not drop requests.
+        """
+        with self._lock:
+            now = self.clock()
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if self._available(e, now)]
+            if healthy:
+                endpoint = min(healthy, key=lambda e: ((e.outstanding + 1) / e.weight, e.requests / e.weight))
+            else:
+                endpoint = min(candidates, key=lambda e: e.open_until)
+            if endpoint.open_until is not None:
+                endpoint.probing = True
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint, ok):
+        """
+        Ends a request started with acquire() and updates the endpoint's health.
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.probing = False
+            if ok:
+                endpoint.consecutive_failures = 0
+                if endpoint.open_until is not None:
+                    logging.info("LLM endpoint %s is back.", endpoint.url)
+                endpoint.open_until = None
+                return
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.open_until is not None or endpoint.consecutive_failures >= self.failure_threshold:
+                if endpoint.open_until is None:
+                    logging.warning("LLM endpoint %s failed %d times in a row; pausing it for %.0fs.",
+                                    endpoint.url, endpoint.consecutive_failures, self.cooldown)
+                endpoint.open_until = self.clock() + self.cooldown
+
+    def call(self, request):
+        """
+        Runs `request(url, last_attempt)` against the pool, failing over to the next
+        endpoint on requests exceptions (HTTP errors included, see raise_for_status;
+        4xx responses other than 429 are raised at once).
+        `last_attempt` is True when no other endpoint is left to try, so the caller
+        can keep its own retries for that case only. Returns the result of the first
+        successful call, or raises the last exception.
+        """
+        with self._slot():
+            endpoint, result = self._open(request)
+            self.release(endpoint, ok=True)
+            return result
+
+    @contextmanager
+    def stream(self, request):
+        """
+        Like call(), for a request returning an open streamed response: yields it,
+        and keeps the endpoint (and the slot of limit()) busy until the block exits,
+        so requests still generating count for routing and for the cap. A requests
+        exception while reading the stream counts as a failure of the endpoint.
+        """
+        with self._slot():
+            endpoint, response = self._open(request)
+            ok = True
+            try:
+                yield response
+            except requests.exceptions.RequestException:
+                ok = False
+                raise
+            finally:
+                response.close()
+                self.release(endpoint, ok=ok)
+
+    @contextmanager
+    def _slot(self):
+        slots = self._slots
+        if slots is None:
+            yield
+            return
+        with slots:
+            yield
+
+    def _open(self, request):
+        # Returns (endpoint, result) with the endpoint still counted as busy
+        tried = []
+        while True:
+            endpoint = self.acquire(exclude=tried)
+            tried.append(endpoint)
+            last_attempt = len(tried) == len(self.endpoints)
+            try:
+                result = request(endpoint.url, last_attempt)
+            except requests.exceptions.RequestException as e:
+                if _is_client_error(e):
+                    # The request itself is at fault; another server would refuse it too
+                    self.release(endpoint, ok=True)
+                    raise
+                self.release(endpoint, ok=False)
+                if last_attempt:
+                    raise
+                logging.warning("LLM endpoint %s failed (%s); failing over.", endpoint.url, e)
+                continue
+            except BaseException:
+                self.release(endpoint, ok=True)
+                raise
+            return endpoint, result
+
+    def identity(self):
+        """
+        Returns the URLs of the pool, sorted and comma-separated: what the review
+        cache is keyed by, so changing the servers (or the model they serve under
+        a new URL) misses the cache, while reweighting them does not.
+        """
+        return ",".join(sorted(e.url for e in self.endpoints))
+
+    def stats(self):
+        """
+        Returns {url: {"requests", "errors", "open"}} for the run report.
+        """
+        with self._lock:
+            return {
+                e.url: {"requests": e.requests, "errors": e.errors, "open": e.open_until is not None}
+                for e in self.endpoints
+            }
+
+def _is_client_error(error):
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_endpoint_pool(config):
+    """
+    Returns the process-wide pool for the endpoints configured in `config`
+    (LLM_ENDPOINTS, or the single LLM_ENDPOINT), so health state is shared by
+    every request of the run.
+    """
+    spec = getattr(config, "LLM_ENDPOINTS", "") or ""
+    key = (spec, config.LLM_ENDPOINT)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = EndpointPool(
+                    parse_endpoints(spec, default=config.LLM_ENDPOINT),
+                    failure_threshold=getattr(config, "LLM_FAILURE_THRESHOLD", 3),
+                    cooldown=getattr(config, "LLM_COOLDOWN", 30.0),
+                )
+                _pools[key] = pool
+    return pool
+
+def llm_concurrency(config):
+    """
+    Number of LLM requests kept in flight: LLM_MAX_CONCURRENCY per endpoint.
+    """
+    return max(1, int(getattr(config, "LLM_MAX_CONCURRENCY", 1))) * len(get_endpoint_pool(config))
@@ -1,87 +1,449 @@
 import logging
+import itertools
 import json
 from config import load_config
-from diff_extractor import get_diff_from_pr, filter_diff, preprocess_diff_with_line_numbers, split_diff_intelligent
-from llm_client import query_llm, extract_json_from_text, adjust_line_number_from_diff, build_llm_prompt
-from comment_publisher import post_comments
-import os
+from diff_extractor import diff_source, iter_diff_lines, get_diff_between, iter_filtered, iter_packed_chunks
+from diff_index import DiffIndex, CompactEncoding, iter_file_diffs, iter_restricted, iter_indexed, placement_key
+from path_filter import PathFilter
+from scheduler import ReviewBudget, rank_files, parse_path_weights, load_churn
+from llm_pool import get_endpoint_pool, llm_concurrency
+from llm_client import query_llm, query_llm_stream, extract_json_from_text, build_llm_prompt, build_prompt, prompt_format, parse_batched_response, is_compact
+from comment_publisher import post_comments, last_reviewed_sha, existing_comments
+from review_cache import ReviewCache
+from checkpoint import ReviewCheckpoint
+from dedup import deduplicate_comments, drop_existing
+from file_cache import close_file_cache, get_file_cache
+from semantic_chunks import drop_context_comments, iter_expanded
+from async_pipeline import run_pipeline
+from utils import estimate_tokens, CHARS_PER_TOKEN
+from metrics import RunMetrics, extract_token_counts
+from http_client import get_http_client
+import pr_context
+import time
+import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-def main():
-    # Load configuration and initialize logging
-    config = load_config()
-    if not config:
-        logging.error("Error loading configuration.")
-        return
-    logging.basicConfig(level=logging.INFO)
-    
-    # 1. Retrieve diff via GitHub API
-    logging.info("Retrieving diff for the pull request via GitHub API...")
-    diff = get_diff_from_pr()
-    if not diff:
-        logging.error("No diff retrieved. Check environment variables and permissions.")
+def review_chunk(chunk, config, index=0, total=None, cache=None, metrics=None, checkpoint=None):
+    """
+    Sends a single chunk to the LLM (or answers it from `cache`) and returns the list
+    of comments it produced. Any failure is logged and results in an empty list.
+    The call is recorded in `metrics` (RunMetrics) when given. `total` is the number
+    of chunks, None while the diff is still streamed.
+
+    With a ReviewCheckpoint, a chunk completed by an earlier run for the same head
+    commit is answered from it, and the comments of a successful review are recorded.
+    """
+    label = f"{index+1}/{total}" if total else str(index+1)
+    if checkpoint is not None:
+        done = checkpoint.get(chunk)
+        if done is not None:
+            logging.info("Chunk %s already reviewed by a previous run.", label)
+            return done
+
+    logging.info("Sending chunk %s to the LLM...", label)
+    if getattr(config, "LLM_STREAM", False):
+        return review_chunk_streaming(chunk, config, index, cache, metrics, checkpoint)
+
+    start = time.perf_counter()
+    response = query_llm(chunk, config, cache=cache)
+    elapsed = time.perf_counter() - start
+    response_content = response.get("content") if response is not None else None
+
+    def record(comments=0, error=None):
+        if metrics is not None:
+            metrics.record_llm_call(
+                index, elapsed, len(build_prompt(chunk, config)), len(response_content or ""),
+                *extract_token_counts(response), comments=comments, error=error,
+            )
+
+    if response is None:
+        logging.error("Error receiving LLM response for chunk %d.", index+1)
+        record(error="request failed")
+        return []
+
+    if response_content is None:
+        logging.error("LLM response for chunk %d is empty or malformed.", index+1)
+        record(error="malformed response")
+        return []
+
+    if prompt_format(config) == "batched":
+        # Comments come back grouped by file; keep only those matching the chunk
+        by_file, rejected = parse_batched_response(response_content, chunk, getattr(config, "COMMENT_LINE_SNAP", 10))
+        parsed_response = by_file
+        comments = [c for file_comments in (by_file or {}).values() for c in file_comments]
+        if rejected:
+            logging.warning("Chunk %d: %d invalid comment(s) dropped.", index+1, rejected)
+            if metrics is not None:
+                metrics.count("invalid_comments", rejected)
+    else:
+        parsed_response = extract_json_from_text(response_content)
+        comments = parsed_response.get("comments", []) if parsed_response is not None else []
+    if parsed_response is None:
+        logging.error("Unable to extract JSON from chunk %d.", index+1)
+
+    record(comments=len(comments), error=None if parsed_response is not None else "no JSON")
+    if checkpoint is not None and parsed_response is not None:
+        checkpoint.put(chunk, comments)
+    if comments:
+        logging.info("Chunk %d processed: %d comment(s) generated.", index+1, len(comments))
+    else:
+        logging.info("No comments generated for chunk %d.", index+1)
+    return comments
+
+def review_chunk_streaming(chunk, config, index=0, cache=None, metrics=None, checkpoint=None):
+    """
+    Streaming counterpart of review_chunk: comments are collected as the LLM emits
+    them, and those received before a transport error are kept.
+    """
+    comments = []
+    error = None
+    start = time.perf_counter()
+    try:
+        for comment in query_llm_stream(chunk, config, cache=cache):
+            comments.append(comment)
+    except requests.exceptions.RequestException as e:
+        logging.error("Error streaming LLM response for chunk %d: %s", index+1, e)
+        error = str(e)
+
+    if metrics is not None:
+        metrics.record_llm_call(
+            index, time.perf_counter() - start, len(build_llm_prompt(chunk, compact=is_compact(config))),
+            len(json.dumps(comments)), comments=len(comments), error=error,
+        )
+    if checkpoint is not None and error is None:
+        checkpoint.put(chunk, comments)
+
+    if comments:
+        logging.info("Chunk %d processed: %d comment(s) generated.", index+1, len(comments))
+    else:
+        logging.info("No comments generated for chunk %d.", index+1)
+    return comments
+
+def review_chunks(chunks, config, max_workers=None, cache=None, metrics=None, checkpoint=None):
+    """
+    Reviews chunks with at most `max_workers` LLM requests in flight
+    (defaults to config.LLM_MAX_CONCURRENCY per LLM endpoint).
+
+    `chunks` may be any iterable, including a generator still reading the diff:
+    a chunk is pulled only once a worker is free, so at most `max_workers` of
+    them are held at once, and a budget (ReviewBudget.admit) never admits a
+    chunk that would wait for a worker.
+
+    Returns one list of comments per chunk, in the same order as `chunks`.
+    A chunk that fails for any reason yields an empty list without affecting the others.
+    """
+    if max_workers is None:
+        max_workers = llm_concurrency(config)
+    max_workers = max(1, int(max_workers))
+    total = len(chunks) if hasattr(chunks, "__len__") else None
+    if total == 0:
+        return []
+    if total is not None:
+        max_workers = min(max_workers, total)
+
+    def collect(i, future):
+        try:
+            return future.result()
+        except Exception as e:
+            logging.error("Unexpected error while reviewing chunk %d: %s", i+1, e)
+            return []
+
+    futures = []
+    in_flight = set()
+    chunks = iter(chunks)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i in itertools.count():
+            # Wait for a free worker before pulling the next chunk, so that a
+            # generator (e.g. ReviewBudget.admit) decides on it as late as possible
+            if len(in_flight) >= max_workers:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            future = executor.submit(review_chunk, chunk, config, i, total, cache, metrics, checkpoint)
+            futures.append(future)
+            in_flight.add(future)
+    return [collect(i, future) for i, future in enumerate(futures)]
+
+def fetch_new_changes(config):
+    """
+    Looks up what changed since the head SHA recorded by the previous review.
+
+    Returns a (already_reviewed, changes) pair: `changes` is a DiffIndex of the
+    commits pushed since that review, or None when the whole pull request must be
+    reviewed (no previous review, or the incremental diff is unavailable).
+    """
+    head_sha = pr_context.getenv("HEAD_SHA")
+    if not head_sha:
+        return False, None
+    last_sha = last_reviewed_sha(config)
+    if not last_sha:
+        return False, None
+    if head_sha.startswith(last_sha) or last_sha.startswith(head_sha):
+        return True, None
+
+    incremental = get_diff_between(last_sha, head_sha, config)
+    if incremental is None:
+        logging.warning("No diff since %s; reviewing the whole pull request.", last_sha)
+        return False, None
+    logging.info("Incremental review since %s.", last_sha[:12])
+    return False, DiffIndex.parse(incremental)
+
+def _counted(items, metrics, name, size=None):
+    """
+    Passes `items` through, adding their number (or their total `size(item)`) to counter `name`.
+    """
+    for item in items:
+        metrics.count(name, size(item) if size is not None else 1)
+        yield item
+
+def _read_diff(config, failure):
+    """
+    Streams the diff lines from config.DIFF_SOURCE. An error of the diff source
+    ends the stream instead of the run: it is logged and kept in `failure["diff"]`,
+    and the files read so far are still reviewed.
+    """
+    try:
+        yield from iter_diff_lines(config)
+    except Exception as e:
+        logging.error("Error retrieving the diff: %s", e)
+        failure["diff"] = str(e)
+
+def _head_ref():
+    return pr_context.getenv("HEAD_SHA") or pr_context.getenv("GITHUB_HEAD_REF") or pr_context.getenv("GITHUB_REF")
+
+def prepare_comments(comments, diff_index, config, resolved):
+    """
+    Resolves `comments` against the diff into `resolved` (by placement_key, handed
+    to the publisher) and loads the files whose code is quoted around them
+    (COMMENT_CONTEXT_LINES), so publishing does not wait on either.
+    """
+    placements = diff_index.resolve_comments(comments, getattr(config, "COMMENT_LINE_SNAP", 10))
+    resolved.update(zip(map(placement_key, comments), placements))
+    if getattr(config, "COMMENT_CONTEXT_LINES", 0) <= 0:
         return
-    os.environ["LLM_DIFF_CONTENT"] = diff
-
-    
-    # Preprocess diff to add line numbers for clarity
-    diff_with_line_numbers = preprocess_diff_with_line_numbers(diff)
-    logging.info("Diff preprocessed with line numbers.")
-    
-    # Filter diff to exclude test files and other unwanted patterns
-    diff_filtered = filter_diff(diff_with_line_numbers, exclude_patterns=config.EXCLUDE_PATTERNS)
-    
-    # 2. Intelligently split diff into chunks (by file block or by number of lines)
-    chunks = split_diff_intelligent(diff_filtered, max_lines=1000)
-    logging.info("Diff split into %d chunk(s).", len(chunks))
-    
+    paths = [c.get("file") for c, placement in zip(comments, placements) if placement is not None]
+    if paths:
+        get_file_cache(config).prefetch(paths, _head_ref())
+
+def run_review(config, metrics):
+    """
+    Runs the review pipeline for the pull request described by the environment,
+    recording stage timings and sizes in `metrics`.
+    """
+    prompt_overhead = estimate_tokens(build_prompt("", config))
+    budget = ReviewBudget.from_config(config, overhead_tokens=prompt_overhead)
+
+    # Only review what changed since the previous review of this pull request;
+    # the (small) incremental diff is needed before the full diff is streamed
+    changes = None
+    if config.INCREMENTAL_REVIEW:
+        with metrics.stage("incremental") as stage:
+            already_reviewed, changes = fetch_new_changes(config)
+            stage["files"] = len(changes) if changes is not None else None
+        if already_reviewed:
+            logging.info("Head commit already reviewed; nothing to do.")
+            return
+
+    # 1. Stream the diff from the GitHub API or the local git checkout, file by file.
+    #    Every stage below is a generator, so only the files being chunked are held
+    #    in memory, and the first chunk reaches the LLM before the diff is fully read.
+    #    `diff_index` keeps the diff positions of every file for publishing. Each
+    #    stage is timed on its own (fetch, parse, filter, preprocess, split).
+    logging.info("Streaming diff for the pull request (source: %s)...", diff_source(config))
+    diff_index = DiffIndex()
+    failure = {}
+    lines = _counted(_read_diff(config, failure), metrics, "diff_bytes", lambda line: len(line) + 1)
+    lines = metrics.timed(lines, "fetch")
+    # Filter out excluded, generated and vendored files before anything else is done
+    # with them: files rejected by path are not even parsed
+    path_filter = PathFilter.from_config(config)
+    file_diffs = metrics.timed(iter_file_diffs(lines, skip=path_filter.skips_path), "parse", upstream="fetch")
+    file_diffs = iter_filtered(file_diffs, path_filter=path_filter)
+    if changes is not None:
+        file_diffs = iter_restricted(file_diffs, changes)
+    file_diffs = metrics.timed(file_diffs, "filter", upstream="parse")
+    upstream = "filter"
+    # With a time or token budget, review the most valuable files first. Ranking
+    # needs every file, so the filtered diff is held in memory in that case.
+    if budget.limited:
+        with metrics.stage("prioritize") as stage:
+            churn = load_churn(pr_context.getenv("HEAD_SHA"), pr_context.getenv("GITHUB_WORKSPACE"))
+            file_diffs = rank_files(file_diffs, parse_path_weights(config.REVIEW_PRIORITY_RULES), churn)
+            stage["files"] = len(file_diffs)
+        # The stages above ran inside this one
+        upstream = None
+    file_diffs = _counted(iter_indexed(file_diffs, diff_index, release=True), metrics, "reviewed_files")
+    # Widen hunks to the functions and classes around them, from the local checkout only.
+    # The widened copies are only sent to the LLM: comments resolve against diff_index.
+    semantic_stats = {}
+    semantic_context = {}
+    if getattr(config, "SEMANTIC_CHUNKING", False) and not pr_context.getenv("GITHUB_WORKSPACE"):
+        # E.g. the review service: there is no checkout to read the files from
+        logging.warning("SEMANTIC_CHUNKING needs a checkout of the head commit (GITHUB_WORKSPACE); hunks are sent as is.")
+    elif getattr(config, "SEMANTIC_CHUNKING", False):
+        file_cache = get_file_cache(config)
+        head = _head_ref()
+        file_diffs = iter_expanded(file_diffs, lambda path: file_cache.get_local_lines(path, head),
+                                   max_lines=config.SEMANTIC_MAX_LINES, stats=semantic_stats,
+                                   context=semantic_context)
+    file_diffs = metrics.timed(file_diffs, "preprocess", upstream=upstream)
+
+    # 2. Pack file blocks into chunks that fill the LLM token budget (splitting large
+    #    files at hunk boundaries), annotating each block with line numbers for clarity,
+    #    or in the compact encoding when DIFF_ENCODING is "compact"
+    encoding = CompactEncoding.from_config(config)
+    chunks = iter_packed_chunks(file_diffs, config.LLM_TOKEN_BUDGET, prompt_overhead, annotate=True,
+                                encoding=encoding)
+    chunks = metrics.timed(chunks, "split", upstream="preprocess")
+    start = time.perf_counter()
+
+    def first_chunk_timed(chunks):
+        for i, chunk in enumerate(chunks):
+            if i == 0:
+                metrics.set("seconds_to_first_chunk", round(time.perf_counter() - start, 4))
+            metrics.count("estimated_tokens", estimate_tokens(chunk) + prompt_overhead)
+            yield chunk
+
+    # 3. Query the LLM for every chunk, several chunks in flight at a time
+    cache = None
+    if config.REVIEW_CACHE_DIR:
+        cache = ReviewCache(
+            config.REVIEW_CACHE_DIR,
+            max_bytes=config.REVIEW_CACHE_MAX_MB * 1024 * 1024,
+            max_age=config.REVIEW_CACHE_MAX_AGE_DAYS * 24 * 3600,
+        )
+
+    # Chunks completed by a previous run for this head commit are not sent again
+    checkpoint = ReviewCheckpoint.for_pull_request(
+        config.CHECKPOINT_DIR, pr_context.getenv("REPOSITORY_GITHUB"), pr_context.getenv("PR_NUMBER_GITHUB"), pr_context.getenv("HEAD_SHA"),
+    )
+    is_done = checkpoint.__contains__ if checkpoint is not None else None
+
     all_comments = []
-    # 3. For each chunk, query the LLM
-    for i, chunk in enumerate(chunks):
-        logging.info("Sending chunk %d/%d to the LLM...", i+1, len(chunks))
-        response = query_llm(chunk, config)
-        if response is None:
-            logging.error("Error receiving LLM response for chunk %d.", i+1)
-            continue
-        
-        response_content = response.get("content")
-        if response_content is None:
-            logging.error("LLM response for chunk %d is empty or malformed.", i+1)
-            continue
-        
-        parsed_response = extract_json_from_text(response_content)
-        if parsed_response is None:
-            logging.error("Unable to extract JSON from chunk %d.", i+1)
-            comments = []
-        else:
-            comments = parsed_response.get("comments", [])
-        
-        # Uncomment the following block if you wish to adjust reported line numbers:
-        # for comment in comments:
-        #     reported_line = comment.get("line")
-        #     try:
-        #         reported_line_int = int(reported_line)
-        #     except (ValueError, TypeError):
-        #         logging.warning("Invalid line number for comment: %s", reported_line)
-        #         continue
-        #     adjusted_line = adjust_line_number_from_diff(chunk, reported_line_int)
-        #     comment["line"] = adjusted_line
-        
-        if comments:
-            logging.info("Chunk %d processed: %d comment(s) generated.", i+1, len(comments))
+    existing = None
+    prefetched = False
+    resolved = {}
+    with metrics.stage("review", source=diff_source(config)) as stage:
+        try:
+            chunks = first_chunk_timed(budget.admit(chunks, is_free=is_done))
+            if getattr(config, "PIPELINE_MODE", "threads") == "async":
+                # Diff streaming, LLM calls and comment preparation overlap, joined by
+                # bounded queues; the comments already on the PR are fetched meanwhile
+                def review(chunk, i):
+                    return review_chunk(chunk, config, i, None, cache, metrics, checkpoint)
+
+                prefetched = config.DEDUP_COMMENTS
+                results, existing = run_pipeline(
+                    chunks, review, llm_concurrency(config), queue_size=getattr(config, "PIPELINE_QUEUE_SIZE", 0),
+                    on_comments=lambda comments: prepare_comments(comments, diff_index, config, resolved),
+                    prefetch=(lambda: existing_comments(config)) if prefetched else None,
+                )
+                stage["pipeline"] = "async"
+            else:
+                results = review_chunks(chunks, config, cache=cache, metrics=metrics, checkpoint=checkpoint)
+        except Exception as e:
+            # Errors of the diff source are handled by _read_diff
+            logging.error("Error while reviewing the diff: %s", e)
+            return
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+                metrics.set("checkpoint_chunks", checkpoint.restored)
+        for comments in results:
             all_comments.extend(comments)
-        else:
-            logging.info("No comments generated for chunk %d.", i+1)
+        # Comments on the context added by semantic chunking are not on the diff
+        all_comments, context_comments = drop_context_comments(all_comments, semantic_context)
+        stage["chunks"] = len(results)
+        stage["files"] = len(diff_index)
+        stage["comments"] = len(all_comments)
+    logging.info("Diff reviewed in %d chunk(s) of at most %d tokens.", len(results), config.LLM_TOKEN_BUDGET)
+    skipped_files = budget.skipped_files
+    if encoding is not None:
+        saved = encoding.saved_chars // CHARS_PER_TOKEN
+        metrics.set("compact_tokens_saved", saved)
+        logging.info("Compact diff encoding saved about %d token(s).", saved)
+    if semantic_stats:
+        metrics.set("semantic_expanded_hunks", semantic_stats.get("expanded", 0))
+        metrics.set("semantic_merged_hunks", semantic_stats.get("merged", 0))
+        metrics.set("semantic_unavailable_files", semantic_stats.get("not_local", 0))
+        metrics.set("semantic_context_comments", context_comments)
+        if semantic_stats.get("not_local"):
+            logging.warning("Semantic chunking: %d file(s) not found at the head commit in the checkout, sent as is.",
+                            semantic_stats["not_local"])
+    metrics.set("llm_endpoints", get_endpoint_pool(config).stats())
+    if budget.exhausted:
+        metrics.set("budget_exhausted", budget.exhausted)
+        metrics.set("budget_skipped_files", len(skipped_files))
 
-    if not all_comments:
-        logging.info("No comments generated by the LLM across the diff.")
+    for reason, count in path_filter.skipped.items():
+        metrics.set(f"skipped_files_{reason}", count)
+    if path_filter.skipped:
+        logging.info("Skipped file(s): %s.", ", ".join(f"{n} {r}" for r, n in sorted(path_filter.skipped.items())))
+    if not metrics.counters.get("diff_bytes"):
+        logging.error("No diff retrieved. Check environment variables and permissions.")
         return
+    if failure:
+        # Publish what was reviewed, without marking the head commit as reviewed
+        metrics.set("diff_error", failure["diff"])
+        logging.warning("The diff was read only in part; publishing the comments on the files reviewed.")
+
+    if cache is not None:
+        logging.info("Review cache: %d hit(s), %d miss(es).", cache.hits, cache.misses)
+        metrics.set("cache_hits", cache.hits)
+        metrics.set("cache_misses", cache.misses)
+        cache.evict()
+
+    # Merge near-duplicates (a file split across chunks, the same remark on adjacent
+    # lines) and leave out what is already posted on the pull request
+    if config.DEDUP_COMMENTS and all_comments:
+        with metrics.stage("dedup", comments=len(all_comments)) as stage:
+            all_comments, merged = deduplicate_comments(
+                all_comments, line_window=config.DEDUP_LINE_WINDOW, threshold=config.DEDUP_SIMILARITY,
+            )
+            if not prefetched:
+                existing = existing_comments(config)
+            all_comments, already_posted = drop_existing(all_comments, existing or [])
+            stage.update(merged=merged, already_posted=already_posted, remaining=len(all_comments))
+        logging.info("Deduplication: %d merged, %d already on the pull request, %d left.",
+                     merged, already_posted, len(all_comments))
 
-    # 4. Publish comments on the pull request
+    # 4. Publish comments on the pull request, noting the files left out by the budget.
+    #    A review without suggestions is still posted: it records the reviewed head
+    #    commit, so the next push is reviewed incrementally (see EMPTY_REVIEW)
+    if not all_comments and not skipped_files:
+        logging.info("No comments generated by the LLM across the diff.")
     logging.info("Publishing comments on the pull request...")
-    if post_comments(all_comments):
+    with metrics.stage("publish", comments=len(all_comments)) as stage:
+        stage["ok"] = post_comments(all_comments, config=config, diff_index=diff_index, skipped_files=skipped_files,
+                                    diff_incomplete=bool(failure), resolved=resolved)
+    if stage["ok"]:
         logging.info("Comments published successfully.")
+        # After a diff error the next run resumes from the chunks already reviewed
+        if checkpoint is not None and not failure:
+            checkpoint.clear()
     else:
         logging.error("Error publishing comments.")
 
+def main():
+    # Load configuration and initialize logging
+    config = load_config()
+    if not config:
+        logging.error("Error loading configuration.")
+        return
+    logging.basicConfig(level=logging.INFO)
+
+    metrics = RunMetrics()
+    retries_before = get_http_client().retries
+    try:
+        run_review(config, metrics)
+    finally:
+        close_file_cache()
+        metrics.set("http_retries", get_http_client().retries - retries_before)
+        metrics.finish()
+        if config.METRICS_REPORT_PATH:
+            metrics.write_json(config.METRICS_REPORT_PATH)
+        metrics.write_step_summary()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+def extract_token_counts(response):
+    """
+    Returns (prompt_tokens, completion_tokens) reported by the LLM server, or Nones.
+    Understands llama.cpp ("tokens_evaluated"/"tokens_predicted", "timings") and
+    OpenAI-style ("usage") responses.
+    """
+    if not isinstance(response, dict):
+        return None, None
+    usage = response.get("usage") or {}
+    timings = response.get("timings") or {}
+    prompt_tokens = response.get("tokens_evaluated", usage.get("prompt_tokens", timings.get("prompt_n")))
+    completion_tokens = response.get("tokens_predicted", usage.get("completion_tokens", timings.get("predicted_n")))
+    return prompt_tokens, completion_tokens
+
+class RunMetrics:
+    """
+    Collects timings and sizes for one review run: wall time per pipeline stage,
+    one record per LLM call, and free-form counters. Thread-safe, so LLM workers
+    can record their calls concurrently.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.stages = {}
+        self.llm_calls = []
+        self.counters = {}
+        self._pulled = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        Times the enclosed block as stage `name`. The yielded dict can be filled
+        with extra fields (bytes, counts...) that end up in the report.
+        """
+        record = dict(fields)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            with self._lock:
+                self.stages[name] = record
+
+    def timed(self, items, name, upstream=None):
+        """
+        Passes `items` (a generator stage) through, recording as stage `name` the
+        time spent producing them and their number. `upstream` names the timed
+        stage feeding `items`, whose time is left out, so every stage of a
+        generator pipeline reports its own share of the work.
+        """
+        clock = time.perf_counter
+        count = 0
+        iterator = iter(items)
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    with self._lock:
+                        self._pulled[name] = self._pulled.get(name, 0.0) + clock() - start
+                count += 1
+                yield item
+        finally:
+            with self._lock:
+                seconds = self._pulled.get(name, 0.0) - self._pulled.get(upstream, 0.0)
+                self.stages[name] = {"items": count, "seconds": round(max(seconds, 0.0), 4)}
+
+    def record_llm_call(self, chunk_index, seconds, prompt_chars, response_chars,
+                        prompt_tokens=None, completion_tokens=None, comments=0, error=None):
+        with self._lock:
+            self.llm_calls.append({
+                "chunk": chunk_index,
+                "seconds": round(seconds, 4),
+                "prompt_chars": prompt_chars,
+                "response_chars": response_chars,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "comments": comments,
+                "error": error,
+            })
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self.counters[name] = value
+
+    def finish(self):
+        self.finished = time.time()
+
+    def report(self):
+        """
+        Returns the run report as a JSON-serializable dict.
+        """
+        with self._lock:
+            calls = sorted(self.llm_calls, key=lambda c: c["chunk"])
+            stages = dict(self.stages)
+            counters = dict(self.counters)
+
+        def total(key):
+            values = [c[key] for c in calls if c[key] is not None]
+            return sum(values) if values else None
+
+        durations = sorted(c["seconds"] for c in calls)
+        return {
+            "started_at": self.started,
+            "wall_seconds": round((self.finished or time.time()) - self.started, 4),
+            "stages": stages,
+            "llm": {
+                "calls": len(calls),
+                "errors": sum(1 for c in calls if c["error"]),
+                "seconds_total": round(sum(durations), 4),
+                "seconds_p50": durations[len(durations) // 2] if durations else None,
+                "seconds_max": durations[-1] if durations else None,
+                "prompt_chars": total("prompt_chars"),
+                "response_chars": total("response_chars"),
+                "prompt_tokens": total("prompt_tokens"),
+                "completion_tokens": total("completion_tokens"),
+            },
+            "counters": counters,
+            "llm_calls": calls,
+        }
+
+    def write_json(self, path):
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.report(), f, indent=2)
+            logging.info("Run report written to %s", path)
+        except OSError as e:
+            logging.warning("Unable to write run report to %s: %s", path, e)
+
+    def write_step_summary(self, path=None):
+        """
+        Appends a markdown summary to the GitHub step summary file (GITHUB_STEP_SUMMARY).
+        """
+        path = path or os.getenv("GITHUB_STEP_SUMMARY")
+        if not path:
+            return
+        report = self.report()
+        llm = report["llm"]
+        lines = [
+            "## FLAIR review run",
+            "",
+            f"Total wall time: **{report['wall_seconds']:.2f}s**",
+            "",
+            "| Stage | Seconds | Details |",
+            "| ----- | ------- | ------- |",
+        ]
+        for name, record in report["stages"].items():
+            details = ", ".join(f"{k}={v}" for k, v in record.items() if k != "seconds")
+            lines.append(f"| {name} | {record['seconds']:.3f} | {details} |")
+        lines += [
+            "",
+            "| LLM calls | Errors | p50 s | max s | Prompt tokens | Completion tokens |",
+            "| --------- | ------ | ----- | ----- | ------------- | ----------------- |",
+            f"| {llm['calls']} | {llm['errors']} | {llm['seconds_p50']} | {llm['seconds_max']} "
+            f"| {llm['prompt_tokens']} | {llm['completion_tokens']} |",
+        ]
+        if report["counters"]:
+            lines += ["", "| Counter | Value |", "| ------- | ----- |"]
+            lines += [f"| {k} | {v} |" for k, v in sorted(report["counters"].items())]
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            logging.warning("Unable to write step summary: %s", e)
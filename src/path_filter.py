@@ -0,0 +1,215 @@
+import logging
+import re
+
+# Files nobody wants reviewed, recognised by path (gitignore-style globs, see _glob_to_regex)
+LOCKFILE_PATTERNS = [
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lockb",
+    "Cargo.lock", "poetry.lock", "Pipfile.lock", "pdm.lock", "uv.lock", "composer.lock",
+    "Gemfile.lock", "go.sum", "mix.lock", "pubspec.lock", "packages.lock.json", "flake.lock",
+]
+VENDORED_PATTERNS = [
+    "vendor/", "vendors/", "third_party/", "third-party/", "thirdparty/", "node_modules/",
+    "bower_components/", "Pods/", "site-packages/",
+]
+MINIFIED_PATTERNS = ["*.min.js", "*.min.css", "*.min.mjs", "*-min.js", "*.bundle.js", "*.js.map", "*.css.map"]
+GENERATED_PATTERNS = [
+    "*_pb2.py", "*_pb2_grpc.py", "*_pb2.pyi", "*.pb.go", "*.pb.cc", "*.pb.h", "*_grpc.pb.go",
+    "*.generated.*", "*_generated.*", "*.g.dart", "*.freezed.dart", "*.designer.cs",
+    "__snapshots__/", "*.snap",
+]
+
+# Banners that code generators put at the top of the files they write. Only exact
+# tool banners: a hand-written header such as "Do not edit without review" or
+# "Generated by hand" must not hide a file from the review.
+GENERATED_MARKER_PATTERN = re.compile(
+    r"@generated\b"                                             # Meta/Buck, Relay, Yarn, ...
+    r"|Code generated .* DO NOT EDIT\."                        # Go convention
+    r"|<auto-generated[\s>/]"                                   # .NET tools
+    r"|Generated by the protocol buffer compiler\.  DO NOT EDIT!"  # protoc
+    r"|Autogenerated by Thrift Compiler"
+)
+GENERATED_MARKER_LINES = 5
+# A changed line this long is minified or machine-written content
+MINIFIED_LINE_LENGTH = 1000
+MINIFIED_SAMPLE_LINES = 20
+
+# A bare word ("test", "spec") has no glob characters and no slash
+_BARE_WORD_PATTERN = re.compile(r"^[^*?\[/]+$")
+# Separators that delimit the words of a path for bare-word patterns
+_WORD_BOUNDARY = r"[/._\-]"
+
+def _glob_to_regex(pattern):
+    """
+    Translates one gitignore-style pattern to a regular expression matched against
+    a repository-relative path:
+
+    - `re:<regex>` is used as is (searched anywhere in the path);
+    - a bare word such as `test` matches whole words of the path, delimited by
+      `/`, `.`, `_` or `-`: `test/a.py`, `test_a.py` and `a.test.js`, but not
+      `latest_config.py`;
+    - otherwise `*` and `?` stay within a path segment, `**` spans segments, a
+      pattern containing a slash is anchored at the repository root, a trailing
+      slash matches directories only, and a directory match covers its content.
+    """
+    if pattern.startswith("re:"):
+        return pattern[3:]
+    if _BARE_WORD_PATTERN.match(pattern) and not pattern.startswith("."):
+        return rf"(?:^|{_WORD_BOUNDARY}){re.escape(pattern)}(?:$|{_WORD_BOUNDARY})"
+
+    directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                parts.append(f"[{body}]")
+                i = end + 1
+                continue
+        else:
+            parts.append(re.escape(char))
+        i += 1
+
+    prefix = "^" if anchored else "(?:^|/)"
+    suffix = "/" if directory_only else "(?:$|/)"
+    return prefix + "".join(parts) + suffix
+
+def compile_patterns(patterns):
+    """
+    Compiles gitignore-style patterns (see _glob_to_regex) into a single regex, or
+    None when there are none. Matching is case-insensitive.
+    """
+    regexes = [_glob_to_regex(p.strip()) for p in patterns or [] if p and p.strip()]
+    if not regexes:
+        return None
+    return re.compile("|".join(f"(?:{r})" for r in regexes), re.IGNORECASE)
+
+class PathFilter:
+    """
+    Decides which files of a diff are worth reviewing. Every rule is compiled once,
+    so checking a file costs a few regex searches on its path.
+
+    A file is skipped when one of its paths matches `exclude` or, with
+    `skip_generated`, looks like a lockfile, vendored, minified or generated file
+    (by path, or by the content of its first changed lines). Paths matching
+    `include` are always reviewed. As in .gitignore, an `!pattern` entry of
+    `exclude` is an include rule.
+
+    `skipped` counts the skipped files per reason.
+    """
+
+    def __init__(self, exclude=None, include=None, skip_generated=True):
+        exclude = [p.strip() for p in exclude or [] if p and p.strip()]
+        include = [p.strip() for p in include or [] if p and p.strip()]
+        include += [p[1:] for p in exclude if p.startswith("!")]
+        exclude = [p for p in exclude if not p.startswith("!")]
+
+        self.skip_generated = skip_generated
+        self.skipped = {}
+        self._include = compile_patterns(include)
+        self._rules = [("excluded", compile_patterns(exclude))]
+        if skip_generated:
+            self._rules += [
+                ("lockfile", compile_patterns(LOCKFILE_PATTERNS)),
+                ("vendored", compile_patterns(VENDORED_PATTERNS)),
+                ("minified", compile_patterns(MINIFIED_PATTERNS)),
+                ("generated", compile_patterns(GENERATED_PATTERNS)),
+            ]
+        self._rules = [(reason, regex) for reason, regex in self._rules if regex is not None]
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            exclude=getattr(config, "EXCLUDE_PATTERNS", None),
+            include=getattr(config, "INCLUDE_PATTERNS", None),
+            skip_generated=getattr(config, "SKIP_GENERATED_FILES", True),
+        )
+
+    def path_reason(self, *paths):
+        """
+        Returns why a file with these paths (e.g. old and new path) is skipped, judging
+        by the paths alone, or None if it should be reviewed.
+        """
+        paths = [p for p in paths if p]
+        if self._include is not None and any(self._include.search(p) for p in paths):
+            return None
+        for reason, regex in self._rules:
+            if any(regex.search(p) for p in paths):
+                return reason
+        return None
+
+    def skips_path(self, path, old_path=None):
+        """
+        Cheap check on the "diff --git" header, before the file's lines are parsed;
+        counts the file as skipped. See iter_file_diffs.
+        """
+        reason = self.path_reason(path, old_path)
+        if reason is not None:
+            logging.debug("Skipping %s (%s).", path or old_path, reason)
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        return reason is not None
+
+    def reason(self, file_diff):
+        """
+        Returns why `file_diff` is skipped, or None if it should be reviewed.
+        """
+        paths = (file_diff.old_path, file_diff.path)
+        reason = self.path_reason(*paths)
+        if reason is not None or not self.skip_generated:
+            return reason
+        if self._include is not None and any(self._include.search(p) for p in paths if p):
+            return None
+        return _content_reason(file_diff)
+
+    def keep(self, file_diff):
+        reason = self.reason(file_diff)
+        if reason is not None:
+            logging.info("Skipping %s (%s).", file_diff.path or file_diff.old_path, reason)
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+        return reason is None
+
+def _content_reason(file_diff):
+    """
+    Looks at the first lines of a file diff for a code generator banner at the top
+    of the file (GENERATED_MARKER_PATTERN), or for minified (very long) lines.
+    """
+    if not file_diff.hunks:
+        return None
+    first = file_diff.hunks[0]
+    if first.new_start <= 1:
+        for line in first.lines[:GENERATED_MARKER_LINES]:
+            if GENERATED_MARKER_PATTERN.search(line):
+                return "generated"
+    sampled = 0
+    for hunk in file_diff.hunks:
+        for line in hunk.lines:
+            if not line.startswith("+"):
+                continue
+            if len(line) > MINIFIED_LINE_LENGTH:
+                return "minified"
+            sampled += 1
+            if sampled >= MINIFIED_SAMPLE_LINES:
+                return None
+    return None
@@ -0,0 +1,63 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Variables describing the pull request under review. The action sets them in the
+# environment; the review daemon (see daemon.py) reviews several pull requests at
+# once, so each of its workers overrides them for its own thread.
+PULL_REQUEST_VARIABLES = (
+    "REPOSITORY_GITHUB", "PR_NUMBER_GITHUB", "HEAD_SHA", "BASE_SHA",
+    "GITHUB_HEAD_REF", "GITHUB_REF", "GITHUB_WORKSPACE",
+)
+
+_local = threading.local()
+
+def current():
+    """
+    Returns the overrides of the pull request reviewed by this thread, or None.
+    """
+    return getattr(_local, "values", None)
+
+def getenv(name, default=None):
+    """
+    os.getenv for the pull request variables, honouring the overrides of this thread.
+    """
+    values = current()
+    if values is not None and name in values:
+        value = values[name]
+        return default if value is None else value
+    return os.getenv(name, default)
+
+@contextmanager
+def pull_request_env(**values):
+    """
+    Overrides pull request variables (see PULL_REQUEST_VARIABLES) for the current
+    thread while the block runs. Variables given as None read as unset.
+    """
+    unknown = set(values) - set(PULL_REQUEST_VARIABLES)
+    if unknown:
+        raise ValueError(f"Unknown pull request variable(s): {', '.join(sorted(unknown))}")
+    previous = current()
+    _local.values = dict(values)
+    try:
+        yield _local.values
+    finally:
+        _local.values = previous
+
+def bind(fn):
+    """
+    Wraps `fn` so that it sees the pull request overrides of the calling thread
+    when run on another thread (e.g. a ThreadPoolExecutor worker).
+    """
+    values = current()
+    if values is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        previous = current()
+        _local.values = values
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.values = previous
+    return bound
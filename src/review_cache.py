@@ -0,0 +1,120 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+class ReviewCache:
+    """
+    On-disk, content-addressed cache of LLM responses.
+
+    Entries are keyed by a hash of the full prompt, the generation parameters and the
+    endpoint, so an unchanged diff chunk is answered from disk instead of the LLM.
+    Entries older than `max_age` seconds are ignored, and `evict()` trims the
+    directory down to `max_bytes`, dropping the least recently used entries first.
+    """
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(prompt, params, endpoint):
+        """
+        Returns the hex digest identifying a request to the LLM.
+        """
+        material = json.dumps(
+            {"prompt": prompt, "params": params, "endpoint": endpoint},
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """
+        Returns the cached response for `key`, or None if it is missing or expired.
+        """
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                self._count(False)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Refresh the timestamp so eviction keeps recently used entries
+            os.utime(path, None)
+        except (OSError, ValueError):
+            self._count(False)
+            return None
+        self._count(True)
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a JSON-serializable response under `key`. Failures are logged, never raised.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning("Unable to write review cache entry %s: %s", key, e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently used ones until the cache
+        fits in `max_bytes`. Returns the number of removed entries.
+        """
+        now = time.time()
+        entries = []
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if not name.endswith(".json") or now - stat.st_mtime > self.max_age:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except OSError:
+                pass
+        return removed
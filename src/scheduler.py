@@ -0,0 +1,178 @@
+import logging
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from path_filter import compile_patterns
+from utils import estimate_tokens
+
+# Relative review value of a file by extension; anything else gets DEFAULT_LANGUAGE_WEIGHT
+LANGUAGE_WEIGHTS = {
+    ".py": 1.0, ".go": 1.0, ".rs": 1.0, ".java": 1.0, ".kt": 1.0, ".scala": 1.0,
+    ".c": 1.0, ".cc": 1.0, ".cpp": 1.0, ".h": 0.9, ".hpp": 0.9, ".cs": 1.0, ".swift": 1.0,
+    ".js": 0.9, ".jsx": 0.9, ".ts": 0.9, ".tsx": 0.9, ".rb": 0.9, ".php": 0.9,
+    ".sh": 0.8, ".sql": 0.8, ".tf": 0.7, ".dockerfile": 0.7,
+    ".yml": 0.5, ".yaml": 0.5, ".toml": 0.5, ".ini": 0.4, ".cfg": 0.4, ".json": 0.4, ".xml": 0.4,
+    ".html": 0.5, ".css": 0.4, ".scss": 0.4,
+    ".md": 0.2, ".rst": 0.2, ".txt": 0.2,
+}
+DEFAULT_LANGUAGE_WEIGHT = 0.6
+# Commits of history scanned to measure how often each file changes
+CHURN_COMMITS = 300
+
+_CHUNK_FILE_PATTERN = re.compile(r'^diff --git a/.* b/(.*)$', re.MULTILINE)
+
+def language_weight(path):
+    name = os.path.basename(path or "").lower()
+    if name == "dockerfile":
+        return LANGUAGE_WEIGHTS[".dockerfile"]
+    return LANGUAGE_WEIGHTS.get(os.path.splitext(name)[1], DEFAULT_LANGUAGE_WEIGHT)
+
+def parse_path_weights(rules):
+    """
+    Parses "pattern=weight" rules (patterns as in path_filter) into a list of
+    (compiled pattern, weight); invalid rules are logged and ignored.
+    """
+    weights = []
+    for rule in rules or []:
+        pattern, sep, weight = rule.strip().rpartition("=")
+        if not sep or not pattern:
+            if rule.strip():
+                logging.warning("Ignoring priority rule %r (expected pattern=weight).", rule)
+            continue
+        try:
+            weights.append((compile_patterns([pattern]), float(weight)))
+        except (ValueError, re.error) as e:
+            logging.warning("Ignoring priority rule %r: %s", rule, e)
+    return weights
+
+def load_churn(head=None, repo_dir=None, commits=CHURN_COMMITS):
+    """
+    Returns {path: number of commits touching it} over the last `commits` commits
+    of `head` in the local checkout, or {} when git history is unavailable.
+    """
+    try:
+        result = subprocess.run(
+            ["git", "log", "--format=", "--name-only", "-n", str(commits), head or "HEAD"],
+            cwd=repo_dir or None, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+    except OSError:
+        return {}
+    if result.returncode != 0:
+        return {}
+    churn = {}
+    for path in result.stdout.splitlines():
+        if path:
+            churn[path] = churn.get(path, 0) + 1
+    return churn
+
+def file_priority(file_diff, path_weights=None, churn=None):
+    """
+    Scores the review value of a file diff. Grows with the number of changed lines
+    (logarithmically, so one huge file does not crowd out everything else) and with
+    their density among the lines shown, and is scaled by the language weight, the
+    first matching path rule and how often the file changed recently.
+    """
+    changed = len(file_diff.changed_lines())
+    if changed == 0:
+        return 0.0
+    shown = sum(len(hunk.lines) for hunk in file_diff.hunks)
+    density = changed / max(shown, 1)
+    score = math.log1p(changed) * (0.5 + density) * language_weight(file_diff.path)
+    for pattern, weight in path_weights or []:
+        if pattern.search(file_diff.path or ""):
+            score *= weight
+            break
+    if churn:
+        score *= 1 + math.log1p(churn.get(file_diff.path, 0)) / 4
+    return score
+
+def rank_files(file_diffs, path_weights=None, churn=None):
+    """
+    Returns the file diffs sorted by decreasing file_priority (stable for ties).
+    """
+    return sorted(file_diffs, key=lambda f: -file_priority(f, path_weights, churn))
+
+def chunk_files(chunk):
+    """
+    Returns the paths of the files a chunk holds, from its "diff --git" headers.
+    """
+    return list(dict.fromkeys(_CHUNK_FILE_PATTERN.findall(chunk)))
+
+class ReviewBudget:
+    """
+    Global limits of one review run: wall-clock seconds since the budget was created
+    and estimated tokens sent to the LLM (prompt overhead included). A limit of 0
+    means unlimited.
+
+    admit() hands out chunks while the budget lasts; once a limit is hit, the files
+    of the remaining chunks are listed in `skipped_files` and no more chunks are
+    sent. Chunks already in flight are left to finish.
+    """
+
+    def __init__(self, seconds=0, tokens=0, overhead_tokens=0, clock=time.monotonic):
+        self.seconds = seconds
+        self.tokens = tokens
+        self.overhead_tokens = overhead_tokens
+        self.clock = clock
+        self.started = clock()
+        self.tokens_used = 0
+        self.exhausted = None
+        self._skipped = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, overhead_tokens=0):
+        return cls(
+            seconds=getattr(config, "REVIEW_TIME_BUDGET", 0),
+            tokens=getattr(config, "REVIEW_TOKEN_BUDGET", 0),
+            overhead_tokens=overhead_tokens,
+        )
+
+    @property
+    def skipped_files(self):
+        return list(self._skipped)
+
+    @property
+    def limited(self):
+        return bool(self.seconds or self.tokens)
+
+    def allows(self, chunk):
+        """
+        Returns True and charges the chunk if it fits in the remaining budget.
+        """
+        cost = estimate_tokens(chunk) + self.overhead_tokens
+        with self._lock:
+            if self.exhausted:
+                return False
+            if self.seconds and self.clock() - self.started >= self.seconds:
+                self.exhausted = "time"
+            elif self.tokens and self.tokens_used + cost > self.tokens:
+                self.exhausted = "tokens"
+            else:
+                self.tokens_used += cost
+                return True
+        return False
+
+    def admit(self, chunks, is_free=None):
+        """
+        Yields the chunks allowed by the budget, in order. After the first refusal,
+        the rest of `chunks` is drained only to record the files it skips.
+        Chunks for which `is_free(chunk)` is true (e.g. already reviewed, see
+        ReviewCheckpoint) are always yielded and cost nothing.
+        """
+        for chunk in chunks:
+            if is_free is not None and is_free(chunk):
+                yield chunk
+                continue
+            if self.exhausted is None and self.allows(chunk):
+                yield chunk
+                continue
+            for path in chunk_files(chunk):
+                self._skipped[path] = None
+        if self.exhausted:
+            logging.warning("Review %s budget exhausted: %d file(s) not reviewed.",
+                            self.exhausted, len(self._skipped))
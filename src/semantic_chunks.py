@@ -0,0 +1,272 @@
+import ast
+import logging
+import os
+import re
+from bisect import bisect_right
+from diff_index import HUNK_HEADER_PATTERN, Hunk, parse_line_range
+
+# Languages whose blocks are delimited by braces; anything else but Python uses indentation
+BRACE_EXTENSIONS = {
+    ".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".java", ".kt", ".scala", ".swift", ".go", ".rs",
+    ".js", ".jsx", ".ts", ".tsx", ".php", ".dart",
+}
+# Files longer than this are not parsed for definitions
+MAX_PARSED_LINES = 50000
+
+_STRING_OR_COMMENT = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|//.*$|#.*$')
+
+def python_ranges(text):
+    """
+    Returns the (first, last) lines of every function and class of a Python source,
+    decorators included, or None if it does not parse.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    ranges = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            first = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            ranges.append((first, getattr(node, "end_lineno", None) or node.lineno))
+    return ranges
+
+def brace_ranges(lines):
+    """
+    Returns the (first, last) lines of every brace block opened at nesting depth 0
+    or 1 (top-level definitions and the members of a class, namespace or impl).
+    String literals and line comments are ignored; block comments are not.
+    """
+    ranges = []
+    stack = []
+    for number, line in enumerate(lines, start=1):
+        for char in _STRING_OR_COMMENT.sub("", line):
+            if char == "{":
+                stack.append(number)
+            elif char == "}" and stack:
+                first = stack.pop()
+                if len(stack) <= 1 and number > first:
+                    ranges.append((_signature_start(lines, first), number))
+    return ranges
+
+def _signature_start(lines, first):
+    # A signature may wrap: go up to the line after the previous statement or blank line
+    start = first
+    while start > 1:
+        previous = lines[start - 2].strip()
+        if not previous or previous.endswith((";", "}", "{")) or previous.startswith(("//", "/*", "*")):
+            break
+        start -= 1
+    return start
+
+def indent_ranges(lines):
+    """
+    Returns the (first, last) lines of every indentation block: a line followed by
+    more indented lines, up to the next line indented as much or less.
+    """
+    ranges = []
+    stack = []  # (indent, first line)
+    last_code = 0
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        indent = len(line) - len(line.lstrip())
+        while stack and indent <= stack[-1][0]:
+            _, first = stack.pop()
+            if last_code > first:
+                ranges.append((first, last_code))
+        stack.append((indent, number))
+        last_code = number
+    while stack:
+        _, first = stack.pop()
+        if last_code > first:
+            ranges.append((first, last_code))
+    return ranges
+
+def definition_ranges(path, lines):
+    """
+    Returns the (first, last) line ranges of the functions, classes and other
+    blocks of a file, with `ast` for Python and a brace or indentation heuristic
+    for other languages (and for Python sources that do not parse).
+
+    Returns (ranges, exact): `exact` is True when every range is a definition, so
+    the innermost one encloses a change best; heuristic ranges also hold loops
+    and conditionals, so the outermost one that fits is used instead.
+    """
+    extension = os.path.splitext(path or "")[1].lower()
+    if extension in (".py", ".pyi"):
+        ranges = python_ranges("\n".join(lines))
+        if ranges is not None:
+            return ranges, True
+    if extension in BRACE_EXTENSIONS:
+        return brace_ranges(lines), False
+    return indent_ranges(lines), False
+
+def _enclosing(ranges, line, max_lines, innermost=True):
+    """
+    Returns the smallest (or, with innermost=False, the largest) range containing
+    `line` that is at most `max_lines` long, or None.
+    """
+    best = None
+    for first, last in ranges:
+        if first <= line <= last and last - first < max_lines:
+            if best is None or (last - first < best[1] - best[0]) == innermost:
+                best = (first, last)
+    return best
+
+def _new_span(hunk):
+    """
+    Returns the first and last new-file lines covered by a hunk; for a hunk that
+    only removes lines, an empty span just after its "+start" line.
+    """
+    if hunk.new_count == 0:
+        return hunk.new_start + 1, hunk.new_start
+    return hunk.new_start, hunk.new_start + hunk.new_count - 1
+
+def expand_hunks(file_diff, file_lines, max_lines=200):
+    """
+    Widens every hunk of `file_diff` to the functions or classes enclosing its first
+    and last lines (at most `max_lines` long each), using `file_lines`, the lines of
+    the new version of the file, for the added context. Hunks whose widened ranges
+    overlap or touch are merged into one.
+
+    Returns (file diff, expanded hunks, merged hunks). The returned copy is meant
+    for the LLM only: it shares the diff positions of `file_diff`, so comments
+    still resolve against the original diff.
+    """
+    if not file_diff.hunks or not file_lines:
+        return file_diff, 0, 0
+    ranges, exact = definition_ranges(file_diff.path, file_lines)
+    if not ranges:
+        return file_diff, 0, 0
+
+    total = len(file_lines)
+    groups = []  # [first, last, [hunks]]
+    expanded = 0
+    for hunk in file_diff.hunks:
+        first, last = _new_span(hunk)
+        lo, hi = first, last
+        start = _enclosing(ranges, max(first, 1), max_lines, innermost=exact)
+        end = _enclosing(ranges, max(last, 1), max_lines, innermost=exact)
+        if start is not None:
+            lo = min(lo, start[0])
+        if end is not None:
+            hi = max(hi, min(end[1], total))
+        if (lo, hi) != (first, last):
+            expanded += 1
+        if groups and lo <= groups[-1][1] + 1:
+            groups[-1][0] = min(groups[-1][0], lo)
+            groups[-1][1] = max(groups[-1][1], hi)
+            groups[-1][2].append(hunk)
+        else:
+            groups.append([lo, hi, [hunk]])
+    if not expanded:
+        return file_diff, 0, 0
+
+    merged = len(file_diff.hunks) - len(groups)
+    hunks = [_merge_group(lo, hi, group, file_lines) for lo, hi, group in groups]
+    return file_diff.with_hunks(hunks), expanded, merged
+
+def _context(file_lines, first, last):
+    return [" " + file_lines[n - 1] for n in range(max(first, 1), min(last, len(file_lines)) + 1)]
+
+def _merge_group(lo, hi, group, file_lines):
+    """
+    Builds one hunk spanning new-file lines `lo`..`hi` out of `group`, filling the
+    gaps around and between its hunks with context lines from the file.
+    """
+    lines = []
+    cursor = lo
+    for hunk in group:
+        first, last = _new_span(hunk)
+        lines.extend(_context(file_lines, cursor, first - 1))
+        lines.extend(hunk.lines)
+        cursor = max(cursor, last + 1)
+    lines.extend(_context(file_lines, cursor, hi))
+
+    head = group[0]
+    lead = max(_new_span(head)[0] - lo, 0)
+    old_count = sum(1 for line in lines if line.startswith((" ", "-")))
+    new_count = sum(1 for line in lines if line.startswith((" ", "+")))
+    old_start = max(head.old_start - lead, 0 if old_count == 0 else 1)
+    match = HUNK_HEADER_PATTERN.match(head.header)
+    section = head.header[match.end():] if match else ""
+    header = f"@@ -{old_start},{old_count} +{lo},{new_count} @@{section}"
+    hunk = Hunk(header, old_start, old_count, lo, new_count, head.position)
+    hunk.lines = lines
+    return hunk
+
+def added_spans(original, widened):
+    """
+    Returns the (first, last) new-file lines of `widened` (a FileDiff returned by
+    expand_hunks) that are not in `original`: the context added around its hunks.
+    """
+    covered = [_new_span(hunk) for hunk in original.hunks]
+    spans = []
+    for hunk in widened.hunks:
+        cursor, hi = _new_span(hunk)
+        for first, last in covered:
+            if last < cursor or first > hi:
+                continue
+            if first > cursor:
+                spans.append((cursor, first - 1))
+            cursor = max(cursor, last + 1)
+        if cursor <= hi:
+            spans.append((cursor, hi))
+    return spans
+
+def _in_spans(spans, line):
+    i = bisect_right(spans, (line, float("inf"))) - 1
+    return i >= 0 and spans[i][0] <= line <= spans[i][1]
+
+def drop_context_comments(comments, context):
+    """
+    Leaves out the comments placed on lines the LLM only saw as added context
+    (`context` maps paths to their added_spans): those lines are not in the pull
+    request diff, and snapping them to the nearest changed line would put the
+    comment on unrelated code. A range ending in added context is cut down to its
+    first line. Returns (kept comments, number dropped).
+    """
+    if not context:
+        return comments, 0
+    kept = []
+    for comment in comments:
+        spans = context.get(comment.get("file"))
+        line_range = parse_line_range(comment.get("line", "")) if spans else None
+        if line_range is not None and _in_spans(spans, line_range[1]):
+            if _in_spans(spans, line_range[0]):
+                continue
+            comment = dict(comment, line=str(line_range[0]))
+        kept.append(comment)
+    return kept, len(comments) - len(kept)
+
+def iter_expanded(file_diffs, read_lines, max_lines=200, stats=None, context=None):
+    """
+    Passes `file_diffs` through expand_hunks. `read_lines(path)` returns the lines
+    of the new version of a file (TextLines / MappedLines), or None when the file is
+    not available locally, in which case the file is left as is. `stats` (a dict)
+    counts the "expanded" and "merged" hunks, and the files "not_local". `context`
+    (a dict), if given, receives the added_spans of every widened file by path.
+    """
+    for file_diff in file_diffs:
+        if file_diff.path is None or not file_diff.hunks:
+            yield file_diff
+            continue
+        try:
+            content = read_lines(file_diff.path)
+        except Exception as e:
+            logging.debug("No local content for %s: %s", file_diff.path, e)
+            content = None
+        if content is None or len(content) > MAX_PARSED_LINES:
+            if content is None and stats is not None:
+                stats["not_local"] = stats.get("not_local", 0) + 1
+            yield file_diff
+            continue
+        file_lines = content.slice(0, len(content))
+        result, expanded, merged = expand_hunks(file_diff, file_lines, max_lines)
+        if stats is not None:
+            stats["expanded"] = stats.get("expanded", 0) + expanded
+            stats["merged"] = stats.get("merged", 0) + merged
+        if context is not None and result is not file_diff:
+            context[file_diff.path] = added_spans(file_diff, result)
+        yield result
@@ -0,0 +1,18 @@
+import math
+
+# Rough average for code with llama-style BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in `text` without calling a tokenizer.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def estimate_lines_tokens(lines):
+    """
+    Estimates the tokens of lines once joined with newlines.
+    """
+    return math.ceil((sum(len(line) for line in lines) + max(len(lines) - 1, 0)) / CHARS_PER_TOKEN)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The action runs `python src/main.py`, so modules under src/ import each other
+# by bare name (e.g. `from config import load_config`). Mirror that here, and
+# import modules by that same bare name in tests so isinstance checks and
+# patches see a single copy of each module.
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import pr_context
+from async_pipeline import run_pipeline
+from config import Config
+from diff_index import DiffIndex
+from main import prepare_comments, run_review
+from metrics import RunMetrics
+from tests.stub_llm_server import StubLLMServer
+
+DIFF = "\n".join([
+    "diff --git a/app.py b/app.py", "--- a/app.py", "+++ b/app.py", "@@ -1,1 +1,2 @@",
+    " import os", "+print(os.environ)",
+    "diff --git a/lib.py b/lib.py", "--- a/lib.py", "+++ b/lib.py", "@@ -1,1 +1,2 @@",
+    " import sys", "+print(sys.argv)",
+])
+
+class TestRunPipeline(unittest.TestCase):
+
+    def test_stages_overlap(self):
+        # Three stages of 0.05 s per chunk: about 0.5 s when overlapped, 1.5 s one after another
+        def chunks():
+            for i in range(10):
+                time.sleep(0.05)
+                yield f"chunk-{i}"
+
+        def review(chunk, i):
+            time.sleep(0.05)
+            return [{"file": chunk}]
+
+        prepared = []
+
+        def on_comments(comments):
+            time.sleep(0.05)
+            prepared.extend(c["file"] for c in comments)
+
+        start = time.perf_counter()
+        results, existing = run_pipeline(chunks(), review, workers=2, on_comments=on_comments,
+                                         prefetch=lambda: ["already posted"])
+        elapsed = time.perf_counter() - start
+        self.assertEqual(results, [[{"file": f"chunk-{i}"}] for i in range(10)])
+        self.assertEqual(sorted(prepared), sorted(f"chunk-{i}" for i in range(10)))
+        self.assertEqual(existing, ["already posted"])
+        self.assertLess(elapsed, 1.0)
+
+    def test_bounded_queues_hold_back_the_producer(self):
+        pulled = []
+        pulled_at_review = []
+
+        def chunks():
+            for i in range(12):
+                pulled.append(i)
+                yield i
+
+        def review(chunk, i):
+            pulled_at_review.append(len(pulled))
+            time.sleep(0.02)
+            return []
+
+        results, _ = run_pipeline(chunks(), review, workers=2, queue_size=2)
+        self.assertEqual(results, [[]] * 12)
+        # Queued chunks plus those in review, plus the one waiting for room
+        self.assertLessEqual(min(pulled_at_review), 5)
+        self.assertLessEqual(max(n - i for i, n in enumerate(sorted(pulled_at_review))), 5)
+
+    def test_failures(self):
+        def review(chunk, i):
+            if chunk == "boom":
+                raise RuntimeError("unexpected")
+            return [chunk]
+
+        def on_comments(comments):
+            raise OSError("disk full")
+
+        results, existing = run_pipeline(["a", "boom", "b"], review, workers=2, on_comments=on_comments,
+                                         prefetch=lambda: 1 / 0)
+        self.assertEqual((results, existing), ([["a"], [], ["b"]], None))
+
+        reviewed = []
+
+        def broken_stream():
+            yield "a"
+            raise ValueError("diff interrupted")
+
+        with self.assertRaises(ValueError):
+            run_pipeline(broken_stream(), lambda chunk, i: reviewed.append(chunk) or [], workers=2)
+        self.assertEqual(reviewed, ["a"])
+
+    def test_threads_see_the_pull_request(self):
+        seen = set()
+
+        def review(chunk, i):
+            seen.add((pr_context.getenv("PR_NUMBER_GITHUB"), threading.current_thread() is not main))
+            return []
+
+        main = threading.current_thread()
+        with pr_context.pull_request_env(PR_NUMBER_GITHUB="7"):
+            run_pipeline(range(4), review, workers=2)
+        self.assertEqual(seen, {("7", True)})
+
+class TestAsyncReview(unittest.TestCase):
+
+    def test_run_review_in_async_mode(self):
+        def respond(payload):
+            return json.dumps({"comments": [
+                {"file": file, "line": "2", "comment": "Prints a secret."} for file in ("app.py", "lib.py")
+            ]})
+
+        published = []
+        prepared = []
+
+        with StubLLMServer(respond=respond) as server:
+            class AsyncConfig(Config):
+                LLM_ENDPOINT = server.url
+                LLM_ENDPOINTS = ""
+                LLM_PROMPT_FORMAT = "single"
+                LLM_STREAM = False
+                PIPELINE_MODE = "async"
+                INCREMENTAL_REVIEW = False
+                REVIEW_CACHE_DIR = ""
+                CHECKPOINT_DIR = ""
+                REVIEW_TIME_BUDGET = 0
+                REVIEW_TOKEN_BUDGET = 0
+                SEMANTIC_CHUNKING = False
+                COMMENT_CONTEXT_LINES = 2
+                EXCLUDE_PATTERNS = []
+                INCLUDE_PATTERNS = []
+
+            def post(comments, **kwargs):
+                published.append(sorted(c["file"] for c in comments))
+                return True
+
+            with patch("main.iter_diff_lines", return_value=iter(DIFF.splitlines())), \
+                 patch("main.existing_comments", return_value=[("lib.py", "Prints a secret.")]), \
+                 patch("main.prepare_comments", side_effect=lambda c, *a: prepared.extend(c)), \
+                 patch("main.post_comments", side_effect=post):
+                metrics = RunMetrics()
+                run_review(AsyncConfig, metrics)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(sorted(c["file"] for c in prepared), ["app.py", "lib.py"])
+        # The comment already on the pull request was fetched alongside the review
+        self.assertEqual(published, [["app.py"]])
+        self.assertEqual(metrics.counters["reviewed_files"], 2)
+
+    def test_comments_are_resolved_for_the_publisher(self):
+        class NoContextConfig:
+            COMMENT_CONTEXT_LINES = 0
+            COMMENT_LINE_SNAP = 10
+
+        resolved = {}
+        comments = [{"file": "app.py", "line": 2, "comment": "a"}, {"file": "gone.py", "line": "1", "comment": "b"}]
+        prepare_comments(comments, DiffIndex.parse(DIFF), NoContextConfig, resolved)
+        self.assertEqual(resolved, {("app.py", "2"): {"line": 2, "position": 2}, ("gone.py", "1"): None})
+
+
+if __name__ == "__main__":
+    unittest.main()
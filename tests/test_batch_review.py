@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pr_context
+from batch_review import BatchReview, GitHubRateBudget, collect_jobs, parse_pr_spec, search_pull_requests
+from comment_publisher_github import publish_review_with_suggestions
+from daemon import ReviewJob
+from diff_index import DiffIndex
+from metrics import RunMetrics
+
+DIFF = "\n".join(["diff --git a/a.py b/a.py", "--- a/a.py", "+++ b/a.py", "@@ -0,0 +1,2 @@", "+x = 1", "+y = 2"])
+
+class DummyConfig:
+    GITHUB_TOKEN = "token"
+    GITHUB_API_URL = "https://api.github.com"
+
+def page(data, next_url=None):
+    resp = MagicMock()
+    resp.json.return_value = data
+    resp.links = {"next": {"url": next_url}} if next_url else {}
+    return resp
+
+def fake_review(tokens=100, comments=1, delay=0.0, running=None):
+    def review(job, config):
+        if running is not None:
+            with running["lock"]:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+        time.sleep(delay)
+        if running is not None:
+            with running["lock"]:
+                running["now"] -= 1
+        if job.pr_number == "13":
+            raise RuntimeError("LLM unreachable")
+        metrics = RunMetrics()
+        metrics.count("diff_bytes", 10)
+        metrics.count("estimated_tokens", tokens)
+        with metrics.stage("publish", comments=comments) as stage:
+            stage["ok"] = True
+        return metrics
+    return review
+
+class TestPullRequestSources(unittest.TestCase):
+
+    def test_specs(self):
+        self.assertEqual(parse_pr_spec("acme/api#12"), ("acme/api", 12))
+        self.assertEqual(parse_pr_spec("https://github.com/acme/web.site/pull/7/"), ("acme/web.site", 7))
+        self.assertEqual(parse_pr_spec("acme/api/pulls/3"), ("acme/api", 3))
+        with self.assertRaises(ValueError):
+            parse_pr_spec("acme/api")
+
+    @patch("batch_review.get_http_client")
+    def test_search_and_repository_listing(self, mock_client):
+        mock_client.return_value.get.side_effect = [
+            page({"items": [{"repository_url": "https://api.github.com/repos/acme/api", "number": 1}]}, "next"),
+            page({"items": [{"repository_url": "https://api.github.com/repos/acme/web", "number": 2}]}),
+        ]
+        self.assertEqual(search_pull_requests(DummyConfig, "org:acme is:pr"), [("acme/api", 1), ("acme/web", 2)])
+        query = mock_client.return_value.get.call_args_list[0][1]["params"]["q"]
+        self.assertEqual(query, "org:acme is:pr is:open draft:false")
+
+        pull = {"number": 5, "state": "open", "head": {"sha": "h", "ref": "f"}, "base": {"sha": "b"}}
+        mock_client.return_value.get.side_effect = [page([pull, dict(pull, number=6, draft=True)])]
+        jobs = collect_jobs(DummyConfig, specs=["acme/api#12"], repos=["acme/web"])
+        self.assertEqual([(j.key, j.head_sha) for j in jobs], [(("acme/api", "12"), None), (("acme/web", "5"), "h")])
+
+class TestBatchReview(unittest.TestCase):
+
+    def test_concurrency_and_report(self):
+        running = {"now": 0, "max": 0, "lock": threading.Lock()}
+        jobs = [ReviewJob(f"acme/r{i % 3}", 20 + i, head_sha="h") for i in range(9)]
+        jobs.append(ReviewJob("acme/r0", 13, head_sha="h"))
+        batch = BatchReview(DummyConfig, concurrency=3, max_per_repo=1,
+                            review=fake_review(delay=0.02, running=running))
+        report = batch.run(jobs + jobs[:2])
+        self.assertEqual(running["max"], 3)
+        self.assertEqual((report["pull_requests"], report["reviewed"], report["failed"]), (10, 9, 1))
+        self.assertEqual((report["comments"], report["estimated_tokens"]), (9, 900))
+        failed = [r for r in report["results"] if r["status"] == "failed"]
+        self.assertEqual(failed[0]["reason"], "LLM unreachable")
+
+    def test_token_budget_stops_new_reviews(self):
+        jobs = [ReviewJob("acme/api", 20 + i, head_sha="h") for i in range(5)]
+        report = BatchReview(DummyConfig, concurrency=1, token_budget=250, review=fake_review(tokens=100)).run(jobs)
+        self.assertEqual([r["status"] for r in report["results"]], ["reviewed"] * 3 + ["skipped"] * 2)
+        self.assertEqual(report["results"][-1]["reason"], "token budget spent")
+
+    @patch("batch_review.fetch_job")
+    def test_jobs_are_looked_up_before_review(self, mock_fetch):
+        mock_fetch.side_effect = lambda config, repo, number: (
+            (ReviewJob(repo, number, head_sha="abc"), None) if number == "1" else (None, "closed"))
+        reviewed = []
+
+        def review(job, config):
+            reviewed.append(job.head_sha)
+            return fake_review()(job, config)
+
+        report = BatchReview(DummyConfig, review=review).run([ReviewJob("acme/api", 1), ReviewJob("acme/api", 2)])
+        self.assertEqual(reviewed, ["abc"])
+        self.assertEqual([(r["status"], r.get("reason")) for r in report["results"]],
+                         [("reviewed", None), ("skipped", "closed")])
+
+    @patch("batch_review.get_http_client")
+    def test_rate_budget_waits_for_the_reset(self, mock_client):
+        mock_client.return_value.get.return_value = page({"resources": {"core": {"remaining": 10, "reset": 160}}})
+        slept = []
+        budget = GitHubRateBudget(DummyConfig, reserve=100, clock=lambda: 100.0, sleep=slept.append)
+        budget.wait()
+        self.assertEqual(slept, [61.0])
+        mock_client.return_value.get.return_value = page({"resources": {"core": {"remaining": 4000, "reset": 0}}})
+        budget.wait()
+        self.assertEqual(budget.waited, 61.0)
+
+class TestDryRun(unittest.TestCase):
+
+    @patch("comment_publisher_github.get_http_client")
+    def test_review_is_written_instead_of_posted(self, mock_client):
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output, True)
+
+        class DryRunConfig:
+            GITHUB_TOKEN = None
+            GITHUB_API_URL = "https://api.github.com"
+            REVIEW_OUTPUT_DIR = output
+
+        comments = [{"file": "a.py", "line": "2", "comment": "Unused."}]
+        with pr_context.pull_request_env(REPOSITORY_GITHUB="acme/api", PR_NUMBER_GITHUB="12", HEAD_SHA="abc"):
+            self.assertTrue(publish_review_with_suggestions(comments, DryRunConfig, diff_index=DiffIndex.parse(DIFF)))
+        mock_client.assert_not_called()
+        with open(os.path.join(output, "acme__api", "12.json")) as f:
+            review = json.load(f)
+        self.assertEqual(review["head_sha"], "abc")
+        self.assertEqual(review["parts"][0]["comments"], [{"path": "a.py", "position": 2, "body": "Unused."}])
+
+
+if __name__ == "__main__":
+    unittest.main()
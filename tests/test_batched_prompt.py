@@ -0,0 +1,102 @@
+import json
+import unittest
+
+from diff_extractor import pack_diff_chunks
+from diff_index import DiffIndex
+from llm_client import BATCHED_PROMPT_PREFIX, build_batched_prompt, build_prompt, parse_batched_response
+from main import review_chunks
+from tests.stub_llm_server import StubLLMServer
+
+DIFF = (
+    "diff --git a/src/app.py b/src/app.py\n"
+    "--- a/src/app.py\n"
+    "+++ b/src/app.py\n"
+    "@@ -10,2 +10,3 @@\n"
+    " a\n"
+    "+b\n"
+    " c\n"
+    "diff --git a/src/util.py b/src/util.py\n"
+    "--- a/src/util.py\n"
+    "+++ b/src/util.py\n"
+    "@@ -1 +1,2 @@\n"
+    " x\n"
+    "+y\n"
+)
+
+class BatchedConfig:
+    def __init__(self, endpoint="unused"):
+        self.LLM_ENDPOINT = endpoint
+        self.LLM_MAX_CONCURRENCY = 1
+        self.LLM_PROMPT_FORMAT = "batched"
+
+class TestBatchedPrompt(unittest.TestCase):
+
+    def test_prefix_is_stable(self):
+        chunk = pack_diff_chunks(DIFF, 2000)[0]
+        prompt = build_batched_prompt(chunk)
+        self.assertTrue(prompt.startswith(BATCHED_PROMPT_PREFIX + "\n"))
+        self.assertTrue(build_batched_prompt("other").startswith(BATCHED_PROMPT_PREFIX))
+        self.assertEqual(build_prompt(chunk, BatchedConfig()), prompt)
+
+    def test_demultiplex_and_validate(self):
+        response = json.dumps({"files": {
+            "src/app.py": [
+                {"line": "11", "comment": "fine"},
+                {"line": 11, "comment": ""},
+                {"line": "200", "comment": "not in the diff"},
+            ],
+            "util.py": [{"line": "1-2", "comment": "range"}],
+            "src/unknown.py": [{"line": "1", "comment": "not in the batch"}],
+        }})
+        by_file, rejected = parse_batched_response("Sure! " + response, DIFF)
+        self.assertEqual(by_file, {
+            "src/app.py": [{"file": "src/app.py", "line": "11", "comment": "fine"}],
+            "src/util.py": [{"file": "src/util.py", "line": "1-2", "comment": "range"}],
+        })
+        self.assertEqual(rejected, 3)
+
+    def test_lines_near_a_hunk_are_kept_for_snapping(self):
+        response = json.dumps({"files": {"src/app.py": [
+            {"line": str(line), "comment": f"on {line}"} for line in (9, 14, 15, 30)
+        ]}})
+        by_file, rejected = parse_batched_response(response, DIFF, max_distance=10)
+        self.assertEqual([c["line"] for c in by_file["src/app.py"]], ["9", "14", "15"])
+        self.assertEqual(rejected, 1)
+        self.assertEqual(parse_batched_response(response, DIFF)[1], 4)
+
+    def test_single_list_answer_is_accepted(self):
+        response = json.dumps({"comments": [{"file": "b/src/util.py", "line": "2", "comment": "ok"}]})
+        by_file, rejected = parse_batched_response(response, DIFF)
+        self.assertEqual(list(by_file), ["src/util.py"])
+        self.assertEqual(rejected, 0)
+        self.assertEqual(parse_batched_response("no json", DIFF), (None, 0))
+
+    def test_review_chunks_with_batched_prompts(self):
+        def respond(payload):
+            self.assertTrue(payload["prompt"].startswith(BATCHED_PROMPT_PREFIX))
+            self.assertTrue(payload["cache_prompt"])
+            return json.dumps({"files": {"src/app.py": [{"line": "11", "comment": "a"}],
+                                         "src/util.py": [{"line": "2", "comment": "u"}]}})
+
+        chunks = pack_diff_chunks(DIFF, 2000)
+        with StubLLMServer(respond=respond) as server:
+            results = review_chunks(chunks, BatchedConfig(server.url))
+            self.assertEqual(len(server.requests), 1)
+        self.assertEqual(sorted(c["file"] for c in results[0]), ["src/app.py", "src/util.py"])
+
+    def test_comments_near_a_hunk_are_published_on_the_snapped_line(self):
+        def respond(payload):
+            return json.dumps({"files": {"src/app.py": [{"line": "14", "comment": "just below"}]}})
+
+        config = BatchedConfig()
+        config.COMMENT_LINE_SNAP = 10
+        with StubLLMServer(respond=respond) as server:
+            config.LLM_ENDPOINT = server.url
+            results = review_chunks(pack_diff_chunks(DIFF, 2000), config)
+        self.assertEqual(results[0], [{"file": "src/app.py", "line": "14", "comment": "just below"}])
+        placement = DiffIndex.parse(DIFF).resolve_comments(results[0], max_distance=10)[0]
+        self.assertEqual(placement["line"], 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from checkpoint import ReviewCheckpoint
+from main import review_chunks
+from scheduler import ReviewBudget
+
+
+class DummyConfig:
+    LLM_ENDPOINT = "unused"
+    LLM_MAX_CONCURRENCY = 2
+    LLM_PROMPT_FORMAT = "single"
+
+
+def answer(chunk, config, cache=None):
+    if chunk == "broken":
+        return None
+    return {"content": json.dumps({"comments": [{"file": chunk, "line": 1, "comment": "ok"}]})}
+
+
+class TestReviewCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def checkpoint(self, head_sha="abc123"):
+        return ReviewCheckpoint.for_pull_request(self.tmp.name, "owner/repo", "7", head_sha)
+
+    def test_entries_survive_a_new_run(self):
+        first = self.checkpoint()
+        first.put("chunk-a", [{"file": "a.py"}])
+        first.put("chunk-b", [])
+        # A crash while appending leaves a partial line behind
+        with open(first.path, "a", encoding="utf-8") as f:
+            f.write('{"key": "trunc')
+        first.close()
+
+        second = self.checkpoint()
+        self.assertEqual(len(second), 2)
+        self.assertEqual(second.get("chunk-a"), [{"file": "a.py"}])
+        self.assertEqual(second.get("chunk-b"), [])
+        self.assertIsNone(second.get("chunk-c"))
+        self.assertEqual(second.restored, 2)
+
+    def test_other_head_commit_is_ignored(self):
+        old = self.checkpoint("old")
+        old.put("chunk-a", [{"file": "a.py"}])
+        old.close()
+
+        new = self.checkpoint("new")
+        self.assertNotIn("chunk-a", new)
+        new.put("chunk-b", [])
+        new.close()
+        with open(new.path, encoding="utf-8") as f:
+            self.assertEqual(len(f.read().splitlines()), 2)
+
+    def test_clear(self):
+        checkpoint = self.checkpoint()
+        checkpoint.put("chunk-a", [])
+        checkpoint.clear()
+        self.assertFalse(os.path.exists(checkpoint.path))
+        self.assertIsNone(ReviewCheckpoint.for_pull_request(self.tmp.name, "owner/repo", "7", None))
+
+    @patch("main.query_llm", side_effect=answer)
+    def test_rerun_skips_completed_chunks(self, mock_query):
+        chunks = ["chunk-a", "broken", "chunk-c"]
+        first = self.checkpoint()
+        review_chunks(chunks, DummyConfig, checkpoint=first)
+        first.close()
+        self.assertEqual(mock_query.call_count, 3)
+
+        # Only the failed chunk is sent again
+        second = self.checkpoint()
+        results = review_chunks(chunks, DummyConfig, checkpoint=second)
+        self.assertEqual(mock_query.call_count, 4)
+        self.assertEqual(mock_query.call_args.args[0], "broken")
+        self.assertEqual(results[0], [{"file": "chunk-a", "line": 1, "comment": "ok"}])
+        self.assertEqual(second.restored, 2)
+
+    def test_completed_chunks_do_not_use_the_budget(self):
+        checkpoint = self.checkpoint()
+        checkpoint.put("x" * 400, [])
+        budget = ReviewBudget(tokens=50)
+        admitted = list(budget.admit(["x" * 400, "y" * 100], is_free=checkpoint.__contains__))
+        self.assertEqual(admitted, ["x" * 400, "y" * 100])
+
+
+if __name__ == "__main__":
+    unittest.main()
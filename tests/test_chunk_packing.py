@@ -0,0 +1,121 @@
+import unittest
+
+from diff_extractor import is_chunk_anchor, pack_diff_chunks, split_diff_intelligent, iter_packed_chunks
+from diff_index import DiffIndex, iter_file_diffs, iter_indexed
+from utils import estimate_tokens
+
+def file_block(path, hunks, lines_per_hunk=5):
+    lines = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+    start = 1
+    for _ in range(hunks):
+        lines.append(f"@@ -{start},{lines_per_hunk} +{start},{lines_per_hunk} @@")
+        lines.extend(f"+value_{start + i} = compute({i})" for i in range(lines_per_hunk))
+        start += lines_per_hunk + 10
+    return "\n".join(lines)
+
+def plain_paths(count):
+    """
+    Returns `count` paths, none of which ends a chunk.
+    """
+    return [p for p in (f"f{i}.py" for i in range(10 * count)) if not is_chunk_anchor(p)][:count]
+
+class TestPackDiffChunks(unittest.TestCase):
+
+    def test_small_files_share_a_chunk(self):
+        paths = plain_paths(5)
+        diff = "\n".join(file_block(path, 1) for path in paths)
+        self.assertEqual(len(split_diff_intelligent(diff)), 5)
+        chunks = pack_diff_chunks(diff, token_budget=2000)
+        self.assertEqual(len(chunks), 1)
+        for path in paths:
+            self.assertIn(f"diff --git a/{path} b/{path}", chunks[0])
+
+    def test_anchor_files_end_a_chunk(self):
+        anchor = next(p for p in (f"f{i}.py" for i in range(100)) if is_chunk_anchor(p))
+        paths = plain_paths(2)
+        diff = "\n".join(file_block(path, 1) for path in [paths[0], anchor, paths[1]])
+        chunks = pack_diff_chunks(diff, token_budget=2000)
+        self.assertEqual(len(chunks), 2)
+        self.assertIn(anchor, chunks[0])
+        self.assertIn(paths[1], chunks[1])
+
+    def test_a_changed_file_leaves_later_chunks_unchanged(self):
+        paths = [f"f{i}.py" for i in range(40)]
+        before = pack_diff_chunks("\n".join(file_block(p, 2) for p in paths), 400)
+        # f3.py grows from 2 to 6 hunks
+        after = pack_diff_chunks("\n".join(file_block(p, 6 if p == "f3.py" else 2) for p in paths), 400)
+        self.assertNotEqual(before, after)
+        first_anchor = next(i for i, p in enumerate(paths) if i > 3 and is_chunk_anchor(p))
+        moved = [c for c in after if c not in before]
+        self.assertTrue(moved)
+        for chunk in moved:
+            self.assertTrue(any(f"a/{p} " in chunk for p in paths[:first_anchor + 1]))
+        self.assertEqual(before[-3:], after[-3:])
+
+    def test_chunks_respect_budget_with_overhead(self):
+        diff = "\n".join(file_block(f"f{i}.py", 2) for i in range(20))
+        budget, overhead = 300, 100
+        chunks = pack_diff_chunks(diff, budget, overhead)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), budget - overhead)
+
+    def test_large_file_splits_at_hunk_boundaries(self):
+        diff = file_block("big.py", 10)
+        chunks = pack_diff_chunks(diff, token_budget=200)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            lines = chunk.splitlines()
+            # Every piece restates the file header and starts with a whole hunk
+            self.assertEqual(lines[0], "diff --git a/big.py b/big.py")
+            self.assertTrue(lines[3].startswith("@@"))
+            self.assertEqual(sum(1 for l in lines if l.startswith("Line ")) % 5, 0)
+        annotated = "\n".join(chunks)
+        for hunk in DiffIndex.parse(diff).get("big.py").hunks:
+            self.assertEqual(annotated.count(hunk.header), 1)
+
+    def test_oversized_hunk_is_cut_between_lines(self):
+        diff = file_block("huge.py", 1, lines_per_hunk=200)
+        chunks = pack_diff_chunks(diff, token_budget=300)
+        self.assertGreater(len(chunks), 1)
+        numbered = [l for c in chunks for l in c.splitlines() if l.startswith("Line ")]
+        self.assertEqual(len(numbered), 200)
+        for chunk in chunks:
+            self.assertTrue(chunk.splitlines()[3].startswith("@@"))
+
+class TestIterPackedChunks(unittest.TestCase):
+
+    def test_first_chunk_is_yielded_before_the_diff_is_read(self):
+        files_read = []
+
+        def lines():
+            for i in range(50):
+                files_read.append(i)
+                yield from file_block(f"f{i}.py", 2, 20).splitlines()
+
+        chunks = iter_packed_chunks(iter_file_diffs(lines()), token_budget=400)
+        first = next(chunks)
+        self.assertIn("f0.py", first)
+        self.assertLess(len(files_read), 50)
+        rest = list(chunks)
+        self.assertEqual(len(files_read), 50)
+        self.assertTrue(all(estimate_tokens(c) <= 400 for c in [first] + rest))
+
+    def test_streaming_keeps_every_line(self):
+        diff = "\n".join(file_block(f"f{i}.py", 3, 8) for i in range(20))
+        streamed = list(iter_packed_chunks(iter_file_diffs(diff.splitlines()), 300))
+        self.assertEqual(sorted("\n".join(streamed).splitlines()), sorted(DiffIndex.parse(diff).annotated().splitlines()))
+
+    def test_released_files_keep_their_positions(self):
+        paths = plain_paths(3)
+        diff = "\n".join(file_block(path, 2) for path in paths)
+        index = DiffIndex()
+        chunks = list(iter_packed_chunks(iter_indexed(iter_file_diffs(diff.splitlines()), index, release=True), 2000))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(index.paths, paths)
+        self.assertTrue(all(not hunk.lines for f in index for hunk in f.hunks))
+        self.assertEqual(index.position(paths[1], 16), DiffIndex.parse(diff).position(paths[1], 16))
+
+
+if __name__ == "__main__":
+    unittest.main()
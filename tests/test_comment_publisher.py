@@ -2,7 +2,7 @@ import os
 import unittest
 from unittest.mock import patch
 
-from src.comment_publisher import post_comments
+from comment_publisher import post_comments
 
 class DummyConfig:
     CI_PLATFORM = "github"
@@ -11,8 +11,8 @@ class DummyConfig:
 
 class TestPostComments(unittest.TestCase):
 
-    @patch("src.comment_publisher.publish_review_with_suggestions")
-    @patch("src.config.load_config")
+    @patch("comment_publisher.publish_review_with_suggestions")
+    @patch("comment_publisher.load_config")
     def test_post_comments_calls_review(self, mock_load_config, mock_publish):
         # Configure le load_config pour renvoyer DummyConfig
         mock_load_config.return_value = DummyConfig
@@ -29,7 +29,7 @@ class TestPostComments(unittest.TestCase):
         mock_publish.assert_called_once_with(comments, DummyConfig)
         self.assertTrue(result)
 
-    @patch("src.config.load_config")
+    @patch("comment_publisher.load_config")
     def test_post_comments_unsupported_platform(self, mock_load_config):
         class Config:
             CI_PLATFORM = "gitlab"
@@ -0,0 +1,80 @@
+import json
+import unittest
+
+from diff_extractor import pack_diff_chunks
+from diff_index import CompactEncoding, DiffIndex
+from llm_client import COMPACT_FORMAT_NOTE, build_prompt, parse_batched_response
+from utils import estimate_tokens
+
+DIFF = "\n".join([
+    "diff --git a/app.py b/app.py",
+    "--- a/app.py",
+    "+++ b/app.py",
+    "@@ -1,15 +1,11 @@",
+    " import os",
+    " import sys",
+    " ",
+    "-def old_a():",
+    "-    pass",
+    "-def old_b():",
+    "-    pass",
+    "-def old_c():",
+    "+def new():",
+    " ",
+    " ",
+    " def run():",
+    "-    if ready:",
+    "-        go()",
+    "+  if ready:",
+    "+      go()",
+    " ",
+    " # end",
+])
+
+class CompactConfig:
+    LLM_PROMPT_FORMAT = "batched"
+    DIFF_ENCODING = "compact"
+
+class TestCompactEncoding(unittest.TestCase):
+
+    def test_hunk_rendering(self):
+        hunk = DiffIndex.parse(DIFF).get("app.py").hunks[0]
+        self.assertEqual(CompactEncoding(context=1, removed=2).hunk_lines(hunk), [
+            "@@ -1,15 +1,11 @@",
+            "3: ",
+            "-def old_a():",
+            "-    pass",
+            "-[3 more removed lines]",
+            "4:+def new():",
+            "5: ",
+            "...",
+            "7: def run():",
+            "8-9:~[whitespace-only change]",
+            "10: ",
+        ])
+        everything = CompactEncoding(context=-1, removed=-1, collapse_whitespace=False).hunk_lines(hunk)
+        self.assertIn("1: import os", everything)
+        self.assertIn("9:+      go()", everything)
+        self.assertEqual(sum(line.startswith("-") for line in everything), 7)
+
+    def test_saves_tokens_and_keeps_line_numbers(self):
+        annotated = pack_diff_chunks(DIFF, 1000)
+        encoding = CompactEncoding()
+        compact = pack_diff_chunks(DIFF, 1000, encoding=encoding)
+        self.assertLess(len(compact[0]), len(annotated[0]))
+        self.assertEqual(encoding.saved_chars, len(annotated[0]) - len(compact[0]))
+        self.assertLess(estimate_tokens(compact[0]), estimate_tokens(annotated[0]))
+
+        # Hunk headers are kept, so comments are validated and placed as before
+        response = json.dumps({"files": {"app.py": [{"line": "8", "comment": "Indentation changed."}]}})
+        by_file, rejected = parse_batched_response(response, compact[0])
+        self.assertEqual(rejected, 0)
+        self.assertEqual(DiffIndex.parse(DIFF).position("app.py", 8), 15)
+
+    def test_prompt_describes_the_encoding(self):
+        self.assertIn(COMPACT_FORMAT_NOTE, build_prompt("", CompactConfig))
+        self.assertIsNone(CompactEncoding.from_config(object()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import pr_context
+from config import Config
+from diff_extractor import diff_source, iter_diff_lines
+from daemon import FairQueue, ReviewDaemon, ReviewJob, job_from_event, make_server, review_pull_request
+from tests.stub_llm_server import StubLLMServer
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures",
+                       "webhook_pull_request_synchronize.json")
+SECRET = "s3cret"
+
+DIFF = "\n".join([
+    "diff --git a/app.py b/app.py", "--- a/app.py", "+++ b/app.py", "@@ -1,1 +1,2 @@",
+    " import os", "+print(os.environ)",
+])
+
+def load_fixture():
+    with open(FIXTURE, "rb") as f:
+        return f.read()
+
+def sign(body):
+    return "sha256=" + hmac.new(SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+class TestFairQueue(unittest.TestCase):
+
+    def test_repositories_are_served_round_robin(self):
+        queue = FairQueue(max_per_repo=1)
+        for job in (ReviewJob("a/a", 1), ReviewJob("a/a", 2), ReviewJob("b/b", 1)):
+            queue.put(job)
+        first = queue.get(timeout=0)
+        self.assertEqual(first.key, ("a/a", "1"))
+        # a/a is at its limit: b/b goes next even though a/a#2 came first
+        self.assertEqual(queue.get(timeout=0).key, ("b/b", "1"))
+        self.assertIsNone(queue.get(timeout=0))
+        queue.done(first)
+        self.assertEqual(queue.get(timeout=0).key, ("a/a", "2"))
+
+    def test_newer_push_replaces_the_waiting_job(self):
+        queue = FairQueue(max_per_repo=2)
+        self.assertTrue(queue.put(ReviewJob("a/a", 1, head_sha="old")))
+        self.assertFalse(queue.put(ReviewJob("a/a", 1, head_sha="new")))
+        running = queue.get(timeout=0)
+        self.assertEqual(running.head_sha, "new")
+        # The same pull request never runs twice at once
+        queue.put(ReviewJob("a/a", 1, head_sha="newer"))
+        self.assertIsNone(queue.get(timeout=0))
+        queue.done(running)
+        self.assertEqual(queue.get(timeout=0).head_sha, "newer")
+
+class TestWebhooks(unittest.TestCase):
+
+    def setUp(self):
+        self.seen = []
+
+        def review(job, config):
+            self.seen.append((job.repo, job.pr_number, job.head_sha))
+
+        self.daemon = ReviewDaemon(Config, workers=2, review=review)
+        self.daemon.start()
+        self.server = make_server(self.daemon, port=0, secret=SECRET)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.url = f"http://{host}:{port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.daemon.stop(timeout=5)
+
+    def post(self, body, event="pull_request", signature=None):
+        request = urllib.request.Request(self.url + "/webhook", data=body, method="POST", headers={
+            "Content-Type": "application/json", "X-GitHub-Event": event,
+            "X-Hub-Signature-256": signature or sign(body),
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=5) as resp:
+                return resp.status, json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_recorded_delivery_is_reviewed(self):
+        status, reply = self.post(load_fixture())
+        self.assertEqual((status, reply["queued"]), (202, True))
+        wait_for(lambda: self.daemon.stats()["completed"] == 1)
+        self.assertEqual(self.seen, [("octo-org/widgets", "42", "2222222222222222222222222222222222222222")])
+        with urllib.request.urlopen(self.url + "/health", timeout=5) as resp:
+            self.assertEqual(json.loads(resp.read())["completed"], 1)
+
+    def test_rejected_deliveries(self):
+        body = load_fixture()
+        self.assertEqual(self.post(body, signature="sha256=0")[0], 401)
+        self.assertEqual(self.post(b"{}", event="ping")[0], 200)
+        closed = json.loads(body)
+        closed["action"] = "closed"
+        self.assertEqual(self.post(json.dumps(closed).encode("utf-8"))[1], {"queued": False})
+        self.assertEqual(self.daemon.stats()["pending"] + self.daemon.stats()["completed"], 0)
+
+    def test_job_from_event_skips_drafts(self):
+        payload = json.loads(load_fixture())
+        self.assertEqual(job_from_event("pull_request", payload).base_sha, "0" * 40)
+        payload["pull_request"]["draft"] = True
+        self.assertIsNone(job_from_event("pull_request", payload))
+        self.assertIsNone(job_from_event("issues", payload))
+
+class TestReviewWorker(unittest.TestCase):
+
+    def test_pipeline_runs_for_the_job(self):
+        # Workers see the pull request of their job, not the process environment
+        def respond(payload):
+            return json.dumps({"comments": [{"file": "app.py", "line": "2", "comment": "Leaks the environment."}]})
+
+        published = []
+
+        def diff_lines(config):
+            self.assertEqual(pr_context.getenv("REPOSITORY_GITHUB"), "octo-org/widgets")
+            return iter(DIFF.splitlines())
+
+        def post(comments, **kwargs):
+            published.append((pr_context.getenv("PR_NUMBER_GITHUB"), comments))
+            return True
+
+        with StubLLMServer(respond=respond) as server:
+            class ServiceConfig(Config):
+                LLM_ENDPOINT = server.url
+                LLM_ENDPOINTS = ""
+                LLM_PROMPT_FORMAT = "single"
+                LLM_STREAM = False
+                INCREMENTAL_REVIEW = False
+                REVIEW_CACHE_DIR = ""
+                CHECKPOINT_DIR = ""
+                REVIEW_TIME_BUDGET = 0
+                REVIEW_TOKEN_BUDGET = 0
+                DEDUP_COMMENTS = False
+                EXCLUDE_PATTERNS = []
+                INCLUDE_PATTERNS = []
+
+            with patch("main.iter_diff_lines", side_effect=diff_lines), \
+                 patch("main.post_comments", side_effect=post):
+                job = json.loads(load_fixture())
+                metrics = review_pull_request(job_from_event("pull_request", job), ServiceConfig)
+
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(published, [("42", [{"file": "app.py", "line": "2", "comment": "Leaks the environment."}])])
+        self.assertEqual(metrics.counters["reviewed_files"], 1)
+        self.assertIsNone(pr_context.current())
+
+    @patch("diff_extractor.iter_diff_lines_from_pr", return_value=iter(["from the API"]))
+    @patch("diff_extractor.iter_diff_lines_from_git", return_value=iter(["from git"]))
+    def test_git_diff_source_needs_a_workspace(self, mock_git, mock_api):
+        class GitConfig:
+            DIFF_SOURCE = "git"
+
+        job = ReviewJob("octo-org/widgets", 42, head_sha="h", base_sha="b")
+        with pr_context.pull_request_env(**job.env()):
+            self.assertEqual(diff_source(GitConfig), "api")
+            self.assertEqual(list(iter_diff_lines(GitConfig)), ["from the API"])
+        mock_git.assert_not_called()
+        with pr_context.pull_request_env(**dict(job.env(), GITHUB_WORKSPACE="/checkout")):
+            self.assertEqual(list(iter_diff_lines(GitConfig)), ["from git"])
+        self.assertEqual(mock_git.call_args.kwargs["repo_dir"], "/checkout")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+from comment_publisher_github import get_existing_review_comments
+from dedup import deduplicate_comments, drop_existing, normalize_text
+
+class DummyConfig:
+    GITHUB_TOKEN = "token"
+    GITHUB_API_URL = "https://api.github.com"
+
+def page(comments, next_url=None):
+    resp = MagicMock()
+    resp.json.return_value = comments
+    resp.links = {"next": {"url": next_url}} if next_url else {}
+    return resp
+
+class TestDeduplicateComments(unittest.TestCase):
+
+    def test_merges_near_duplicates_on_adjacent_lines(self):
+        comments = [
+            {"file": "a.py", "line": "12", "comment": "Possible None dereference of `user` here."},
+            {"file": "a.py", "line": "10", "comment": "Possible None dereference of user here, check it first."},
+            {"file": "b.py", "line": "10", "comment": "Possible None dereference of user here."},
+        ]
+        result, merged = deduplicate_comments(comments, line_window=3, threshold=0.5)
+        self.assertEqual(merged, 1)
+        self.assertEqual([c["file"] for c in result], ["a.py", "b.py"])
+        self.assertEqual(result[0]["line"], "10")
+        self.assertIn("check it first", result[0]["comment"])
+
+    def test_keeps_distinct_comments(self):
+        comments = [
+            {"file": "a.py", "line": "10", "comment": "This loop never terminates."},
+            {"file": "a.py", "line": "11", "comment": "Variable name is misleading."},
+            {"file": "a.py", "line": "40", "comment": "This loop never terminates."},
+        ]
+        result, merged = deduplicate_comments(comments)
+        self.assertEqual(merged, 0)
+        self.assertEqual(len(result), 3)
+
+    def test_normalize_ignores_code_context(self):
+        self.assertEqual(normalize_text("Use **a** lock!\n\n```python\nx = 1\n```"), "use lock")
+
+class TestDropExisting(unittest.TestCase):
+
+    @patch.dict(os.environ, {"REPOSITORY_GITHUB": "owner/repo", "PR_NUMBER_GITHUB": "1"})
+    @patch("comment_publisher_github.get_http_client")
+    def test_skips_comments_already_posted(self, mock_client):
+        mock_client.return_value.get.side_effect = [
+            page([{"path": "a.py", "body": "Use a lock.\n\n```python\nx += 1\n```"}], next_url="https://next"),
+            page([{"path": "b.py", "body": "Unused import."}]),
+        ]
+        existing = get_existing_review_comments(DummyConfig)
+        self.assertEqual(mock_client.return_value.get.call_count, 2)
+        self.assertEqual(len(existing), 2)
+
+        comments = [
+            {"file": "a.py", "line": "3", "comment": "use a lock"},
+            {"file": "a.py", "line": "5", "comment": "Unused import."},
+        ]
+        remaining, dropped = drop_existing(comments, existing)
+        self.assertEqual(dropped, 1)
+        self.assertEqual(remaining, [comments[1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
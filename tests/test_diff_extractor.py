@@ -1,14 +1,16 @@
 import os
+import re
 import subprocess
 import unittest
 import requests
 from unittest.mock import patch, MagicMock
 
-from src.diff_extractor import split_diff, get_diff_from_pr, filter_diff, split_diff_intelligent
+from diff_extractor import split_diff, get_diff_from_pr, filter_diff, split_diff_intelligent, iter_diff_lines_from_pr
+from diff_index import DiffIndex
 
 class TestDiffExtractor(unittest.TestCase):
 
-    @patch("src.diff_extractor.subprocess.run")
+    @patch("diff_extractor.subprocess.run")
     def test_split_diff_normal(self, mock_run):
         # Create a diff string of 250 characters and split into chunks of 100 characters
         diff_str = "a" * 250
@@ -19,8 +21,8 @@ class TestDiffExtractor(unittest.TestCase):
         self.assertEqual(chunks[1], "a" * 100)
         self.assertEqual(chunks[2], "a" * 50)
 
-    @patch("src.diff_extractor.requests.get")
-    def test_get_diff_from_pr_success(self, mock_get):
+    @patch("diff_extractor.get_http_client")
+    def test_get_diff_from_pr_success(self, mock_client):
         os.environ["REPOSITORY_GITHUB"] = "owner/repo"
         os.environ["PR_NUMBER_GITHUB"] = "1"
         os.environ["GITHUB_TOKEN"] = "dummy_token"
@@ -29,18 +31,36 @@ class TestDiffExtractor(unittest.TestCase):
         fake_response = MagicMock(status_code=200)
         fake_response.text = fake_diff
         fake_response.raise_for_status.return_value = None
-        mock_get.return_value = fake_response
+        mock_client.return_value.get.return_value = fake_response
         
         diff = get_diff_from_pr()
         self.assertEqual(diff, fake_diff)
     
-    @patch("src.diff_extractor.requests.get")
-    def test_get_diff_from_pr_failure(self, mock_get):
+    @patch.dict(os.environ, {"REPOSITORY_GITHUB": "owner/repo", "PR_NUMBER_GITHUB": "1", "GITHUB_TOKEN": "t"})
+    @patch("diff_extractor.get_http_client")
+    def test_streamed_crlf_diff_keeps_positions(self, mock_client):
+        diff = "diff --git a/run.bat b/run.bat\n--- a/run.bat\n+++ b/run.bat\n@@ -0,0 +1,50 @@\n"
+        diff += "".join(f"+echo {i}\r\n" for i in range(50))
+        # Every chunk boundary falls between "\r" and "\n"
+        chunks = re.split(b"(?<=\r)", diff.encode("utf-8"))
+        response = mock_client.return_value.get.return_value.__enter__.return_value
+        response.iter_content.return_value = iter(chunks)
+        response.encoding = None
+
+        lines = list(iter_diff_lines_from_pr())
+        self.assertEqual(len(lines), 54)
+        self.assertEqual(lines[-1], "+echo 49")
+        streamed = DiffIndex.parse("\n".join(lines))
+        self.assertEqual(streamed.position("run.bat", 40), 40)
+        self.assertEqual(streamed.position("run.bat", 40), DiffIndex.parse(diff).position("run.bat", 40))
+
+    @patch("diff_extractor.get_http_client")
+    def test_get_diff_from_pr_failure(self, mock_client):
         os.environ["REPOSITORY_GITHUB"] = "owner/repo"
         os.environ["PR_NUMBER_GITHUB"] = "1"
         os.environ["GITHUB_TOKEN"] = "dummy_token"
         
-        mock_get.side_effect = requests.exceptions.RequestException("Error")
+        mock_client.return_value.get.side_effect = requests.exceptions.RequestException("Error")
         diff = get_diff_from_pr()
         self.assertIsNone(diff)
     
@@ -0,0 +1,109 @@
+import unittest
+
+from diff_index import DiffIndex
+from diff_extractor import filter_diff, preprocess_diff_with_line_numbers, split_diff_intelligent
+from comment_publisher_github import compute_diff_position
+
+SAMPLE_DIFF = (
+    "diff --git a/src/app.py b/src/app.py\n"
+    "index 1234567..89abcde 100644\n"
+    "--- a/src/app.py\n"
+    "+++ b/src/app.py\n"
+    "@@ -1,3 +1,4 @@\n"
+    " import os\n"
+    "-import sys\n"
+    "+import re\n"
+    "+import json\n"
+    " \n"
+    "@@ -20,2 +21,3 @@ def main():\n"
+    "     run()\n"
+    "+    stop()\n"
+    "     return 0\n"
+    "diff --git a/old_name.py b/new_name.py\n"
+    "similarity index 90%\n"
+    "rename from old_name.py\n"
+    "rename to new_name.py\n"
+    "--- a/old_name.py\n"
+    "+++ b/new_name.py\n"
+    "@@ -5,1 +5,1 @@\n"
+    "-x = 1\n"
+    "+x = 2\n"
+)
+
+class TestDiffIndex(unittest.TestCase):
+
+    def test_parse_files_and_hunks(self):
+        index = DiffIndex.parse(SAMPLE_DIFF)
+        self.assertEqual(index.paths, ["src/app.py", "new_name.py"])
+        app = index.get("src/app.py")
+        self.assertEqual(len(app.hunks), 2)
+        self.assertEqual((app.hunks[1].new_start, app.hunks[1].new_count), (21, 3))
+        self.assertEqual(index.get("new_name.py").old_path, "old_name.py")
+
+    def test_positions_continue_across_hunks(self):
+        index = DiffIndex.parse(SAMPLE_DIFF)
+        self.assertEqual(index.position("src/app.py", 1), 1)
+        self.assertEqual(index.position("src/app.py", 2), 3)
+        self.assertEqual(index.position("src/app.py", 4), 5)
+        # The second hunk header occupies position 6
+        self.assertEqual(index.position("src/app.py", 21), 7)
+        self.assertEqual(index.position("src/app.py", 22), 8)
+        self.assertEqual(index.position("new_name.py", 5), 2)
+        self.assertIsNone(index.position("src/app.py", 10))
+        self.assertIsNone(index.position("app.py", 1))
+
+    def test_text_round_trip(self):
+        index = DiffIndex.parse(SAMPLE_DIFF)
+        self.assertEqual(index.text(), SAMPLE_DIFF.rstrip("\n"))
+
+    def test_annotation_keeps_file_headers(self):
+        annotated = preprocess_diff_with_line_numbers(SAMPLE_DIFF)
+        self.assertIn("Line 2: import re", annotated)
+        self.assertIn("[REMOVED] import sys", annotated)
+        self.assertIn("Line 22:     stop()", annotated)
+        self.assertIn("--- a/old_name.py\n+++ b/new_name.py", annotated)
+
+    def test_filter_and_split_on_index(self):
+        index = DiffIndex.parse(SAMPLE_DIFF)
+        filtered = filter_diff(index, exclude_patterns=["new_name"])
+        self.assertIsInstance(filtered, DiffIndex)
+        self.assertEqual(filtered.paths, ["src/app.py"])
+        chunks = split_diff_intelligent(filtered, annotate=True)
+        self.assertEqual(len(chunks), 1)
+        self.assertIn("Line 3: import json", chunks[0])
+
+    def test_compute_diff_position_accepts_index_or_text(self):
+        index = DiffIndex.parse(SAMPLE_DIFF)
+        self.assertEqual(compute_diff_position(index, "src/app.py", 22), 8)
+        self.assertEqual(compute_diff_position(SAMPLE_DIFF, "src/app.py", 22), 8)
+        with self.assertRaises(ValueError):
+            compute_diff_position(index, "src/app.py", 100)
+
+    def test_hunk_membership_and_snapping(self):
+        app = DiffIndex.parse(SAMPLE_DIFF).get("src/app.py")
+        self.assertEqual(list(app.new_lines), [1, 2, 3, 4, 21, 22, 23])
+        self.assertEqual((app.hunk_of(4), app.hunk_of(21), app.hunk_of(10)), (0, 1, None))
+        self.assertEqual(app.nearest_line(7), 4)
+        self.assertEqual(app.nearest_line(19), 21)
+        self.assertIsNone(app.nearest_line(12, max_distance=5))
+
+    def test_resolve_comments_in_batch(self):
+        index = DiffIndex.parse(SAMPLE_DIFF)
+        placements = index.resolve_comments([
+            {"file": "src/app.py", "line": "22"},
+            {"file": "src/app.py", "line": "2-4"},
+            # The range is clipped to the hunk of its last line
+            {"file": "src/app.py", "line": "3-22"},
+            {"file": "src/app.py", "line": "24"},
+            {"file": "src/app.py", "line": "60"},
+            {"file": "src/app.py", "line": "5-3"},
+            {"file": "missing.py", "line": "1"},
+        ], max_distance=3)
+        self.assertEqual(placements[0], {"line": 22, "position": 8})
+        self.assertEqual(placements[1], {"line": 4, "position": 5, "start_line": 2})
+        self.assertEqual(placements[2], {"line": 22, "position": 8, "start_line": 21})
+        self.assertEqual(placements[3], {"line": 23, "position": 9})
+        self.assertEqual(placements[4:], [None, None, None])
+
+if __name__ == "__main__":
+    unittest.main()
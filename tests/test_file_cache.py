@@ -0,0 +1,95 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pr_context
+from file_cache import FileContentCache, MappedLines, close_file_cache, get_file_cache
+from comment_publisher_github import get_code_context
+
+def git(repo, *args):
+    return subprocess.run(
+        ["git", "-C", repo, "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout.strip()
+
+class TestFileContentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        with open(os.path.join(self.root, "app.py"), "w") as f:
+            f.write("".join(f"line {i}\n" for i in range(1, 101)))
+
+    @patch("file_cache.fetch_file_from_github")
+    def test_one_read_per_file(self, mock_fetch):
+        cache = FileContentCache(local_root=self.root)
+        for line in range(1, 201):
+            get_code_context("app.py", line % 100 + 1, 2, ref=None, cache=cache)
+        self.assertEqual(cache.reads, 1)
+        mock_fetch.assert_not_called()
+        self.assertEqual(get_code_context("app.py", 50, 1, cache=cache, ref=None), "line 49\nline 50\nline 51")
+
+    @patch("file_cache.fetch_file_from_github")
+    def test_api_fallback_is_cached_per_ref(self, mock_fetch):
+        mock_fetch.return_value = "a\nb\nc\n"
+        cache = FileContentCache()
+        cache.prefetch(["x.py", "y.py", "x.py"], ref="main")
+        self.assertEqual(mock_fetch.call_count, 2)
+        self.assertEqual(get_code_context("x.py", 2, 0, ref="main", cache=cache), "b")
+        get_code_context("x.py", 2, 0, ref="other", cache=cache)
+        self.assertEqual(mock_fetch.call_count, 3)
+
+    @patch("file_cache.fetch_file_from_github")
+    def test_paths_outside_checkout_are_not_read(self, mock_fetch):
+        mock_fetch.return_value = "remote\n"
+        cache = FileContentCache(local_root=os.path.join(self.root, "sub"))
+        lines = cache.get_lines("../app.py")
+        self.assertEqual(lines.slice(0, 1), ["remote"])
+
+    def test_large_files_are_memory_mapped(self):
+        cache = FileContentCache(local_root=self.root, mmap_threshold=10)
+        lines = cache.get_lines("app.py")
+        self.assertIsInstance(lines, MappedLines)
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(lines.slice(98, 105), ["line 99", "line 100"])
+        cache.close()
+        self.assertTrue(lines._map.closed)
+        self.assertIsNot(cache.get_lines("app.py"), lines)
+
+    @patch.dict(os.environ, {"GITHUB_TOKEN": "token"})
+    @patch("file_cache.get_http_client")
+    def test_files_are_downloaded_from_the_configured_api(self, mock_client):
+        mock_client.return_value.get.return_value = MagicMock(status_code=200, text="remote\n")
+
+        class EnterpriseConfig:
+            GITHUB_API_URL = "https://ghe.example.com/api/v3"
+
+        with pr_context.pull_request_env(REPOSITORY_GITHUB="acme/api", GITHUB_WORKSPACE=None):
+            cache = get_file_cache(EnterpriseConfig)
+            self.assertEqual(cache.get_lines("x.py", "main").slice(0, 1), ["remote"])
+            close_file_cache()
+            self.assertIsNot(get_file_cache(EnterpriseConfig), cache)
+        url = mock_client.return_value.get.call_args.args[0]
+        self.assertEqual(url, "https://ghe.example.com/api/v3/repos/acme/api/contents/x.py")
+
+    @unittest.skipIf(shutil.which("git") is None, "git is not installed")
+    @patch("file_cache.fetch_file_from_github")
+    def test_other_commits_are_read_with_git(self, mock_fetch):
+        git(self.root, "init", "-q")
+        git(self.root, "add", ".")
+        git(self.root, "commit", "-q", "-m", "first")
+        first = git(self.root, "rev-parse", "HEAD")
+        with open(os.path.join(self.root, "app.py"), "w") as f:
+            f.write("changed\n")
+        git(self.root, "commit", "-q", "-am", "second")
+
+        cache = FileContentCache(local_root=self.root)
+        self.assertEqual(cache.get_lines("app.py", first).slice(0, 1), ["line 1"])
+        self.assertEqual(cache.get_lines("app.py", "HEAD").slice(0, 1), ["changed"])
+        mock_fetch.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
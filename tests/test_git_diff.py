@@ -0,0 +1,80 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from diff_extractor import get_diff_from_git, iter_diff_lines_from_git
+from diff_index import DiffIndex
+
+def git(repo, *args):
+    return subprocess.run(
+        ["git", "-C", repo, "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout.strip()
+
+@unittest.skipIf(shutil.which("git") is None, "git is not installed")
+class TestGitDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.repo = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.repo, True)
+        git(self.repo, "init", "-q")
+        body = "".join(f"line {i}\n" for i in range(1, 21))
+        self.write("app.py", body)
+        self.write("old_name.py", "".join(f"value = {i}\n" for i in range(30)))
+        git(self.repo, "add", ".")
+        git(self.repo, "commit", "-q", "-m", "base")
+        self.base = git(self.repo, "rev-parse", "HEAD")
+
+        self.write("app.py", body.replace("line 10\n", "line ten\n"))
+        git(self.repo, "mv", "old_name.py", "new_name.py")
+        git(self.repo, "commit", "-q", "-am", "head")
+        self.head = git(self.repo, "rev-parse", "HEAD")
+
+    def write(self, name, content):
+        with open(os.path.join(self.repo, name), "w") as f:
+            f.write(content)
+
+    def test_diff_matches_changes(self):
+        diff = get_diff_from_git(self.base, self.head, repo_dir=self.repo)
+        index = DiffIndex.parse(diff)
+        self.assertIn("app.py", index.paths)
+        self.assertIn("+line ten", diff)
+        self.assertIn("-line 10", diff)
+        self.assertIsNotNone(index.position("app.py", 10))
+
+    def test_renames_are_detected(self):
+        diff = get_diff_from_git(self.base, self.head, repo_dir=self.repo)
+        self.assertIn("rename from old_name.py", diff)
+        self.assertEqual(DiffIndex.parse(diff).get("new_name.py").old_path, "old_name.py")
+
+        without = get_diff_from_git(self.base, self.head, repo_dir=self.repo, find_renames=False)
+        self.assertNotIn("rename from", without)
+
+    def test_context_lines(self):
+        diff = get_diff_from_git(self.base, self.head, repo_dir=self.repo, context_lines=1)
+        hunk = DiffIndex.parse(diff).get("app.py").hunks[0]
+        self.assertEqual([line[0] for line in hunk.lines], [" ", "-", "+", " "])
+
+    def test_lines_are_streamed(self):
+        lines = iter_diff_lines_from_git(self.base, self.head, repo_dir=self.repo)
+        self.assertTrue(next(lines).startswith("diff --git"))
+        lines.close()
+
+    def test_carriage_returns_do_not_break_lines(self):
+        with open(os.path.join(self.repo, "app.py"), "wb") as f:
+            f.write(b"".join(b"line %d\r\n" % i for i in range(1, 21)).replace(b"line 5\r", b"line\rfive\r"))
+        git(self.repo, "commit", "-q", "-am", "crlf")
+        lines = list(iter_diff_lines_from_git(self.head, "HEAD", repo_dir=self.repo))
+        self.assertIn("+line\rfive", lines)
+        hunk = DiffIndex.parse(lines).get("app.py").hunks[0]
+        self.assertEqual(sum(1 for line in hunk.lines if line[0] in " +"), hunk.new_count)
+        text = get_diff_from_git(self.head, "HEAD", repo_dir=self.repo)
+        self.assertEqual(DiffIndex.parse(text).position("app.py", 20), DiffIndex.parse(lines).position("app.py", 20))
+
+    def test_unknown_revision_returns_none(self):
+        self.assertIsNone(get_diff_from_git("deadbeef", self.head, repo_dir=self.repo))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from http_client import HttpClient
+
+class ScriptedServer:
+    """
+    Answers successive requests with the scripted (status, headers) pairs,
+    then with 200; records the client port of every request.
+    """
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.ports = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.ports.append(self.client_address[1])
+                status, headers = server.script.pop(0) if server.script else (200, {})
+                body = b"ok"
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.do_GET()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/" % self._server.server_address[1]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class TestHttpClient(unittest.TestCase):
+
+    def serve(self, script=()):
+        server = ScriptedServer(script)
+        self.addCleanup(server.close)
+        return server
+
+    def test_retries_server_errors(self):
+        server = self.serve([(503, {}), (502, {})])
+        client = HttpClient(backoff_base=0.01)
+        response = client.get(server.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.retries, 2)
+
+    def test_gives_up_after_max_retries(self):
+        server = self.serve([(500, {})] * 5)
+        client = HttpClient(max_retries=2, backoff_base=0.01)
+        self.assertEqual(client.get(server.url).status_code, 500)
+        self.assertEqual(len(server.ports), 3)
+
+    def test_honours_retry_after(self):
+        server = self.serve([(429, {"Retry-After": "0.3"})])
+        client = HttpClient(backoff_base=0.01)
+        start = time.perf_counter()
+        self.assertEqual(client.get(server.url).status_code, 200)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.3)
+
+    def test_github_rate_limit_reset(self):
+        reset = str(int(time.time()))
+        server = self.serve([(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset})])
+        client = HttpClient(backoff_base=0.01, max_retry_wait=5)
+        self.assertEqual(client.get(server.url).status_code, 200)
+        self.assertEqual(client.retries, 1)
+
+    def test_long_rate_limit_is_not_waited(self):
+        reset = str(int(time.time()) + 3600)
+        server = self.serve([(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset})])
+        client = HttpClient(max_retry_wait=5)
+        self.assertEqual(client.get(server.url).status_code, 403)
+        self.assertEqual(client.retries, 0)
+
+    def test_plain_client_errors_are_not_retried(self):
+        server = self.serve([(404, {}), (403, {})])
+        client = HttpClient(backoff_base=0.01)
+        self.assertEqual(client.get(server.url).status_code, 404)
+        self.assertEqual(client.get(server.url).status_code, 403)
+        self.assertEqual(client.retries, 0)
+
+    def test_connections_are_reused(self):
+        server = self.serve()
+        client = HttpClient()
+        for _ in range(3):
+            client.get(server.url)
+        self.assertEqual(len(set(server.ports)), 1)
+
+    def test_connection_errors_raise_after_retries(self):
+        client = HttpClient(max_retries=1, backoff_base=0.01, timeout=1)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get("http://127.0.0.1:9/")
+        self.assertEqual(client.retries, 1)
+
+    def test_posts_are_not_retried_after_reaching_the_server(self):
+        # The review may exist already: a 502 or a read timeout is not retried
+        server = self.serve([(502, {}), (502, {})])
+        client = HttpClient(backoff_base=0.01)
+        self.assertEqual(client.post(server.url, json={}).status_code, 502)
+        self.assertEqual(client.retries, 0)
+        # ...unless the caller knows the request is safe to repeat
+        self.assertEqual(client.post(server.url, json={}, idempotent=True).status_code, 200)
+        self.assertEqual(client.retries, 1)
+
+    def test_posts_are_retried_on_rate_limits_and_refused_connections(self):
+        server = self.serve([(429, {"Retry-After": "0"})])
+        client = HttpClient(backoff_base=0.01)
+        self.assertEqual(client.post(server.url, json={}).status_code, 200)
+        self.assertEqual(client.retries, 1)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.post("http://127.0.0.1:9/", json={}, max_retries=1)
+        self.assertEqual(client.retries, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+
+from diff_index import DiffIndex, iter_file_diffs, iter_restricted
+from comment_publisher_github import get_last_reviewed_sha, publish_review_with_suggestions
+from main import fetch_new_changes
+
+PR_DIFF = (
+    "diff --git a/app.py b/app.py\n"
+    "--- a/app.py\n"
+    "+++ b/app.py\n"
+    "@@ -1,2 +1,3 @@\n"
+    " a\n"
+    "+b\n"
+    " c\n"
+    "@@ -40,2 +41,3 @@\n"
+    " x\n"
+    "+y\n"
+    " z\n"
+    "diff --git a/other.py b/other.py\n"
+    "--- a/other.py\n"
+    "+++ b/other.py\n"
+    "@@ -1 +1 @@\n"
+    "-old\n"
+    "+new\n"
+)
+
+# The last push only touched the second hunk of app.py
+NEW_COMMITS_DIFF = (
+    "diff --git a/app.py b/app.py\n"
+    "--- a/app.py\n"
+    "+++ b/app.py\n"
+    "@@ -42 +42 @@\n"
+    "-why\n"
+    "+y\n"
+)
+
+class DummyConfig:
+    GITHUB_TOKEN = "token"
+    GITHUB_API_URL = "https://api.github.com"
+    DIFF_SOURCE = "api"
+
+def page(reviews, next_url=None):
+    response = MagicMock()
+    response.json.return_value = reviews
+    response.raise_for_status.return_value = None
+    response.links = {"next": {"url": next_url}} if next_url else {}
+    return response
+
+class TestIncrementalReview(unittest.TestCase):
+
+    def setUp(self):
+        os.environ["REPOSITORY_GITHUB"] = "owner/repo"
+        os.environ["PR_NUMBER_GITHUB"] = "1"
+
+    def test_restrict_to_changed_hunks(self):
+        restricted = DiffIndex.parse(PR_DIFF).restrict_to(DiffIndex.parse(NEW_COMMITS_DIFF))
+        self.assertEqual(restricted.paths, ["app.py"])
+        hunks = restricted.get("app.py").hunks
+        self.assertEqual([h.new_start for h in hunks], [41])
+        # Positions still refer to the full pull request diff
+        self.assertEqual(restricted.position("app.py", 42), 6)
+
+    def test_removal_only_change_selects_hunk(self):
+        removal = "diff --git a/app.py b/app.py\n@@ -2 +1,0 @@\n-gone\n"
+        restricted = DiffIndex.parse(PR_DIFF).restrict_to(DiffIndex.parse(removal))
+        self.assertEqual([h.new_start for h in restricted.get("app.py").hunks], [1])
+
+    @patch("comment_publisher_github.get_http_client")
+    def test_last_reviewed_sha_follows_pages(self, mock_client):
+        mock_client.return_value.get.side_effect = [
+            page([{"body": "old <!-- flair:reviewed-sha=aaaaaaa -->"}], next_url="https://next"),
+            page([{"body": "human review"}, {"body": "<!-- flair:reviewed-sha=bbbbbbb -->"}]),
+        ]
+        self.assertEqual(get_last_reviewed_sha(DummyConfig), "bbbbbbb")
+        self.assertEqual(mock_client.return_value.get.call_args.args[0], "https://next")
+
+    @patch("comment_publisher_github.get_http_client")
+    def test_review_body_records_head_sha(self, mock_client):
+        publish_review_with_suggestions(
+            [{"file": "app.py", "line": "2", "comment": "ok"}], DummyConfig,
+            diff_index=DiffIndex.parse(PR_DIFF), head_sha="cafebabe",
+        )
+        body = mock_client.return_value.post.call_args.kwargs["json"]["body"]
+        self.assertIn("<!-- flair:reviewed-sha=cafebabe -->", body)
+
+    @patch("main.get_diff_between")
+    @patch("main.last_reviewed_sha")
+    def test_fetch_new_changes(self, mock_last, mock_between):
+        with patch.dict(os.environ, {"HEAD_SHA": "2222222"}):
+            mock_last.return_value = None
+            self.assertEqual(fetch_new_changes(DummyConfig), (False, None))
+
+            mock_last.return_value = "2222222"
+            self.assertEqual(fetch_new_changes(DummyConfig), (True, None))
+
+            mock_last.return_value = "1111111"
+            mock_between.return_value = NEW_COMMITS_DIFF
+            already_reviewed, changes = fetch_new_changes(DummyConfig)
+            mock_between.assert_called_once_with("1111111", "2222222", DummyConfig)
+            self.assertFalse(already_reviewed)
+            # The streamed pull request diff is restricted to the new hunks
+            file_diffs = list(iter_restricted(iter_file_diffs(PR_DIFF.splitlines()), changes))
+            self.assertEqual([f.path for f in file_diffs], ["app.py"])
+            self.assertEqual([h.new_start for h in file_diffs[0].hunks], [41])
+
+            mock_between.return_value = None
+            self.assertEqual(fetch_new_changes(DummyConfig), (False, None))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,24 +2,24 @@ import unittest
 from unittest.mock import patch, MagicMock
 import requests
 
-from src.llm_client import query_llm, build_llm_prompt
+from llm_client import query_llm, build_llm_prompt
 
 class DummyConfig:
     LLM_ENDPOINT = "http://localhost:8080/predict"
 
 class TestLLMClient(unittest.TestCase):
 
-    @patch("src.llm_client.requests.post")
-    def test_query_llm_success(self, mock_post):
+    @patch("llm_client.get_http_client")
+    def test_query_llm_success(self, mock_client):
         fake_response = {"response": "This is the LLM response", "comments": []}
-        mock_post.return_value = MagicMock(status_code=200, json=lambda: fake_response)
+        mock_client.return_value.post.return_value = MagicMock(status_code=200, json=lambda: fake_response)
         
         result = query_llm("diff chunk", DummyConfig())
         self.assertEqual(result, fake_response)
     
-    @patch("src.llm_client.requests.post")
-    def test_query_llm_failure(self, mock_post):
-        mock_post.side_effect = requests.exceptions.RequestException("Error")
+    @patch("llm_client.get_http_client")
+    def test_query_llm_failure(self, mock_client):
+        mock_client.return_value.post.side_effect = requests.exceptions.RequestException("Error")
         result = query_llm("diff chunk", DummyConfig())
         self.assertIsNone(result)
 
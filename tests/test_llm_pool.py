@@ -0,0 +1,162 @@
+import json
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+import requests
+
+from llm_client import query_llm
+from llm_pool import Endpoint, EndpointPool, get_endpoint_pool, parse_endpoints
+from main import review_chunks
+from tests.stub_llm_server import StubLLMServer
+
+
+class PoolConfig:
+    def __init__(self, endpoints, concurrency=2):
+        self.LLM_ENDPOINT = ""
+        self.LLM_ENDPOINTS = endpoints
+        self.LLM_MAX_CONCURRENCY = concurrency
+        self.LLM_PROMPT_FORMAT = "single"
+        self.LLM_FAILURE_THRESHOLD = 2
+        self.LLM_COOLDOWN = 60
+
+
+def echo_chunk(payload):
+    chunk = payload["prompt"].rsplit("Here is the diff:", 1)[1].strip()
+    return json.dumps({"comments": [{"file": chunk, "line": 1, "comment": "ok"}]})
+
+
+def closed_port_url():
+    server = StubLLMServer()
+    url = server.url
+    server._server.server_close()
+    return url
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestEndpointPool(unittest.TestCase):
+
+    def test_parse_endpoints(self):
+        endpoints = parse_endpoints(" http://a/completion|3, http://b/completion ,http://c|0")
+        self.assertEqual([(e.url, e.weight) for e in endpoints], [("http://a/completion", 3.0), ("http://b/completion", 1.0)])
+        self.assertEqual([e.url for e in parse_endpoints("", default="http://d")], ["http://d"])
+
+    def test_least_outstanding_requests_by_weight(self):
+        heavy, light = Endpoint("heavy", weight=3), Endpoint("light", weight=1)
+        pool = EndpointPool([heavy, light])
+        picked = [pool.acquire().url for _ in range(4)]
+        self.assertEqual(sorted(picked), ["heavy", "heavy", "heavy", "light"])
+
+    def test_circuit_opens_then_probes_after_cooldown(self):
+        clock = FakeClock()
+        bad, good = Endpoint("bad"), Endpoint("good")
+        pool = EndpointPool([bad, good], failure_threshold=2, cooldown=10, clock=clock)
+        for _ in range(2):
+            pool.release(bad, ok=False)
+        self.assertIsNotNone(bad.open_until)
+        self.assertEqual({pool.acquire().url for _ in range(3)}, {"good"})
+
+        clock.now = 11
+        probe = pool.acquire()
+        self.assertIs(probe, bad)
+        # Only one probe at a time while half-open
+        self.assertIs(pool.acquire(), good)
+        pool.release(probe, ok=True)
+        self.assertIsNone(bad.open_until)
+
+    def test_all_open_still_tries(self):
+        only = Endpoint("only")
+        pool = EndpointPool([only], failure_threshold=1)
+        pool.release(only, ok=False)
+        self.assertIs(pool.acquire(), only)
+
+    def test_client_errors_do_not_fail_over(self):
+        pool = EndpointPool([Endpoint("a"), Endpoint("b")])
+        calls = []
+
+        def request(url, last_attempt):
+            calls.append(url)
+            error = requests.exceptions.HTTPError("400")
+            error.response = type("Response", (), {"status_code": 400})()
+            raise error
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            pool.call(request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(e.errors for e in pool.endpoints), 0)
+
+    def test_streams_hold_their_endpoint_until_read(self):
+        only = Endpoint("only")
+        pool = EndpointPool([only])
+        pool.limit(1)
+        self.addCleanup(pool.limit, 0)
+        response = MagicMock()
+        with pool.stream(lambda url, last_attempt: response) as stream:
+            self.assertIs(stream, response)
+            self.assertEqual(only.outstanding, 1)
+            # The cap counts the stream still being generated
+            self.assertFalse(pool._slots.acquire(blocking=False))
+        self.assertEqual(only.outstanding, 0)
+        response.close.assert_called_once()
+
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            with pool.stream(lambda url, last_attempt: MagicMock()):
+                raise requests.exceptions.ChunkedEncodingError("connection lost mid-stream")
+        self.assertEqual((only.outstanding, only.errors), (0, 1))
+
+
+class TestFleet(unittest.TestCase):
+
+    def test_chunks_are_spread_over_servers(self):
+        chunks = [f"chunk-{i}" for i in range(12)]
+        with StubLLMServer(delay=0.05, respond=echo_chunk) as a, StubLLMServer(delay=0.05, respond=echo_chunk) as b:
+            results = review_chunks(chunks, PoolConfig(f"{a.url},{b.url}", concurrency=2))
+            self.assertEqual(len(a.requests) + len(b.requests), 12)
+            self.assertGreaterEqual(min(len(a.requests), len(b.requests)), 4)
+            self.assertLessEqual(max(a.max_in_flight, b.max_in_flight), 2)
+            # Both servers were busy at the same time: 4 requests in flight overall
+            self.assertEqual(a.max_in_flight + b.max_in_flight, 4)
+        self.assertEqual([r[0]["file"] for r in results], chunks)
+
+    def test_global_limit_caps_concurrent_reviews(self):
+        # Two reviews sharing the pool (as in a batch) stay under its limit together
+        with StubLLMServer(delay=0.05, respond=echo_chunk) as server:
+            config = PoolConfig(server.url, concurrency=3)
+            pool = get_endpoint_pool(config)
+            pool.limit(2)
+            self.addCleanup(pool.limit, 0)
+            reviews = [threading.Thread(target=review_chunks, args=([f"chunk-{i}" for i in range(4)], config))
+                       for _ in range(2)]
+            for thread in reviews:
+                thread.start()
+            for thread in reviews:
+                thread.join()
+            self.assertEqual(len(server.requests), 8)
+            self.assertEqual(server.max_in_flight, 2)
+
+    def test_failover_to_healthy_server(self):
+        chunks = [f"chunk-{i}" for i in range(6)]
+        down = closed_port_url()
+        with StubLLMServer(status=503) as busy, StubLLMServer(respond=echo_chunk) as good:
+            config = PoolConfig(f"{down},{busy.url},{good.url}", concurrency=1)
+            results = review_chunks(chunks, config)
+            # The failing servers are paused after LLM_FAILURE_THRESHOLD (2) failures;
+            # requests already routed by the 3 workers may add one more
+            self.assertLessEqual(len(busy.requests), 3)
+            self.assertEqual(len(good.requests), 6)
+        self.assertEqual([r[0]["file"] for r in results], chunks)
+
+    def test_query_llm_returns_none_when_every_server_fails(self):
+        with StubLLMServer(status=400) as bad:
+            self.assertIsNone(query_llm("chunk", PoolConfig(bad.url)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from llm_client import CommentStreamParser, extract_json_from_text, query_llm_stream
+
+class DummyConfig:
+    LLM_ENDPOINT = "http://localhost:8080/completion"
+
+OUTPUT = (
+    'Sure! Here is my review:\n'
+    '{"comments": [\n'
+    '  {"file": "a.py", "line": "3", "comment": "Use a context manager {like this}."},\n'
+    '  {"file": "b.py", "line": "40-45", "comment": "Escaped \\"quote\\" and ] bracket"}\n'
+    ']}\n'
+    'Hope this helps! {"comments": []}'
+)
+
+def sse_response(pieces, consumed):
+    def iter_lines(decode_unicode=False):
+        for piece in pieces:
+            consumed.append(piece)
+            yield "data: " + json.dumps({"content": piece, "stop": False})
+            yield ""
+        yield "data: " + json.dumps({"content": "", "stop": True})
+
+    response = MagicMock()
+    response.iter_lines = iter_lines
+    response.raise_for_status.return_value = None
+    response.__enter__.return_value = response
+    return response
+
+class TestCommentStreamParser(unittest.TestCase):
+
+    def test_character_by_character(self):
+        parser = CommentStreamParser()
+        comments = []
+        for char in OUTPUT:
+            comments.extend(parser.feed(char))
+            if parser.done:
+                break
+        self.assertTrue(parser.done)
+        self.assertEqual([c["file"] for c in comments], ["a.py", "b.py"])
+        self.assertEqual(comments[1]["comment"], 'Escaped "quote" and ] bracket')
+
+    def test_truncated_output_keeps_complete_comments(self):
+        truncated = OUTPUT[:OUTPUT.index('"b.py"') + 10]
+        self.assertEqual(extract_json_from_text(truncated),
+                         {"comments": [json.loads(OUTPUT.splitlines()[2].strip().rstrip(","))]})
+
+    def test_extract_json_without_comments(self):
+        self.assertIsNone(extract_json_from_text("no json here"))
+        self.assertEqual(extract_json_from_text('{"comments": []}'), {"comments": []})
+
+class TestQueryLLMStream(unittest.TestCase):
+
+    @patch("llm_client.get_http_client")
+    def test_stream_stops_after_array_closes(self, mock_client):
+        pieces = [OUTPUT[i:i+7] for i in range(0, len(OUTPUT), 7)]
+        consumed = []
+        mock_post = mock_client.return_value.post
+        mock_post.return_value = sse_response(pieces, consumed)
+
+        comments = list(query_llm_stream("diff chunk", DummyConfig()))
+
+        self.assertEqual(len(comments), 2)
+        self.assertLess(len(consumed), len(pieces))
+        payload = mock_post.call_args.kwargs["json"]
+        self.assertTrue(payload["stream"])
+        self.assertTrue(mock_post.call_args.kwargs["stream"])
+
+    @patch("llm_client.get_http_client")
+    def test_comments_are_yielded_incrementally(self, mock_client):
+        pieces = [OUTPUT[i:i+7] for i in range(0, len(OUTPUT), 7)]
+        consumed = []
+        mock_post = mock_client.return_value.post
+        mock_post.return_value = sse_response(pieces, consumed)
+
+        stream = query_llm_stream("diff chunk", DummyConfig())
+        first = next(stream)
+        self.assertEqual(first["file"], "a.py")
+        # The second comment has not been generated yet
+        self.assertNotIn("b.py", "".join(consumed))
+
+if __name__ == "__main__":
+    unittest.main()
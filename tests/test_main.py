@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from config import Config
+from main import review_chunks, run_review
+from metrics import RunMetrics
+from tests.stub_llm_server import StubLLMServer
+
+DIFF = "\n".join([
+    "diff --git a/app.py b/app.py", "--- a/app.py", "+++ b/app.py", "@@ -1,1 +1,2 @@",
+    " import os", "+print(os.environ)",
+    "diff --git a/lib.py b/lib.py", "--- a/lib.py", "+++ b/lib.py", "@@ -1,1 +1,2 @@",
+    " import sys", "+print(sys.argv)",
+])
+
+
+class StubConfig:
+    def __init__(self, endpoint, concurrency=1):
+        self.LLM_ENDPOINT = endpoint
+        self.LLM_MAX_CONCURRENCY = concurrency
+        self.LLM_PROMPT_FORMAT = "single"
+
+
+def echo_chunk(payload):
+    # Return one comment naming the chunk so ordering can be checked
+    chunk = payload["prompt"].rsplit("Here is the diff:", 1)[1].strip()
+    return json.dumps({"comments": [{"file": chunk, "line": 1, "comment": "ok"}]})
+
+
+class TestReviewChunks(unittest.TestCase):
+
+    def test_results_keep_chunk_order(self):
+        chunks = [f"chunk-{i}" for i in range(6)]
+        with StubLLMServer(delay=0.01, respond=echo_chunk) as server:
+            results = review_chunks(chunks, StubConfig(server.url, concurrency=3))
+        self.assertEqual([r[0]["file"] for r in results], chunks)
+
+    def test_wall_clock_scales_with_concurrency(self):
+        chunks = [f"chunk-{i}" for i in range(8)]
+        delay = 0.2
+        with StubLLMServer(delay=delay, respond=echo_chunk) as server:
+            start = time.perf_counter()
+            review_chunks(chunks, StubConfig(server.url, concurrency=1))
+            sequential = time.perf_counter() - start
+
+            start = time.perf_counter()
+            review_chunks(chunks, StubConfig(server.url, concurrency=4))
+            concurrent = time.perf_counter() - start
+
+            self.assertEqual(server.max_in_flight, 4)
+        self.assertGreaterEqual(sequential, len(chunks) * delay)
+        # 8 chunks over 4 workers is two rounds of requests
+        self.assertLess(concurrent, sequential / 2)
+
+    def test_failed_chunk_is_isolated(self):
+        def flaky(payload):
+            if "chunk-1" in payload["prompt"]:
+                return "not json at all"
+            return echo_chunk(payload)
+
+        chunks = ["chunk-0", "chunk-1", "chunk-2"]
+        with StubLLMServer(respond=flaky) as server:
+            results = review_chunks(chunks, StubConfig(server.url, concurrency=3))
+        self.assertEqual(results[1], [])
+        self.assertEqual(results[0][0]["file"], "chunk-0")
+        self.assertEqual(results[2][0]["file"], "chunk-2")
+
+    def test_chunks_from_a_generator_are_pulled_lazily(self):
+        pulled = []
+        pulled_at_request = []
+
+        def chunks():
+            for i in range(10):
+                pulled.append(i)
+                yield f"chunk-{i}"
+
+        def respond(payload):
+            pulled_at_request.append(len(pulled))
+            return echo_chunk(payload)
+
+        with StubLLMServer(delay=0.05, respond=respond) as server:
+            results = review_chunks(chunks(), StubConfig(server.url, concurrency=2))
+            self.assertLessEqual(server.max_in_flight, 2)
+        self.assertEqual([r[0]["file"] for r in results], [f"chunk-{i}" for i in range(10)])
+        # A chunk is taken only when a worker is free
+        self.assertLessEqual(min(pulled_at_request), 2)
+
+    @patch("main.review_chunk")
+    def test_chunks_are_pulled_only_for_a_free_worker(self, mock_review):
+        lock = threading.Lock()
+        running = {"now": 0}
+        busy_at_pull = []
+
+        def review(chunk, *args):
+            with lock:
+                running["now"] += 1
+            time.sleep(0.01 * (chunk % 3 + 1))
+            with lock:
+                running["now"] -= 1
+            return [chunk]
+        mock_review.side_effect = review
+
+        def chunks():
+            for i in range(12):
+                with lock:
+                    busy_at_pull.append(running["now"])
+                yield i
+
+        results = review_chunks(chunks(), StubConfig("unused", concurrency=3))
+        self.assertEqual(results, [[i] for i in range(12)])
+        self.assertLessEqual(max(busy_at_pull), 2)
+
+    @patch("main.query_llm")
+    def test_unexpected_exception_is_isolated(self, mock_query):
+        def query(chunk, config, cache=None):
+            if chunk == "boom":
+                raise RuntimeError("unexpected")
+            return {"content": json.dumps({"comments": [{"file": chunk}]})}
+        mock_query.side_effect = query
+
+        results = review_chunks(["a", "boom", "b"], StubConfig("unused", concurrency=2))
+        self.assertEqual(results, [[{"file": "a"}], [], [{"file": "b"}]])
+
+
+class TestRunReview(unittest.TestCase):
+
+    def run_review(self, diff_lines):
+        def respond(payload):
+            return json.dumps({"comments": [{"file": "app.py", "line": "2", "comment": "Prints a secret."}]})
+
+        published = []
+        with StubLLMServer(respond=respond) as server:
+            class ReviewConfig(Config):
+                LLM_ENDPOINT = server.url
+                LLM_ENDPOINTS = ""
+                LLM_PROMPT_FORMAT = "single"
+                LLM_STREAM = False
+                INCREMENTAL_REVIEW = False
+                DEDUP_COMMENTS = False
+                REVIEW_CACHE_DIR = ""
+                CHECKPOINT_DIR = ""
+                REVIEW_TIME_BUDGET = 0
+                REVIEW_TOKEN_BUDGET = 0
+                SEMANTIC_CHUNKING = False
+                EXCLUDE_PATTERNS = []
+                INCLUDE_PATTERNS = []
+
+            def post(comments, **kwargs):
+                published.append((comments, kwargs["diff_incomplete"]))
+                return True
+
+            with patch("main.iter_diff_lines", side_effect=diff_lines), \
+                 patch("main.post_comments", side_effect=post):
+                metrics = RunMetrics()
+                run_review(ReviewConfig, metrics)
+        return published, metrics
+
+    def test_stages_are_timed_separately(self):
+        published, metrics = self.run_review(lambda config: iter(DIFF.splitlines()))
+        stages = metrics.report()["stages"]
+        for name in ("fetch", "parse", "filter", "preprocess", "split", "review", "publish"):
+            self.assertIn(name, stages)
+        self.assertEqual((stages["fetch"]["items"], stages["parse"]["items"], stages["split"]["items"]), (12, 2, 1))
+        self.assertEqual(published[0][1], False)
+
+    def test_diff_error_keeps_the_files_already_read(self):
+        def diff_lines(config):
+            yield from DIFF.splitlines()[:6]
+            raise ConnectionError("connection reset")
+
+        with self.assertLogs(level="ERROR") as logs:
+            published, metrics = self.run_review(diff_lines)
+        self.assertIn("Error retrieving the diff: connection reset", logs.output[0])
+        self.assertEqual(metrics.counters["diff_error"], "connection reset")
+        self.assertEqual(metrics.counters["reviewed_files"], 1)
+        comments, diff_incomplete = published[0]
+        self.assertEqual([c["file"] for c in comments], ["app.py"])
+        self.assertTrue(diff_incomplete)
+
+
+if __name__ == "__main__":
+    unittest.main()
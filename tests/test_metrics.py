@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from metrics import RunMetrics, extract_token_counts
+from main import review_chunks
+
+class StubConfig:
+    LLM_ENDPOINT = "unused"
+    LLM_MAX_CONCURRENCY = 2
+
+class TestRunMetrics(unittest.TestCase):
+
+    def test_stage_records_time_and_fields(self):
+        metrics = RunMetrics()
+        with metrics.stage("fetch_diff", source="api") as stage:
+            time.sleep(0.01)
+            stage["bytes"] = 42
+        record = metrics.report()["stages"]["fetch_diff"]
+        self.assertEqual((record["source"], record["bytes"]), ("api", 42))
+        self.assertGreaterEqual(record["seconds"], 0.01)
+
+    def test_extract_token_counts(self):
+        self.assertEqual(extract_token_counts({"tokens_evaluated": 10, "tokens_predicted": 5}), (10, 5))
+        self.assertEqual(extract_token_counts({"timings": {"prompt_n": 7, "predicted_n": 3}}), (7, 3))
+        self.assertEqual(extract_token_counts({"usage": {"prompt_tokens": 4, "completion_tokens": 2}}), (4, 2))
+        self.assertEqual(extract_token_counts({"content": "x"}), (None, None))
+        self.assertEqual(extract_token_counts(None), (None, None))
+
+    @patch("main.query_llm")
+    def test_llm_calls_are_recorded(self, mock_query):
+        def query(chunk, config, cache=None):
+            if chunk == "bad":
+                return None
+            return {"content": json.dumps({"comments": [{"file": chunk}]}),
+                    "tokens_evaluated": 100, "tokens_predicted": 20}
+        mock_query.side_effect = query
+
+        metrics = RunMetrics()
+        review_chunks(["a", "bad", "b"], StubConfig, metrics=metrics)
+        llm = metrics.report()["llm"]
+        self.assertEqual((llm["calls"], llm["errors"]), (3, 1))
+        self.assertEqual((llm["prompt_tokens"], llm["completion_tokens"]), (200, 40))
+        self.assertEqual([c["chunk"] for c in metrics.report()["llm_calls"]], [0, 1, 2])
+
+    def test_json_report_and_step_summary(self):
+        metrics = RunMetrics()
+        with metrics.stage("publish", comments=3):
+            pass
+        metrics.set("http_retries", 2)
+        metrics.finish()
+        with tempfile.TemporaryDirectory() as directory:
+            report_path = os.path.join(directory, "report.json")
+            summary_path = os.path.join(directory, "summary.md")
+            metrics.write_json(report_path)
+            metrics.write_step_summary(summary_path)
+            with open(report_path) as f:
+                report = json.load(f)
+            with open(summary_path) as f:
+                summary = f.read()
+        self.assertEqual(report["counters"]["http_retries"], 2)
+        self.assertIn("| publish |", summary)
+        self.assertIn("| http_retries | 2 |", summary)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+
+from diff_extractor import filter_diff
+from diff_index import DiffIndex, iter_file_diffs
+from path_filter import PathFilter, compile_patterns
+
+def file_block(path, added, new_start=1):
+    lines = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}",
+             f"@@ -{new_start},0 +{new_start},{len(added)} @@"]
+    lines.extend("+" + line for line in added)
+    return "\n".join(lines)
+
+class TestPatterns(unittest.TestCase):
+
+    def matches(self, pattern, path):
+        return compile_patterns([pattern]).search(path) is not None
+
+    def test_bare_words_match_whole_words(self):
+        self.assertTrue(self.matches("test", "test/example.py"))
+        self.assertTrue(self.matches("test", "src/test_utils.py"))
+        self.assertTrue(self.matches("spec", "web/app.spec.js"))
+        self.assertTrue(self.matches("new_name", "new_name.py"))
+        self.assertFalse(self.matches("test", "src/latest_config.py"))
+        self.assertFalse(self.matches("spec", "src/inspector.py"))
+
+    def test_globs(self):
+        self.assertTrue(self.matches("*.md", "docs/guide/intro.md"))
+        self.assertFalse(self.matches("*.md", "docs/guide.mdx"))
+        self.assertTrue(self.matches("docs/*.md", "docs/intro.md"))
+        self.assertFalse(self.matches("docs/*.md", "src/docs/intro.md"))
+        self.assertFalse(self.matches("docs/*.md", "docs/guide/intro.md"))
+        self.assertTrue(self.matches("docs/**/*.md", "docs/guide/intro.md"))
+        self.assertTrue(self.matches("build/", "pkg/build/out.js"))
+        self.assertFalse(self.matches("build/", "pkg/build"))
+        self.assertTrue(self.matches("/setup.py", "setup.py"))
+        self.assertFalse(self.matches("/setup.py", "lib/setup.py"))
+        self.assertTrue(self.matches("re:\\.sql$", "db/schema.sql"))
+
+class TestPathFilter(unittest.TestCase):
+
+    def test_generated_files_are_detected_by_path(self):
+        path_filter = PathFilter()
+        self.assertEqual(path_filter.path_reason("package-lock.json"), "lockfile")
+        self.assertEqual(path_filter.path_reason("web/yarn.lock"), "lockfile")
+        self.assertEqual(path_filter.path_reason("vendor/github.com/x/y.go"), "vendored")
+        self.assertEqual(path_filter.path_reason("static/app.min.js"), "minified")
+        self.assertEqual(path_filter.path_reason("proto/api_pb2.py"), "generated")
+        self.assertIsNone(path_filter.path_reason("src/vendors.py"))
+        self.assertIsNone(PathFilter(skip_generated=False).path_reason("yarn.lock"))
+
+    def test_generated_files_are_detected_by_content(self):
+        path_filter = PathFilter()
+        generated = DiffIndex.parse(file_block("src/schema.py", ["# @generated by tool", "x = 1"]))
+        minified = DiffIndex.parse(file_block("static/app.js", ["var a=1;" * 200]))
+        regular = DiffIndex.parse(file_block("src/app.py", ["x = 1"] * 10, new_start=40))
+        self.assertEqual(path_filter.reason(generated.files[0]), "generated")
+        self.assertEqual(path_filter.reason(minified.files[0]), "minified")
+        self.assertIsNone(path_filter.reason(regular.files[0]))
+
+    def test_only_generator_banners_mark_generated_files(self):
+        path_filter = PathFilter()
+        banners = [
+            "// Code generated by protoc-gen-go. DO NOT EDIT.",
+            "// <auto-generated />",
+            "# Generated by the protocol buffer compiler.  DO NOT EDIT!",
+        ]
+        handwritten = ["# Do not edit without review", "# Generated by hand from the spec", "// autogenerated ids below"]
+        for header in banners:
+            index = DiffIndex.parse(file_block("src/gen.go", [header, "x = 1"]))
+            self.assertEqual(path_filter.reason(index.files[0]), "generated", header)
+        for header in handwritten:
+            index = DiffIndex.parse(file_block("src/app.py", [header, "x = 1"]))
+            self.assertIsNone(path_filter.reason(index.files[0]), header)
+
+    def test_skipped_files_are_logged(self):
+        path_filter = PathFilter()
+        generated = DiffIndex.parse(file_block("src/schema.py", ["# @generated", "x = 1"]))
+        with self.assertLogs(level="INFO") as logs:
+            self.assertFalse(path_filter.keep(generated.files[0]))
+        self.assertIn("Skipping src/schema.py (generated).", logs.output[0])
+
+    def test_include_wins(self):
+        path_filter = PathFilter(exclude=["tests", "!tests/integration/**"], include=["yarn.lock"])
+        self.assertEqual(path_filter.path_reason("tests/unit/a.py"), "excluded")
+        self.assertIsNone(path_filter.path_reason("tests/integration/a.py"))
+        self.assertIsNone(path_filter.path_reason("yarn.lock"))
+
+    def test_skipped_files_are_not_parsed(self):
+        diff = "\n".join([
+            file_block("src/app.py", ["x = 1"]),
+            file_block("package-lock.json", ['"a": 1'] * 1000),
+            file_block("tests/test_app.py", ["assert True"]),
+        ])
+        path_filter = PathFilter(exclude=["tests"])
+        files = list(iter_file_diffs(diff.splitlines(), skip=path_filter.skips_path))
+        self.assertEqual([f.path for f in files], ["src/app.py"])
+        self.assertEqual(path_filter.skipped, {"lockfile": 1, "excluded": 1})
+
+    def test_filter_diff_keeps_latest_config(self):
+        diff = "\n".join([file_block("src/latest_config.py", ["x = 1"]), file_block("test/a.py", ["y = 2"])])
+        filtered = filter_diff(diff, exclude_patterns=["test"])
+        self.assertIn("src/latest_config.py", filtered)
+        self.assertNotIn("test/a.py", filtered)
+
+
+if __name__ == "__main__":
+    unittest.main()
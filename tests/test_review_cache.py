@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from review_cache import ReviewCache
+from llm_client import query_llm
+
+class DummyConfig:
+    LLM_ENDPOINT = "http://localhost:8080/predict"
+
+class TestReviewCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_put_then_get(self):
+        cache = ReviewCache(self.directory)
+        key = cache.make_key("prompt", {"temperature": 0.7}, "http://llm")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {"content": "{}"})
+        self.assertEqual(cache.get(key), {"content": "{}"})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_key_depends_on_params_and_endpoint(self):
+        base = ReviewCache.make_key("prompt", {"temperature": 0.7}, "http://a")
+        self.assertEqual(base, ReviewCache.make_key("prompt", {"temperature": 0.7}, "http://a"))
+        self.assertNotEqual(base, ReviewCache.make_key("prompt", {"temperature": 0.1}, "http://a"))
+        self.assertNotEqual(base, ReviewCache.make_key("prompt", {"temperature": 0.7}, "http://b"))
+        self.assertNotEqual(base, ReviewCache.make_key("prompt2", {"temperature": 0.7}, "http://a"))
+
+    def test_expired_entries_are_ignored(self):
+        cache = ReviewCache(self.directory, max_age=60)
+        cache.put("ab" * 32, {"content": "old"})
+        old = time.time() - 120
+        os.utime(cache._path("ab" * 32), (old, old))
+        self.assertIsNone(cache.get("ab" * 32))
+
+    def test_evict_drops_least_recently_used(self):
+        cache = ReviewCache(self.directory, max_bytes=250)
+        keys = [f"{i:02d}" * 32 for i in range(5)]
+        for age, key in enumerate(reversed(keys)):
+            cache.put(key, {"content": "x" * 80})
+            stamp = time.time() - 10 * age
+            os.utime(cache._path(key), (stamp, stamp))
+        self.assertEqual(cache.evict(), 3)
+        # The two most recently written entries survive
+        self.assertIsNotNone(cache.get(keys[4]))
+        self.assertIsNotNone(cache.get(keys[3]))
+        self.assertIsNone(cache.get(keys[0]))
+
+    @patch("llm_client.get_http_client")
+    def test_query_llm_uses_cache(self, mock_client):
+        fake_response = {"content": '{"comments": []}'}
+        mock_post = mock_client.return_value.post
+        mock_post.return_value = MagicMock(status_code=200, json=lambda: fake_response)
+        cache = ReviewCache(self.directory)
+
+        self.assertEqual(query_llm("diff chunk", DummyConfig(), cache=cache), fake_response)
+        self.assertEqual(query_llm("diff chunk", DummyConfig(), cache=cache), fake_response)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        query_llm("another chunk", DummyConfig(), cache=cache)
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch("llm_client.get_http_client")
+    def test_cache_is_keyed_by_the_endpoint_pool(self, mock_client):
+        mock_post = mock_client.return_value.post
+        mock_post.return_value = MagicMock(status_code=200, json=lambda: {"content": '{"comments": []}'})
+        cache = ReviewCache(self.directory)
+
+        class PoolConfig(DummyConfig):
+            LLM_ENDPOINTS = "http://gpu-1/predict|2,http://gpu-2/predict"
+
+        class ReweightedConfig(DummyConfig):
+            LLM_ENDPOINTS = "http://gpu-2/predict,http://gpu-1/predict|5"
+
+        class OtherPoolConfig(DummyConfig):
+            LLM_ENDPOINTS = "http://gpu-1/predict,http://gpu-3/predict"
+
+        for config in (PoolConfig, ReweightedConfig, OtherPoolConfig, DummyConfig):
+            query_llm("diff chunk", config(), cache=cache)
+        # The pool is not LLM_ENDPOINT, and only a change of its servers misses the cache
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from comment_publisher_github import publish_review_with_suggestions, split_review
+from diff_index import DiffIndex
+
+DIFF = "\n".join(
+    ["diff --git a/a.py b/a.py", "--- a/a.py", "+++ b/a.py", "@@ -0,0 +1,10 @@"]
+    + [f"+line {i}" for i in range(10)]
+)
+
+class DummyConfig:
+    GITHUB_TOKEN = "token"
+    GITHUB_API_URL = "https://api.github.com"
+    REVIEW_MAX_COMMENTS = 4
+    REVIEW_MAX_BYTES = 60000
+    REVIEW_POST_INTERVAL = 0
+    REVIEW_POST_RETRIES = 2
+
+def response(status=200, json=None):
+    resp = MagicMock()
+    resp.status_code = status
+    resp.headers = {}
+    resp.links = {}
+    resp.json.return_value = json if json is not None else []
+    if status >= 400:
+        resp.raise_for_status.side_effect = requests.exceptions.HTTPError(response=resp)
+    return resp
+
+def comments(count):
+    return [{"file": "a.py", "line": str(i % 10 + 1), "comment": f"Remark {i}"} for i in range(count)]
+
+class TestSplitReview(unittest.TestCase):
+
+    def test_limits(self):
+        entries = [{"row": "x" * 100 + "\n", "comment": {"body": "y" * 100}} for _ in range(10)]
+        self.assertEqual([len(p) for p in split_review(entries, max_comments=4)], [4, 4, 2])
+        self.assertEqual([len(p) for p in split_review(entries, max_bytes=700, reserved=100)], [2] * 5)
+        # An entry larger than the limit still gets its own part
+        self.assertEqual([len(p) for p in split_review(entries, max_bytes=50)], [1] * 10)
+        self.assertEqual(split_review([]), [[]])
+
+@patch.dict(os.environ, {"REPOSITORY_GITHUB": "owner/repo", "PR_NUMBER_GITHUB": "1"})
+@patch("comment_publisher_github.get_http_client")
+class TestPublishInParts(unittest.TestCase):
+
+    def publish(self, count=10):
+        return publish_review_with_suggestions(
+            comments(count), DummyConfig, diff_index=DiffIndex.parse(DIFF), head_sha="cafebabe",
+        )
+
+    def test_parts_and_marker_on_last(self, mock_client):
+        mock_client.return_value.post.return_value = response()
+        self.assertTrue(self.publish())
+        payloads = [c.kwargs["json"] for c in mock_client.return_value.post.call_args_list]
+        self.assertEqual([len(p["comments"]) for p in payloads], [4, 4, 2])
+        self.assertIn("Posted in 3 parts", payloads[0]["body"])
+        self.assertIn("(part 3/3)", payloads[2]["body"])
+        self.assertEqual(["reviewed-sha" in p["body"] for p in payloads], [False, False, True])
+
+    def test_retries_only_the_failed_part(self, mock_client):
+        mock_client.return_value.post.side_effect = [response(), response(502), response(), response()]
+        mock_client.return_value.get.return_value = response()
+        self.assertTrue(self.publish())
+        # The PR is checked for the failed part before it is posted again
+        self.assertEqual(mock_client.return_value.get.call_count, 1)
+        bodies = [c.kwargs["json"]["body"] for c in mock_client.return_value.post.call_args_list]
+        self.assertEqual(len(bodies), 4)
+        self.assertIn("(part 2/3)", bodies[1])
+        self.assertEqual(bodies[1], bodies[2])
+        self.assertIn("reviewed-sha", bodies[3])
+
+    def test_part_created_despite_the_error_is_not_posted_again(self, mock_client):
+        posted = []
+
+        def post(url, json, **kwargs):
+            posted.append(json["body"])
+            return response(504 if len(posted) == 2 else 200)
+
+        mock_client.return_value.post.side_effect = post
+        mock_client.return_value.get.side_effect = lambda *a, **k: response(json=[{"body": b} for b in posted])
+        self.assertTrue(self.publish())
+        self.assertEqual(len(posted), 3)
+        self.assertEqual(mock_client.return_value.post.call_args_list[0].kwargs["idempotent"], False)
+
+    def test_parts_are_not_reposted_when_reviews_cannot_be_listed(self, mock_client):
+        mock_client.return_value.post.side_effect = [response(), response(502), response()]
+        mock_client.return_value.get.return_value = response(500)
+        self.assertFalse(self.publish())
+        bodies = [c.kwargs["json"]["body"] for c in mock_client.return_value.post.call_args_list]
+        self.assertEqual(len(bodies), 3)
+        self.assertIn("(part 3/3)", bodies[2])
+        self.assertNotIn("reviewed-sha", bodies[2])
+
+    def test_rejected_part_is_not_retried_and_no_marker(self, mock_client):
+        mock_client.return_value.post.side_effect = [response(422), response(), response()]
+        self.assertFalse(self.publish())
+        bodies = [c.kwargs["json"]["body"] for c in mock_client.return_value.post.call_args_list]
+        self.assertEqual(len(bodies), 3)
+        self.assertNotIn("reviewed-sha", bodies[2])
+
+    def test_review_without_suggestions_records_the_head_sha(self, mock_client):
+        mock_client.return_value.post.return_value = response()
+        self.assertTrue(self.publish(count=0))
+        body = mock_client.return_value.post.call_args.kwargs["json"]["body"]
+        self.assertIn("No suggestions", body)
+        self.assertIn("reviewed-sha=cafebabe", body)
+
+        class QuietConfig(DummyConfig):
+            EMPTY_REVIEW = "marker"
+
+        publish_review_with_suggestions([], QuietConfig, diff_index=DiffIndex.parse(DIFF), head_sha="cafebabe")
+        body = mock_client.return_value.post.call_args.kwargs["json"]["body"]
+        self.assertNotIn("Summary", body)
+        self.assertIn("reviewed-sha=cafebabe", body)
+
+    def test_placements_resolved_earlier_are_reused(self, mock_client):
+        mock_client.return_value.post.return_value = response()
+        resolved = {("a.py", "3"): {"line": 3, "position": 99}}
+        publish_review_with_suggestions(comments(4)[2:], DummyConfig, diff_index=DiffIndex.parse(DIFF),
+                                        head_sha="cafebabe", resolved=resolved)
+        posted = mock_client.return_value.post.call_args.kwargs["json"]["comments"]
+        self.assertEqual([c["position"] for c in posted], [99, 4])
+
+    def test_incomplete_diff_is_noted_without_marker(self, mock_client):
+        mock_client.return_value.post.return_value = response()
+        publish_review_with_suggestions(comments(2), DummyConfig, diff_index=DiffIndex.parse(DIFF),
+                                        head_sha="cafebabe", diff_incomplete=True)
+        body = mock_client.return_value.post.call_args.kwargs["json"]["body"]
+        self.assertIn("could not be read in full", body)
+        self.assertNotIn("reviewed-sha", body)
+
+    def test_line_ranges_become_multi_line_comments(self, mock_client):
+        mock_client.return_value.post.return_value = response()
+        publish_review_with_suggestions(
+            [{"file": "a.py", "line": "3-5", "comment": "Range"}, {"file": "a.py", "line": "12", "comment": "Snapped"}],
+            DummyConfig, diff_index=DiffIndex.parse(DIFF),
+        )
+        posted = mock_client.return_value.post.call_args.kwargs["json"]["comments"]
+        self.assertEqual(posted[0], {"path": "a.py", "start_line": 3, "start_side": "RIGHT",
+                                     "line": 5, "side": "RIGHT", "body": "Range"})
+        self.assertEqual(posted[1], {"path": "a.py", "position": 10, "body": "Snapped"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from comment_publisher_github import publish_review_with_suggestions
+from diff_index import DiffIndex
+from main import review_chunks
+from scheduler import ReviewBudget, chunk_files, file_priority, parse_path_weights, rank_files
+
+def file_block(path, added, context=0):
+    lines = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}",
+             f"@@ -1,{context} +1,{added + context} @@"]
+    lines += [f" same {i}" for i in range(context)]
+    lines += [f"+line {i}" for i in range(added)]
+    return "\n".join(lines)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class DummyConfig:
+    GITHUB_TOKEN = "token"
+    GITHUB_API_URL = "https://api.github.com"
+    LLM_ENDPOINT = "unused"
+    LLM_MAX_CONCURRENCY = 1
+    LLM_PROMPT_FORMAT = "single"
+
+class TestPriority(unittest.TestCase):
+
+    def test_ranking(self):
+        index = DiffIndex.parse("\n".join([
+            file_block("docs/guide.md", 40),
+            file_block("src/sparse.py", 10, context=40),
+            file_block("src/core.py", 40),
+            file_block("src/empty.py", 0, context=3),
+        ]))
+        ranked = [f.path for f in rank_files(index)]
+        self.assertEqual(ranked, ["src/core.py", "src/sparse.py", "docs/guide.md", "src/empty.py"])
+        self.assertEqual(file_priority(index.get("src/empty.py")), 0.0)
+
+    def test_path_rules_and_churn(self):
+        index = DiffIndex.parse("\n".join([file_block("src/a.py", 10), file_block("src/b.py", 10)]))
+        weights = parse_path_weights(["src/b.py=2", "not a rule"])
+        self.assertEqual([f.path for f in rank_files(index, weights)], ["src/b.py", "src/a.py"])
+        self.assertEqual([f.path for f in rank_files(index, churn={"src/b.py": 12})], ["src/b.py", "src/a.py"])
+
+class TestReviewBudget(unittest.TestCase):
+
+    def test_token_budget_records_skipped_files(self):
+        chunks = [file_block(f"f{i}.py", 10) for i in range(5)]
+        budget = ReviewBudget(tokens=100, overhead_tokens=10)
+        admitted = list(budget.admit(chunks))
+        self.assertEqual(len(admitted), 2)
+        self.assertEqual(budget.exhausted, "tokens")
+        self.assertEqual(budget.skipped_files, ["f2.py", "f3.py", "f4.py"])
+
+    def test_time_budget_stops_admitting(self):
+        clock = FakeClock()
+        budget = ReviewBudget(seconds=10, clock=clock)
+        chunks = [file_block(f"f{i}.py", 1) for i in range(4)]
+        admitted = []
+        for chunk in budget.admit(chunks):
+            admitted.append(chunk_files(chunk)[0])
+            clock.now += 6
+        self.assertEqual(admitted, ["f0.py", "f1.py"])
+        self.assertEqual(budget.exhausted, "time")
+        self.assertEqual(budget.skipped_files, ["f2.py", "f3.py"])
+
+    def test_review_chunks_stops_with_the_budget(self):
+        budget = ReviewBudget(tokens=100, overhead_tokens=10)
+        chunks = [file_block(f"f{i}.py", 10) for i in range(4)]
+
+        def query(chunk, config, cache=None):
+            return {"content": json.dumps({"comments": [{"file": chunk_files(chunk)[0]}]})}
+
+        with patch("main.query_llm", side_effect=query):
+            results = review_chunks(budget.admit(chunks), DummyConfig, max_workers=2)
+        self.assertEqual([r[0]["file"] for r in results], ["f0.py", "f1.py"])
+        self.assertEqual(budget.skipped_files, ["f2.py", "f3.py"])
+
+    def test_unlimited(self):
+        budget = ReviewBudget()
+        self.assertFalse(budget.limited)
+        self.assertEqual(len(list(budget.admit(["a"] * 100))), 100)
+
+class TestSkippedFilesNote(unittest.TestCase):
+
+    @patch.dict(os.environ, {"REPOSITORY_GITHUB": "owner/repo", "PR_NUMBER_GITHUB": "1"})
+    @patch("comment_publisher_github.get_http_client")
+    def test_summary_lists_skipped_files_without_marker(self, mock_client):
+        diff = file_block("src/a.py", 3)
+        publish_review_with_suggestions(
+            [{"file": "src/a.py", "line": "2", "comment": "ok"}], DummyConfig,
+            diff_index=DiffIndex.parse(diff), head_sha="cafebabe", skipped_files=["src/b.py", "src/c.py"],
+        )
+        body = mock_client.return_value.post.call_args.kwargs["json"]["body"]
+        self.assertIn("2 files were not reviewed", body)
+        self.assertIn("`src/c.py`", body)
+        self.assertNotIn("reviewed-sha", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from diff_index import DiffIndex, iter_file_diffs
+from file_cache import FileContentCache, TextLines
+from semantic_chunks import (
+    added_spans, brace_ranges, drop_context_comments, expand_hunks, indent_ranges, iter_expanded, python_ranges,
+)
+
+SOURCE = "\n".join([
+    "import os",                   # 1
+    "",                            # 2
+    "def alpha(x):",               # 3
+    "    y = x + 1",               # 4
+    "    return y",                # 5
+    "",                            # 6
+    "",                            # 7
+    "class Beta:",                 # 8
+    "    @property",               # 9
+    "    def size(self):",         # 10
+    "        total = 0",           # 11
+    "        for item in self:",   # 12
+    "            total += 1",      # 13
+    "        return total",        # 14
+    "",                            # 15
+    "    def name(self):",         # 16
+    "        return 'beta'",       # 17
+])
+
+DIFF = "\n".join([
+    "diff --git a/app.py b/app.py",
+    "--- a/app.py",
+    "+++ b/app.py",
+    "@@ -4,1 +4,1 @@ def alpha(x):",
+    "-    y = x",
+    "+    y = x + 1",
+    "@@ -11,1 +11,1 @@ class Beta:",
+    "-        total = 1",
+    "+        total = 0",
+    "@@ -13,2 +13,2 @@ class Beta:",
+    "-            total += 2",
+    "-        return total - 1",
+    "+            total += 1",
+    "+        return total",
+])
+
+class TestDefinitionRanges(unittest.TestCase):
+
+    def test_python_definitions_include_decorators(self):
+        self.assertEqual(sorted(python_ranges(SOURCE)), [(3, 5), (8, 17), (9, 14), (16, 17)])
+        self.assertIsNone(python_ranges("def broken(:\n"))
+
+    def test_brace_blocks(self):
+        lines = [
+            "int f(int a)",   # 1
+            "{",              # 2
+            "  if (a) {",     # 3
+            "    a++; // }",  # 4
+            "  }",            # 5
+            "}",              # 6
+            "char *s = \"{\";",  # 7
+        ]
+        self.assertEqual(sorted(brace_ranges(lines)), [(1, 6), (3, 5)])
+
+    def test_indentation_blocks(self):
+        lines = ["build:", "  steps:", "    - run: make", "", "deploy:", "  when: manual"]
+        self.assertEqual(sorted(indent_ranges(lines)), [(1, 3), (2, 3), (5, 6)])
+
+class TestExpandHunks(unittest.TestCase):
+
+    def setUp(self):
+        self.index = DiffIndex.parse(DIFF)
+        self.file_diff = self.index.get("app.py")
+
+    def test_hunks_widen_to_their_definition_and_merge(self):
+        result, expanded, merged = expand_hunks(self.file_diff, SOURCE.splitlines())
+        self.assertEqual((expanded, merged), (3, 1))
+        alpha, size = result.hunks
+        self.assertEqual(alpha.header, "@@ -3,3 +3,3 @@ def alpha(x):")
+        self.assertEqual(alpha.lines, [" def alpha(x):", "-    y = x", "+    y = x + 1", "     return y"])
+        self.assertEqual(size.header, "@@ -9,6 +9,6 @@ class Beta:")
+        self.assertEqual(size.lines[:3], ["     @property", "     def size(self):", "-        total = 1"])
+        self.assertEqual(size.lines[-1], "+        return total")
+        # The file diff given to the LLM is a copy: the index and its positions are untouched
+        self.assertEqual(len(self.file_diff.hunks), 3)
+        self.assertEqual(result.position(11), self.index.position("app.py", 11))
+        self.assertEqual(result.position(14), self.index.position("app.py", 14))
+
+    def test_too_long_definitions_are_not_expanded(self):
+        result, expanded, merged = expand_hunks(self.file_diff, SOURCE.splitlines(), max_lines=2)
+        self.assertIs(result, self.file_diff)
+        self.assertEqual((expanded, merged), (0, 0))
+
+    def test_unavailable_files_pass_through(self):
+        stats = {}
+        file_diffs = list(iter_file_diffs(DIFF.splitlines()))
+        result = list(iter_expanded(file_diffs, lambda path: None, stats=stats))
+        self.assertIs(result[0], file_diffs[0])
+        result = list(iter_expanded(file_diffs, lambda path: TextLines(SOURCE), stats=stats))
+        self.assertEqual(len(result[0].hunks), 2)
+        self.assertEqual(stats, {"not_local": 1, "expanded": 3, "merged": 1})
+
+    def test_comments_on_added_context_are_dropped(self):
+        result, _, _ = expand_hunks(self.file_diff, SOURCE.splitlines())
+        spans = added_spans(self.file_diff, result)
+        self.assertEqual(spans, [(3, 3), (5, 5), (9, 10), (12, 12)])
+        comments = [
+            {"file": "app.py", "line": "4", "comment": "changed line"},
+            {"file": "app.py", "line": "10", "comment": "only in the added context"},
+            {"file": "app.py", "line": "11-12", "comment": "range ending in the added context"},
+            {"file": "app.py", "line": "40", "comment": "outside the definitions"},
+            {"file": "lib.py", "line": "3", "comment": "file not widened"},
+        ]
+        kept, dropped = drop_context_comments(comments, {"app.py": spans})
+        self.assertEqual(dropped, 1)
+        self.assertEqual([(c["line"], c["comment"]) for c in kept], [
+            ("4", "changed line"), ("11", "range ending in the added context"),
+            ("40", "outside the definitions"), ("3", "file not widened"),
+        ])
+
+class TestLocalLines(unittest.TestCase):
+
+    @patch("file_cache.fetch_file_from_github")
+    def test_local_lines_never_download(self, mock_fetch):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        with open(os.path.join(root, "app.py"), "w") as f:
+            f.write(SOURCE)
+        cache = FileContentCache(local_root=root)
+        self.assertEqual(cache.get_local_lines("app.py").slice(2, 3), ["def alpha(x):"])
+        self.assertIsNone(cache.get_local_lines("missing.py"))
+        self.assertIsNone(cache.get_local_lines("missing.py"))
+        mock_fetch.assert_not_called()
+        # get_lines still falls back to the API for the same file
+        mock_fetch.return_value = "downloaded\n"
+        self.assertEqual(cache.get_lines("missing.py").slice(0, 1), ["downloaded"])
+
+
+if __name__ == "__main__":
+    unittest.main()